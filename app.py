@@ -1,12 +1,23 @@
 import os
+import gzip
+import hmac
+import json
+import math
+import hashlib
+import time
 import logging
 import mimetypes
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for, abort, send_from_directory
+from flask import Flask, Response, render_template, request, flash, redirect, url_for, abort, send_file, send_from_directory, session
+from werkzeug.http import http_date, quote_etag
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
+from utils import metrics, signing
+from utils.assets import AssetManifest
+from utils.admission import AdmissionControl, AdmissionDenied, ConcurrencyLimit, TokenBuckets
+from utils.batch import stream_zip
 from utils.downloader import TikTokDownloader
-import tempfile
-import threading
-import time
+from utils.formats import BEST, LISTED_TIERS, parse_tier, select_format
+from utils.jobs import JobQueue, JobStore, QueueFull
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,27 +27,323 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 
+# Behind a load balancer, take the client address from X-Forwarded-For
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# Fingerprinted, precompressed copies of static/ (built once, in the
+# gunicorn master with preload_app) and the rendered index page, which
+# only changes on deploy
+assets = AssetManifest(app.static_folder, os.environ.get('ASSET_BUILD_DIR')).build()
+_index_page = None
+
 # Initialize TikTok downloader
 downloader = TikTokDownloader()
 
-def cleanup_old_files():
-    """Background task to cleanup old files"""
-    while True:
-        try:
-            downloader.cleanup_old_files(max_age_hours=1)  # Clean files older than 1 hour
-            time.sleep(3600)  # Run every hour
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {str(e)}")
-            time.sleep(3600)
+# Stream bytes to the client while the upstream download is in progress
+STREAM_DOWNLOADS = os.environ.get('STREAM_DOWNLOADS', 'true').lower() == 'true'
+
+# Quality tier when the client doesn't pick one; phones rarely need more
+# than 540p and it cuts egress several times over
+DEFAULT_QUALITY = os.environ.get('DEFAULT_QUALITY', 'best')
+MOBILE_DEFAULT_QUALITY = os.environ.get('MOBILE_DEFAULT_QUALITY', '540p')
+
+# Batch ZIP downloads. The archive is built inside one request, which a
+# sync worker must finish before gunicorn's timeout (120s) kills it, so
+# batches are small and stop adding videos after BATCH_DEADLINE seconds,
+# leaving the rest of the timeout to send the last entries
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 25))
+BATCH_DEADLINE = float(os.environ.get('BATCH_DEADLINE', 60))
+BATCH_PARALLELISM = int(os.environ.get('BATCH_PARALLELISM', 4))
+# Seconds each video in a batch waits for a global download slot
+BATCH_SLOT_WAIT = float(os.environ.get('BATCH_SLOT_WAIT', 30))
+
+# Admission control: per-client token buckets plus a cap on concurrent
+# downloads across all workers; set either limit to 0 to disable it.
+# Clients are told apart by address, which behind a load balancer is only
+# the visitor's with TRUSTED_PROXIES set; otherwise everyone would share
+# the proxy's bucket, so the rate limit is off unless configured
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 10 if TRUSTED_PROXIES else 0))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 5))
+MAX_INFLIGHT_DOWNLOADS = int(os.environ.get('MAX_INFLIGHT_DOWNLOADS', 8))
+admission = AdmissionControl(
+    TokenBuckets(
+        os.environ.get('ADMISSION_DB_PATH', os.path.join(downloader.media_cache.directory, 'admission.sqlite3')),
+        rate=RATE_LIMIT_PER_MINUTE / 60,
+        burst=RATE_LIMIT_BURST
+    ) if RATE_LIMIT_PER_MINUTE > 0 else None,
+    ConcurrencyLimit(
+        os.path.join(downloader.media_cache.directory, 'slots'), MAX_INFLIGHT_DOWNLOADS
+    ) if MAX_INFLIGHT_DOWNLOADS > 0 else None,
+    busy_retry_after=float(os.environ.get('BUSY_RETRY_AFTER', 5))
+)
+
+# Background download jobs for the async API; each job takes a global
+# download slot when it starts
+jobs = JobQueue(
+    downloader,
+    JobStore(os.environ.get('JOB_STORE_PATH', os.path.join(downloader.media_cache.directory, 'jobs.sqlite3'))),
+    workers=int(os.environ.get('JOB_WORKERS', 4)),
+    max_queued=int(os.environ.get('JOB_QUEUE_DEPTH', 32)),
+    limit=admission.limit
+)
+
+# Media links are signed and expire; long enough to finish and resume a
+# download, short enough that shared links stop working. Every link the
+# app hands out is signed, so unsigned /media requests are refused unless
+# this is turned off; /api/jobs/<id>/file is the stable URL for a job
+MEDIA_URL_TTL = int(os.environ.get('MEDIA_URL_TTL', 900))
+REQUIRE_SIGNED_MEDIA = os.environ.get('REQUIRE_SIGNED_MEDIA', 'true').lower() == 'true'
+
+# Bearer token for admin endpoints (cache invalidation); unset disables them
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Shared by the nodes of a cluster for /internal/media; unset disables it
+CLUSTER_SECRET = os.environ.get('CLUSTER_SECRET', '')
+
+_background_pid = None
+
+def start_background_tasks():
+    """
+    Start per-process background work (idempotent)
+    
+    Called from gunicorn's post_fork hook so nothing runs in the master
+    before fork; the before_request hook covers other servers.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    
+    # Index files left over from a previous run and start the cache reaper,
+    # which evicts by size and age so responses never delete files themselves
+    downloader.media_cache.reconcile(downloader.flight.is_held)
+    downloader.media_cache.start_reaper()
+
+@app.before_request
+def ensure_background_tasks():
+    """Start background tasks on the first request if no server hook did"""
+    start_background_tasks()
+
+def is_mobile_request():
+    """Check if request is from mobile device"""
+    user_agent = request.headers.get('User-Agent', '').lower()
+    return any(mobile in user_agent for mobile in [
+        'android', 'iphone', 'ipad', 'ipod', 'blackberry', 
+        'windows phone', 'mobile', 'mobi'
+    ])
+
+def requested_tier(value):
+    """
+    Quality tier for this request
+    
+    Returns the parsed ``value``, or the device default when it is empty,
+    or None when ``value`` is not a valid tier.
+    """
+    if value:
+        return parse_tier(value)
+    return parse_tier(MOBILE_DEFAULT_QUALITY if is_mobile_request() else DEFAULT_QUALITY) or BEST
 
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=cleanup_old_files, daemon=True)
-cleanup_thread.start()
+def client_address():
+    """Address admission control limits by"""
+    return request.remote_addr or 'unknown'
+
+def too_many_requests(denied, api=False):
+    """Fast 429 for a request turned away by admission control"""
+    retry_after = max(1, math.ceil(denied.retry_after))
+    metrics.ADMISSION_REJECTIONS.labels(denied.reason).inc()
+    logger.warning(f"{denied} (retry after {retry_after}s)")
+    
+    wait = f"{retry_after} second{'s' if retry_after != 1 else ''}"
+    if denied.reason == 'rate':
+        message = f'Too many downloads from your connection. Please try again in {wait}.'
+    else:
+        message = f'The server is busy right now. Please try again in {wait}.'
+    headers = {'Retry-After': str(retry_after)}
+    
+    if api:
+        return {'error': message, 'retry_after': retry_after}, 429, headers
+    flash(message, 'warning')
+    return render_template('index.html', retry_after=retry_after), 429, headers
+
+def signed_media_url(filename):
+    """Short-lived, signed URL that downloads a cached file directly"""
+    expires, sig = signing.sign(app.secret_key, filename, MEDIA_URL_TTL)
+    return url_for('media_file', filename=filename, expires=expires, sig=sig)
+
+def asset_url(filename):
+    """URL of a static asset: fingerprinted if it was built, plain /static otherwise"""
+    hashed = assets.hashed(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('asset_file', filename=hashed)
+
+@app.context_processor
+def template_helpers():
+    return {'asset_url': asset_url}
+
+def _limited_file_iter(f, length, chunk_size=64 * 1024):
+    """Read at most ``length`` bytes, for servers without wsgi.file_wrapper"""
+    try:
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+def _metered(chunks):
+    """Count streamed bytes towards the bytes-served metric"""
+    for chunk in chunks:
+        metrics.BYTES_SERVED.inc(len(chunk))
+        yield chunk
+
+def send_cached_file(filename):
+    """
+    Send a finished download from the media cache as an attachment
+    
+    Honours Range, If-Range and If-None-Match against a content-based ETag
+    so interrupted downloads can resume. The open file is handed to the
+    server's ``wsgi.file_wrapper`` (sendfile under gunicorn) positioned at
+    the start of the range, so bytes are never copied through Python.
+    
+    Returns None if the file is no longer in the cache.
+    """
+    # Detect MIME type for proper mobile handling
+    mime_type, _ = mimetypes.guess_type(filename)
+    if not mime_type:
+        # Default to mp4 video type for TikTok videos
+        mime_type = 'video/mp4'
+    
+    is_mobile = is_mobile_request()
+    logger.info(f"Serving file: {filename}, MIME: {mime_type}, Mobile: {is_mobile}")
+    
+    # Lease the file so the cache can't evict it mid-transfer
+    started = time.monotonic()
+    lease = downloader.media_cache.acquire(filename)
+    if lease is None:
+        return None
+    
+    try:
+        stat = os.fstat(lease.fileno())
+        size = stat.st_size
+        etag = downloader.media_cache.etag(filename)
+        
+        headers = {
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'private, max-age=3600',
+            'Last-Modified': http_date(stat.st_mtime),
+            'X-Content-Type-Options': 'nosniff',
+        }
+        if etag:
+            headers['ETag'] = quote_etag(etag)
+        
+        # Mobile-specific headers for better compatibility
+        if is_mobile:
+            headers['Content-Transfer-Encoding'] = 'binary'
+            headers['Content-Description'] = 'File Transfer'
+            
+            # Force download behavior on mobile browsers
+            headers['Content-Security-Policy'] = "default-src 'none'"
+        
+        if etag and etag in request.if_none_match:
+            lease.close()
+            return Response(status=304, headers=headers)
+        
+        # A Range only applies if the client still has the same content
+        byte_range = request.range
+        if byte_range and request.if_range.etag and request.if_range.etag != etag:
+            byte_range = None
+        if byte_range and request.if_range.date and request.if_range.date.timestamp() < int(stat.st_mtime):
+            byte_range = None
+        
+        status = 200
+        start, length = 0, size
+        if byte_range:
+            bounds = byte_range.range_for_length(size)
+            if bounds is None:
+                lease.close()
+                headers['Content-Range'] = f'bytes */{size}'
+                return Response(status=416, headers=headers)
+            start, stop = bounds
+            length = stop - start
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        
+        # Recorded when the server closes the file, i.e. after the transfer;
+        # sendfile doesn't report progress, so the whole range is counted
+        def record_transfer():
+            metrics.FILE_SERVE_SECONDS.observe(time.monotonic() - started)
+            metrics.BYTES_SERVED.inc(length)
+        lease.on_close = record_transfer
+        
+        lease.seek(start)
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            # The server sends Content-Length bytes from the current offset
+            body = file_wrapper(lease, 64 * 1024)
+        else:
+            body = _limited_file_iter(lease, length)
+        
+        response = Response(body, status=status, mimetype=mime_type, headers=headers, direct_passthrough=True)
+        response.content_length = length
+        
+        # The server closes the file, ending the lease, once the last
+        # byte has been sent (or the client went away)
+        return response
+    except Exception:
+        lease.close()
+        raise
 
 @app.route('/')
 def index():
     """Main page with download form"""
-    return render_template('index.html')
+    global _index_page
+    # Flashed messages are per visitor; so is anything in debug mode
+    if session.get('_flashes') or app.debug:
+        return render_template('index.html')
+    
+    if _index_page is None:
+        body = render_template('index.html').encode()
+        _index_page = (hashlib.sha256(body).hexdigest()[:16], body, gzip.compress(body, compresslevel=9, mtime=0))
+    etag, body, gzipped = _index_page
+    
+    # Each encoding is its own representation with its own ETag
+    if request.accept_encodings.quality('gzip') > 0:
+        etag, body = f'{etag}-gzip', gzipped
+        headers = {'Content-Encoding': 'gzip'}
+    else:
+        headers = {}
+    headers.update({'ETag': quote_etag(etag), 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'})
+    
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='text/html', headers=headers)
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    """Serve a fingerprinted asset, precompressed when the client accepts it"""
+    resolved = assets.resolve(filename, request.accept_encodings)
+    if resolved is None:
+        abort(404)
+    path, encoding = resolved
+    
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        etag=f"{filename}-{encoding or 'identity'}",
+        conditional=True
+    )
+    # The name changes whenever the content does
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
 
 @app.route('/download', methods=['POST'])
 def download_video():
@@ -54,91 +361,308 @@ def download_video():
             flash('Please enter a valid TikTok video URL', 'error')
             return redirect(url_for('index'))
         
-        logger.info(f"Download request for URL: {video_url}")
-        
-        # Download video
-        result = downloader.download_video(video_url)
-        
-        if not result['success']:
-            flash(f"Download failed: {result['error']}", 'error')
+        tier = requested_tier(request.form.get('quality', '').strip())
+        if tier is None:
+            flash('Please choose a valid video quality', 'error')
             return redirect(url_for('index'))
         
-        file_path = result['file_path']
-        filename = result['filename']
+        # Turn bursts away up front instead of starting yet another
+        # download; a cached video needs no download slot
+        cached = downloader.cached_file(video_url, tier)
+        try:
+            if cached:
+                admission.check_rate(client_address())
+                slot = None
+            else:
+                slot = admission.admit(client_address())
+        except AdmissionDenied as denied:
+            return too_many_requests(denied)
         
-        if not os.path.exists(file_path):
-            flash('Downloaded file not found', 'error')
-            return redirect(url_for('index'))
+        logger.info(f"Download request for URL: {video_url} (quality: {tier.key})")
         
-        # Detect MIME type for proper mobile handling
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if not mime_type:
-            # Default to mp4 video type for TikTok videos
-            mime_type = 'video/mp4'
-        
-        # Check if request is from mobile device
-        user_agent = request.headers.get('User-Agent', '').lower()
-        is_mobile = any(mobile in user_agent for mobile in [
-            'android', 'iphone', 'ipad', 'ipod', 'blackberry', 
-            'windows phone', 'mobile', 'mobi'
-        ])
-        
-        logger.info(f"Serving file: {filename}, MIME: {mime_type}, Mobile: {is_mobile}")
-        
-        # Create response with proper headers for mobile downloads
-        def generate_response():
-            try:
-                response = send_file(
-                    file_path,
-                    mimetype=mime_type,
-                    as_attachment=True,
-                    download_name=filename
-                )
-                
-                # Essential headers for all downloads
+        try:
+            # Download video, or stream it while it downloads
+            if cached:
+                result = cached
+            elif STREAM_DOWNLOADS:
+                result = downloader.stream_video(video_url, tier=tier)
+            else:
+                result = downloader.download_video(video_url, tier=tier)
+            
+            if not result['success']:
+                flash(f"Download failed: {result['error']}", 'error')
+                return redirect(url_for('index'))
+            
+            file_path = result['file_path']
+            filename = result['filename']
+            
+            if result.get('stream') is not None:
+                logger.info(f"Streaming in-progress download: {filename}")
+                mime_type = mimetypes.guess_type(filename)[0] or 'video/mp4'
+                response = Response(_metered(result['stream']), mimetype=mime_type)
                 response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-                response.headers['Content-Type'] = mime_type
                 response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                response.headers['Pragma'] = 'no-cache'
-                response.headers['Expires'] = '0'
-                
-                # Mobile-specific headers for better compatibility
-                if is_mobile:
-                    response.headers['Content-Transfer-Encoding'] = 'binary'
-                    response.headers['X-Content-Type-Options'] = 'nosniff'
-                    response.headers['Content-Description'] = 'File Transfer'
-                    response.headers['Accept-Ranges'] = 'bytes'
-                    
-                    # Force download behavior on mobile browsers
-                    response.headers['Content-Security-Policy'] = "default-src 'none'"
-                
-                # Schedule file cleanup after response
-                def cleanup_file():
-                    time.sleep(5)  # Wait 5 seconds before cleanup
-                    try:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            logger.info(f"Cleaned up file: {filename}")
-                    except Exception as e:
-                        logger.error(f"Error cleaning up file {filename}: {str(e)}")
-                
-                cleanup_thread = threading.Thread(target=cleanup_file, daemon=True)
-                cleanup_thread.start()
+                response.headers['X-Content-Type-Options'] = 'nosniff'
                 
+                # The download is still running; keep its slot until the
+                # stream ends
+                if slot is not None:
+                    response.call_on_close(slot.release)
+                    slot = None
                 return response
-                
-            except Exception as e:
-                logger.error(f"Error serving file: {str(e)}")
-                flash('Error serving download file', 'error')
+            
+            if not os.path.exists(file_path):
+                flash('Downloaded file not found', 'error')
                 return redirect(url_for('index'))
-        
-        return generate_response()
+            
+            # Hand off to the signed GET URL, which supports resuming
+            return redirect(signed_media_url(filename), code=303)
+        finally:
+            if slot is not None:
+                slot.release()
         
     except Exception as e:
         logger.error(f"Unexpected error in download: {str(e)}")
         flash('An unexpected error occurred. Please try again.', 'error')
         return redirect(url_for('index'))
 
+@app.route('/media/<filename>')
+def media_file(filename):
+    """Serve a cached video by its stable, id-based file name"""
+    if secure_filename(filename) != filename or not filename.startswith('tiktok_'):
+        abort(404)
+    
+    expires, sig = request.args.get('expires', ''), request.args.get('sig', '')
+    if expires or sig or REQUIRE_SIGNED_MEDIA:
+        problem = signing.verify(app.secret_key, filename, expires, sig)
+        if problem == 'expired':
+            flash('This download link has expired. Please submit the video again.', 'error')
+            return render_template('index.html'), 410
+        if problem:
+            flash('This download link is not valid. Please submit the video again.', 'error')
+            return render_template('index.html'), 403
+    
+    try:
+        response = send_cached_file(filename)
+    except Exception as e:
+        logger.error(f"Error serving file: {str(e)}")
+        flash('Error serving download file', 'error')
+        return redirect(url_for('index'))
+    
+    if response is None:
+        flash('This download has expired. Please submit the video again.', 'error')
+        return redirect(url_for('index'))
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a download and return its job id immediately"""
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    elif not isinstance(data, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    if any(not isinstance(data.get(name) or '', str) for name in ('video_url', 'url', 'quality')):
+        return {'error': 'video_url and quality must be strings'}, 400
+    video_url = (data.get('video_url') or data.get('url') or '').strip()
+    
+    if not video_url:
+        return {'error': 'Please enter a TikTok video URL'}, 400
+    if not downloader.is_valid_tiktok_url(video_url):
+        return {'error': 'Please enter a valid TikTok video URL'}, 400
+    tier = requested_tier((data.get('quality') or '').strip())
+    if tier is None:
+        return {'error': 'Invalid quality tier'}, 400
+    
+    # The job takes its download slot when it starts, so only the rate is checked here
+    try:
+        admission.check_rate(client_address())
+    except AdmissionDenied as denied:
+        return too_many_requests(denied, api=True)
+    
+    try:
+        job_id = jobs.submit(video_url, tier)
+    except QueueFull as e:
+        logger.warning(str(e))
+        return {'error': 'Server is busy. Please try again shortly.'}, 503, {'Retry-After': '10'}
+    
+    logger.info(f"Queued job {job_id} for URL: {video_url}")
+    return {
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('job_status', job_id=job_id),
+        'file_url': url_for('job_file', job_id=job_id),
+    }, 202, {'Location': url_for('job_status', job_id=job_id)}
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Report job status and download progress"""
+    job = jobs.store.get(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'downloaded_bytes': job['downloaded_bytes'],
+        'total_bytes': job['total_bytes'],
+        'error': job['error'],
+        'video_info': job['video_info'],
+        'file_url': url_for('job_file', job_id=job_id) if job['status'] == 'finished' else None,
+        'download_url': signed_media_url(job['filename']) if job['status'] == 'finished' else None,
+    }, 200, {'Cache-Control': 'no-store'}
+
+@app.route('/api/jobs/<job_id>/file')
+def job_file(job_id):
+    """Serve the file produced by a finished job"""
+    job = jobs.store.get(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    if job['status'] != 'finished':
+        return {'error': f"Job is {job['status']}", 'status': job['status']}, 409
+    
+    response = send_cached_file(job['filename'])
+    if response is None:
+        return {'error': 'File has expired. Please submit the video again.'}, 410
+    return response
+
+@app.route('/api/info')
+def video_info():
+    """Describe a video and the formats and quality tiers it can be downloaded in"""
+    video_url = request.args.get('url', '').strip()
+    if not video_url:
+        return {'error': 'Please enter a TikTok video URL'}, 400
+    if not downloader.is_valid_tiktok_url(video_url):
+        return {'error': 'Please enter a valid TikTok video URL'}, 400
+    
+    # A cache miss costs an extraction, so it counts against the rate limit
+    try:
+        admission.check_rate(client_address())
+    except AdmissionDenied as denied:
+        return too_many_requests(denied, api=True)
+    
+    info = downloader.extract_video_info(video_url)
+    if info is None:
+        return {'error': 'Could not extract video information'}, 502
+    
+    info = dict(info)
+    formats = info.pop('formats', None) or []
+    tiers = {}
+    for name in LISTED_TIERS:
+        chosen = select_format(formats, parse_tier(name))
+        tiers[name] = {
+            'format_id': chosen['format_id'] if chosen else None,
+            'height': chosen['height'] if chosen else None,
+            'filesize': chosen['filesize'] if chosen else None,
+        }
+    
+    return {
+        'video': info,
+        'formats': formats,
+        'tiers': tiers,
+        'default_quality': requested_tier('').key,
+    }, 200, {'Cache-Control': 'private, max-age=300'}
+
+@app.route('/api/batch', methods=['POST'])
+def batch_download():
+    """Download many videos and stream them back as a single ZIP"""
+    data = request.get_json(silent=True)
+    if data is None:
+        urls = request.form.get('urls', '').split()
+        quality = request.form.get('quality', '')
+    elif not isinstance(data, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    else:
+        urls = data.get('urls') or []
+        quality = data.get('quality') or ''
+        if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+            return {'error': 'urls must be a list of strings'}, 400
+        if not isinstance(quality, str):
+            return {'error': 'quality must be a string'}, 400
+    
+    # Keep the first occurrence of each URL, in order
+    urls = list(dict.fromkeys(u.strip() for u in urls if u.strip()))
+    
+    if not urls:
+        return {'error': 'Please enter at least one TikTok video URL'}, 400
+    if len(urls) > BATCH_MAX_URLS:
+        return {'error': f'Please submit at most {BATCH_MAX_URLS} URLs per batch'}, 400
+    tier = requested_tier(quality.strip())
+    if tier is None:
+        return {'error': 'Invalid quality tier'}, 400
+    
+    # A batch costs what its downloads would cost one by one; each of them
+    # takes a download slot inside stream_zip
+    try:
+        admission.check_rate(client_address(), cost=len(urls))
+    except AdmissionDenied as denied:
+        return too_many_requests(denied, api=True)
+    
+    logger.info(f"Batch request for {len(urls)} URLs")
+    
+    archive = stream_zip(downloader, urls, BATCH_PARALLELISM, tier, limit=admission.limit,
+                         slot_wait=BATCH_SLOT_WAIT, deadline=BATCH_DEADLINE)
+    response = Response(_metered(archive), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="tiktok_videos_{int(time.time())}.zip"'
+    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    return response
+
+@app.route('/api/cache', methods=['DELETE'])
+def invalidate_cache():
+    """Forget cached info and remembered failures for one video"""
+    if not ADMIN_TOKEN:
+        abort(404)
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return {'error': 'Unauthorized'}, 401
+    
+    target = (request.args.get('url') or request.args.get('id') or '').strip()
+    if not target:
+        return {'error': 'Please give a TikTok video URL or id'}, 400
+    
+    removed = downloader.invalidate(target)
+    logger.info(f"Invalidated {removed} cache entries for {target}")
+    return {'removed': removed}, 200
+
+@app.route('/internal/media')
+def internal_media():
+    """Produce a video this node owns for the node a client asked"""
+    if downloader.cluster is None or not CLUSTER_SECRET:
+        abort(404)
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token.encode(), CLUSTER_SECRET.encode()):
+        return {'error': 'Unauthorized'}, 401
+    
+    video_url = request.args.get('url', '').strip()
+    tier = parse_tier(request.args.get('quality', '')) or BEST
+    logger.info(f"Download for node {request.headers.get('X-Cluster-Node', '?')}: {video_url} (quality: {tier.key})")
+    
+    # Peers' downloads count against this node's capacity like its own.
+    # The node asking doesn't wait for a slot: any answer but 422 makes it
+    # fetch from TikTok itself
+    try:
+        slot = None if downloader.cached_file(video_url, tier) else admission.take_slot()
+    except AdmissionDenied as denied:
+        metrics.ADMISSION_REJECTIONS.labels(denied.reason).inc()
+        retry_after = str(max(1, math.ceil(denied.retry_after)))
+        return {'error': str(denied)}, 503, {'Retry-After': retry_after}
+    
+    try:
+        # local_only: the ring sent it here, so don't pass it on again
+        result = downloader.download_video(video_url, tier=tier, local_only=True)
+    finally:
+        if slot is not None:
+            slot.release()
+    if not result['success']:
+        return {'error': result['error']}, 422
+    
+    response = send_cached_file(result['filename'])
+    if response is None:
+        return {'error': 'File expired before it could be sent'}, 503
+    response.headers['X-Video-Info'] = json.dumps(result.get('video_info') or {})
+    return response
+
 @app.route('/robots.txt')
 def robots_txt():
     """Serve robots.txt for search engine crawlers"""
@@ -152,7 +676,24 @@ def sitemap_xml():
 @app.route('/health')
 def health_check():
     """Health check endpoint for deployment platforms"""
-    return {'status': 'healthy', 'service': 'tiktok-downloader'}, 200
+    return {
+        'status': 'healthy',
+        'service': 'tiktok-downloader',
+        'metadata_cache': downloader.metadata_cache.stats(),
+        'media_cache': downloader.media_cache.stats(),
+        'jobs': jobs.stats(),
+        'admission': admission.stats(),
+        'upstream': downloader.upstream.stats(),
+        'engine': downloader.engine.stats() if downloader.engine else None,
+        'storage': downloader.storage.stats() if downloader.storage else None,
+        'cluster': downloader.cluster.stats() if downloader.cluster else None,
+    }, 200
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics, aggregated across all worker processes"""
+    body, content_type = metrics.render(downloader.media_cache)
+    return Response(body, content_type=content_type)
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Compare running yt-dlp in the web workers with the process-pool engine
+
+Runs the gunicorn load test (see bench_load.py) twice with the same
+workload, once per ``EXTRACTION_ENGINE`` mode, and prints throughput,
+latency and resident memory side by side. The defaults make extraction
+CPU-bound and leaky, the way yt-dlp is on real pages: in-process, each
+extraction holds the worker's GIL and the leaks pile up in the web
+workers; with the engine they land in processes that get recycled.
+
+Accepts every bench_load.py option except ``--engine``.
+
+Usage:
+    python benchmarks/bench_engine.py [--requests 200] [--concurrency 16] [--workers 4]
+        [--extract-cpu 0.05] [--extract-leak 1048576] [--engine-max-rss-mb 256] [--json]
+"""
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_load
+
+# Figures worth lining up next to each other
+COLUMNS = ('requests_per_s', 'throughput_mb_s', 'succeeded', 'failed', 'latency_ms', 'ttfb_ms', 'rss')
+
+
+def rows(name, thread, process):
+    """Flatten nested figures (latency percentiles, RSS) into one row each"""
+    if isinstance(thread, dict) or isinstance(process, dict):
+        for key in (thread or process):
+            yield from rows(f'{name}.{key}', (thread or {}).get(key), (process or {}).get(key))
+    else:
+        yield name, thread, process
+
+
+def main():
+    parser = bench_load.build_parser()
+    parser.description = __doc__.strip().splitlines()[0]
+    # Every request extracts, so the extraction cost dominates
+    parser.set_defaults(videos=200, size=256 * 1024, extract_latency=0.05,
+                        extract_cpu=0.05, extract_leak=1024 * 1024, engine_max_rss_mb=256)
+    args = parser.parse_args()
+
+    reports = {}
+    for engine in ('thread', 'process'):
+        args.engine = engine
+        reports[engine] = bench_load.run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+    if args.json:
+        print(json.dumps(reports))
+    else:
+        print(f"{'':>24}  {'thread':>10}  {'process':>10}")
+        for column in COLUMNS:
+            for name, thread, process in rows(column, reports['thread'][column], reports['process'][column]):
+                print(f"{name:>24}: {thread!s:>10}  {process!s:>10}")
+    for report in reports.values():
+        bench_load.check(report, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent downloads through the app under gunicorn
+
+Starts a local TikTok stand-in (see fake_tiktok.py), runs the real app in
+gunicorn with yt-dlp pointed at it, and drives ``--concurrency`` clients
+through the browser flow: POST /download, then follow the redirect to the
+cached file (or read the streamed body) until the last byte.
+
+Reports requests/s, throughput, latency and time-to-first-byte
+percentiles, and worker saturation sampled from /metrics while the test
+runs. A scrape needs a free worker itself, so busy workers top out one
+below ``--workers``; past that point saturation shows up as growing
+``scrape_ms`` instead. Resident memory of the gunicorn workers, and of
+the extraction engine workers with ``--engine process``, is sampled from
+/proc. ``--json`` output includes the commit so runs can be compared.
+
+Usage:
+    python benchmarks/bench_load.py [--requests 200] [--concurrency 16] [--workers 4]
+        [--videos 50] [--size 1048576] [--origin-latency 0.05] [--bandwidth 0]
+        [--error-rate 0] [--extract-latency 0.2] [--extract-cpu 0] [--extract-leak 0]
+        [--engine thread] [--json] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_tiktok import FakeOrigin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize_ms(values):
+    if not values:
+        return None
+    return {
+        'mean': round(sum(values) / len(values) * 1000, 1),
+        'p50': round(percentile(values, 50) * 1000, 1),
+        'p95': round(percentile(values, 95) * 1000, 1),
+        'p99': round(percentile(values, 99) * 1000, 1),
+        'max': round(max(values) * 1000, 1),
+    }
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Client:
+    """One browser-like download, measured from POST to last byte"""
+
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        conn.request(method, path, body=body, headers=headers or {})
+        return conn, conn.getresponse()
+
+    def download(self, url):
+        started = time.perf_counter()
+        result = {'ok': False, 'status': None, 'ttfb': None, 'latency': None, 'bytes': 0, 'streamed': False}
+        body = urllib.parse.urlencode({'video_url': url})
+        conn, response = self._request('POST', '/download', body, {
+            'Content-Type': 'application/x-www-form-urlencoded',
+        })
+        try:
+            if response.status == 303:
+                # Keep the query: media links carry their expiry and signature there
+                location = urllib.parse.urlsplit(response.getheader('Location'))
+                location = f'{location.path}?{location.query}' if location.query else location.path
+                response.read()
+                conn.close()
+                conn, response = self._request('GET', location)
+            else:
+                result['streamed'] = response.status == 200
+
+            result['status'] = response.status
+            first = response.read(1)
+            result['ttfb'] = time.perf_counter() - started
+            received = len(first)
+            for chunk in iter(lambda: response.read(64 * 1024), b''):
+                received += len(chunk)
+            result['latency'] = time.perf_counter() - started
+            result['bytes'] = received
+            # Failures redirect back to the form with a flashed message
+            result['ok'] = response.status == 200 and response.getheader('Content-Type', '').startswith('video/')
+        finally:
+            conn.close()
+        return result
+
+
+class SaturationSampler(threading.Thread):
+    """Polls /metrics for busy workers and in-flight downloads"""
+
+    def __init__(self, port, interval):
+        super().__init__(name='metrics-sampler', daemon=True)
+        self.port = port
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def scrape(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('GET', '/metrics')
+            text = conn.getresponse().read().decode()
+        finally:
+            conn.close()
+        values = {}
+        for line in text.splitlines():
+            if line.startswith('#') or ' ' not in line:
+                continue
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+        return values
+
+    def run(self):
+        while not self._done.is_set():
+            started = time.perf_counter()
+            try:
+                values = self.scrape()
+            except (OSError, http.client.HTTPException):
+                values = None
+            if values is not None:
+                self.samples.append({
+                    # The scrape itself occupies one worker
+                    'busy': max(values.get('tiktok_workers_busy', 1) - 1, 0),
+                    'in_flight': values.get('tiktok_downloads_in_flight', 0),
+                    'scrape_s': time.perf_counter() - started,
+                })
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class RssSampler(threading.Thread):
+    """
+    Polls /proc for the resident memory of a gunicorn process tree
+
+    The master's children are the web workers; anything below them is the
+    extraction engine (its forkserver and workers). Linux only.
+    """
+
+    def __init__(self, master_pid, interval):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    @staticmethod
+    def processes():
+        """Map pid -> (parent pid, RSS bytes) for every readable process"""
+        page = os.sysconf('SC_PAGE_SIZE')
+        result = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces; fields resume after ')'
+                    fields = f.read().rsplit(')', 1)[1].split()
+                result[int(entry)] = (int(fields[1]), int(fields[21]) * page)
+            except (OSError, IndexError, ValueError):
+                continue
+        return result
+
+    def sample(self):
+        processes = self.processes()
+        children = {}
+        for pid, (ppid, _) in processes.items():
+            children.setdefault(ppid, []).append(pid)
+
+        def tree(pid):
+            total, stack = 0, [pid]
+            while stack:
+                current = stack.pop()
+                total += processes.get(current, (0, 0))[1]
+                stack.extend(children.get(current, ()))
+            return total
+
+        web = processes.get(self.master_pid, (0, 0))[1]
+        engine = 0
+        for worker in children.get(self.master_pid, ()):
+            web += processes[worker][1]
+            engine += sum(tree(child) for child in children.get(worker, ()))
+        return {'web': web, 'engine': engine, 'total': web + engine}
+
+    def run(self):
+        while not self._done.is_set():
+            self.samples.append(self.sample())
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        return {
+            f'{key}_{stat}_mb': round(fn(s[key] for s in self.samples) / 1024 ** 2, 1)
+            for key in ('web', 'engine', 'total')
+            for stat, fn in (('peak', max), ('final', lambda values: list(values)[-1]))
+        }
+
+
+def start_gunicorn(args, port, origin_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'FAKE_ORIGIN_URL': origin_url,
+        'FAKE_EXTRACT_LATENCY': str(args.extract_latency),
+        'FAKE_EXTRACT_ERROR_RATE': str(args.extract_error_rate),
+        'FAKE_EXTRACT_CPU': str(args.extract_cpu),
+        'FAKE_EXTRACT_LEAK': str(args.extract_leak),
+        'EXTRACTION_ENGINE': args.engine,
+        # Engine workers run yt-dlp, so they need the stand-in too
+        'ENGINE_WORKER_INIT': 'fake_tiktok:install_from_env',
+        'ENGINE_WORKERS': str(args.engine_workers),
+        'ENGINE_MAX_RSS_MB': str(args.engine_max_rss_mb),
+        'MEDIA_CACHE_DIR': os.path.join(workdir, 'media'),
+        'METADATA_CACHE_PATH': os.path.join(workdir, 'metadata.sqlite3'),
+        'JOB_STORE_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'metrics'),
+        'STREAM_DOWNLOADS': 'true' if args.stream else 'false',
+        'LOG_LEVEL': 'warning',
+    })
+    # Every simulated client shares one address; measure the app, not the
+    # per-client rate limit, unless the caller configured one
+    env.setdefault('RATE_LIMIT_PER_MINUTE', '0')
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'wb')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--workers', str(args.workers), '--access-logfile', os.devnull,
+         'benchmarks.load_app:app'],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}; see {log.name}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not come up; see {log.name}")
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    video_ids = [str(7_000_000_000_000_000_000 + i) for i in range(args.videos)]
+    urls = [f'https://www.tiktok.com/@bench/video/{rng.choice(video_ids)}' for _ in range(args.requests)]
+
+    workdir = tempfile.mkdtemp(prefix='bench-load-')
+    origin = FakeOrigin(size=args.size, latency=args.origin_latency, bandwidth=args.bandwidth,
+                        error_rate=args.error_rate, seed=args.seed).start()
+    port = free_port()
+    server = start_gunicorn(args, port, origin.url, workdir)
+    try:
+        client = Client(port, args.timeout)
+        sampler = SaturationSampler(port, args.sample_interval)
+        sampler.start()
+        rss = RssSampler(server.pid, args.sample_interval)
+        rss.start()
+
+        def one(url):
+            try:
+                return client.download(url)
+            except (OSError, http.client.HTTPException) as e:
+                return {'ok': False, 'status': None, 'error': type(e).__name__,
+                        'ttfb': None, 'latency': None, 'bytes': 0, 'streamed': False}
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one, urls))
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        rss.stop()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        origin.stop()
+
+    ok = [r for r in results if r['ok']]
+    statuses = {}
+    for r in results:
+        key = str(r['status'] or r.get('error'))
+        statuses[key] = statuses.get(key, 0) + 1
+    busy = [s['busy'] for s in sampler.samples]
+    in_flight = [s['in_flight'] for s in sampler.samples]
+    total_bytes = sum(r['bytes'] for r in ok)
+
+    report = {
+        'commit': git_commit(),
+        'config': {
+            'requests': args.requests, 'concurrency': args.concurrency, 'workers': args.workers,
+            'videos': args.videos, 'size': args.size, 'stream': args.stream,
+            'origin_latency': args.origin_latency, 'bandwidth': args.bandwidth,
+            'error_rate': args.error_rate, 'extract_latency': args.extract_latency,
+            'extract_error_rate': args.extract_error_rate, 'extract_cpu': args.extract_cpu,
+            'extract_leak': args.extract_leak, 'engine': args.engine,
+            'engine_workers': args.engine_workers, 'seed': args.seed,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(len(results) / elapsed, 2),
+        'throughput_mb_s': round(total_bytes / elapsed / 1024 ** 2, 2),
+        'succeeded': len(ok),
+        'failed': len(results) - len(ok),
+        'streamed': sum(1 for r in ok if r['streamed']),
+        'statuses': statuses,
+        'latency_ms': summarize_ms([r['latency'] for r in ok]),
+        'ttfb_ms': summarize_ms([r['ttfb'] for r in ok]),
+        'saturation': {
+            'samples': len(sampler.samples),
+            'busy_workers_mean': round(sum(busy) / len(busy), 2) if busy else None,
+            'busy_workers_max': max(busy) if busy else None,
+            'utilization': round(sum(busy) / len(busy) / args.workers, 3) if busy else None,
+            'downloads_in_flight_mean': round(sum(in_flight) / len(in_flight), 2) if in_flight else None,
+            'downloads_in_flight_max': max(in_flight) if in_flight else None,
+            'scrape_ms': summarize_ms([s['scrape_s'] for s in sampler.samples]),
+        },
+        'rss': rss.summary(),
+        'origin': origin.stats(),
+    }
+
+    if args.keep:
+        report['workdir'] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def check(report, args):
+    """
+    Fail the run if any download failed without faults being injected
+
+    Failed requests are left out of the latency figures, so a run where
+    they go unnoticed reports numbers for a different workload.
+
+    Raises:
+        SystemExit: With the status breakdown, if there were failures
+    """
+    injected = args.error_rate or args.extract_error_rate
+    if report['failed'] and not (injected or args.allow_failures):
+        raise SystemExit(f"{report['failed']} of {report['config']['requests']} downloads failed "
+                         f"(statuses: {report['statuses']}); pass --allow-failures to report anyway")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='Downloads to run in total')
+    parser.add_argument('--concurrency', type=int, default=16, help='Simultaneous clients')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--videos', type=int, default=50, help='Distinct videos requests are drawn from')
+    parser.add_argument('--size', type=int, default=1024 * 1024, help='Video size in bytes')
+    parser.add_argument('--origin-latency', type=float, default=0.05, help='Origin seconds to first byte')
+    parser.add_argument('--bandwidth', type=float, default=0, help='Origin bytes/s per connection, 0 = unlimited')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of origin requests that fail')
+    parser.add_argument('--extract-latency', type=float, default=0.2, help='Seconds per extract_info call')
+    parser.add_argument('--extract-error-rate', type=float, default=0, help='Fraction of extractions that fail')
+    parser.add_argument('--extract-cpu', type=float, default=0, help='CPU seconds per extract_info call')
+    parser.add_argument('--extract-leak', type=int, default=0, help='Bytes leaked per extract_info call')
+    parser.add_argument('--engine', choices=('thread', 'process'), default='thread',
+                        help='Run yt-dlp in the web workers or in an extraction engine pool')
+    parser.add_argument('--engine-workers', type=int, default=2, help='Engine processes per web worker')
+    parser.add_argument('--engine-max-rss-mb', type=int, default=512, help='Engine worker RSS recycling threshold')
+    parser.add_argument('--no-stream', dest='stream', action='store_false', help='Run with STREAM_DOWNLOADS=false')
+    parser.add_argument('--timeout', type=float, default=120, help='Client socket timeout in seconds')
+    parser.add_argument('--sample-interval', type=float, default=0.25, help='Seconds between /metrics samples')
+    parser.add_argument('--seed', type=int, default=1234, help='Seed for the request mix and error dice')
+    parser.add_argument('--keep', action='store_true', help='Keep the cache directory and gunicorn log')
+    parser.add_argument('--allow-failures', action='store_true',
+                        help='Exit 0 even if downloads failed without injected errors')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for name, value in report.items():
+            print(f"{name:>16}: {value}")
+    check(report, args)
+
+
+if __name__ == '__main__':
+    main()
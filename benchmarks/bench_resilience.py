@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark extraction under injected upstream faults, with and without
+the resilience policies
+
+Runs ``TikTokDownloader.extract_video_info`` against the local TikTok
+stand-in (see fake_tiktok.py) with a fresh video id per call, so every
+call reaches the upstream. Each scenario injects one kind of fault and
+runs twice: once with retries, hedging and the circuit breaker turned
+off, and once with them on.
+
+    tail     a few extractions are very slow; hedging should cut p99
+    flaky    a share of extractions fail with a 503; retries should
+             recover most of them
+    outage   every extraction fails; the breaker should turn slow
+             failures into immediate ones
+    hang     every extraction stalls; the deadline should bound latency
+
+Usage:
+    python benchmarks/bench_resilience.py [--calls 200] [--concurrency 8]
+        [--slow-rate 0.05] [--slow-latency 1.0] [--error-rate 0.3] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='bench-resilience-')
+os.environ.setdefault('MEDIA_CACHE_DIR', os.path.join(WORKDIR, 'media'))
+os.environ.setdefault('METADATA_CACHE_PATH', os.path.join(WORKDIR, 'metadata.sqlite3'))
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(WORKDIR, 'metrics'))
+
+from bench_load import summarize_ms
+from fake_tiktok import FakeOrigin, install
+from utils.downloader import TikTokDownloader
+from utils.resilience import CircuitBreaker, ResilientCaller
+
+_ids = itertools.count(7_000_000_000_000_000_000)
+
+
+def run(downloader, calls, concurrency):
+    """Extract ``calls`` distinct videos; return success rate and latencies"""
+    def one(_):
+        url = f'https://www.tiktok.com/@bench/video/{next(_ids)}'
+        started = time.perf_counter()
+        ok = downloader.extract_video_info(url) is not None
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(calls)))
+    elapsed = time.perf_counter() - started
+    return {
+        'success_rate': round(sum(ok for ok, _ in results) / calls, 3),
+        'seconds': round(elapsed, 2),
+        'latency_ms': summarize_ms([seconds for _, seconds in results]),
+    }
+
+
+def policies(args):
+    """The two configurations every scenario runs with"""
+    return {
+        'off': lambda: ResilientCaller(None, deadline=3600, retries=0),
+        'on': lambda: ResilientCaller(
+            CircuitBreaker(failure_threshold=args.failure_threshold, reset_timeout=args.reset_timeout),
+            deadline=args.deadline, retries=args.retries, base_delay=args.base_delay,
+            hedge_percentile=args.hedge_percentile, max_workers=args.concurrency * 3
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200, help='Extractions per run')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers')
+    parser.add_argument('--latency', type=float, default=0.02, help='Normal extraction seconds')
+    parser.add_argument('--slow-rate', type=float, default=0.05, help='Share of slow extractions (tail)')
+    parser.add_argument('--slow-latency', type=float, default=1.0, help='Seconds a slow extraction takes (tail)')
+    parser.add_argument('--error-rate', type=float, default=0.3, help='Share of failing extractions (flaky)')
+    parser.add_argument('--outage-latency', type=float, default=0.2, help='Seconds a failing call takes (outage)')
+    parser.add_argument('--hang-latency', type=float, default=5.0, help='Seconds a stalled call takes (hang)')
+    parser.add_argument('--deadline', type=float, default=2.0, help='Extraction deadline with policies on')
+    parser.add_argument('--retries', type=int, default=2, help='Retries with policies on')
+    parser.add_argument('--base-delay', type=float, default=0.05, help='Retry backoff base seconds')
+    parser.add_argument('--hedge-percentile', type=float, default=90, help='Hedge after this latency percentile')
+    parser.add_argument('--failure-threshold', type=int, default=5, help='Failures that open the breaker')
+    parser.add_argument('--reset-timeout', type=float, default=30, help='Seconds the breaker stays open')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+    # Failures are the point here; don't log every one of them
+    logging.basicConfig(level=logging.CRITICAL)
+
+    scenarios = {
+        'tail': {'extract_latency': args.latency, 'extract_slow_rate': args.slow_rate,
+                 'extract_slow_latency': args.slow_latency},
+        'flaky': {'extract_latency': args.latency, 'extract_error_rate': args.error_rate},
+        'outage': {'extract_latency': args.outage_latency, 'extract_error_rate': 1.0},
+        'hang': {'extract_latency': args.hang_latency},
+    }
+    # Stalls are slow per call; fewer of them still show the bound
+    calls = {'hang': args.concurrency * 2}
+
+    results = {'calls': args.calls, 'concurrency': args.concurrency}
+    downloader = TikTokDownloader()
+    with FakeOrigin(size=1024) as origin:
+        install(origin.url)
+        for scenario, faults in scenarios.items():
+            for name, make_caller in policies(args).items():
+                origin.set_faults(**{'extract_slow_rate': 0, 'extract_error_rate': 0, **faults})
+                downloader.upstream = make_caller()
+                before = origin.stats()['info_requests']
+                result = run(downloader, calls.get(scenario, args.calls), args.concurrency)
+                result['upstream_calls'] = origin.stats()['info_requests'] - before
+                results[f'{scenario}_{name}'] = result
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name, value in results.items():
+            print(f"{name:>12}: {value}")
+
+
+if __name__ == '__main__':
+    main()
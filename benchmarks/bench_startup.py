@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark: interpreter start to first request served
+
+Each run starts a fresh interpreter that imports the app, serves one
+request through Flask's test client and reports how long each step took
+and whether yt-dlp got imported along the way. Runs with ``--warm`` also
+call ``downloader.warm()`` the way the gunicorn master does with
+``preload_app``, to show what that moves out of the first extraction.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--path /health] [--warm] [--json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+t1 = time.perf_counter()
+if {warm!r}:
+    app.downloader.warm()
+t2 = time.perf_counter()
+response = app.app.test_client().get({path!r})
+t3 = time.perf_counter()
+print(json.dumps({{
+    'import_s': t1 - t0,
+    'warm_s': t2 - t1,
+    'first_request_s': t3 - t2,
+    'total_s': t3 - t0,
+    'status': response.status_code,
+    'yt_dlp_loaded': 'yt_dlp' in sys.modules,
+}}))
+'''
+
+
+def run_once(path, warm, cache_dir):
+    env = dict(os.environ)
+    env.setdefault('MEDIA_CACHE_DIR', os.path.join(cache_dir, 'media'))
+    env.setdefault('METADATA_CACHE_PATH', os.path.join(cache_dir, 'metadata.sqlite3'))
+    code = CHILD.format(root=ROOT, path=path, warm=warm)
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters to start')
+    parser.add_argument('--path', default='/health', help='Path of the first request')
+    parser.add_argument('--warm', action='store_true', help='Call downloader.warm() before the request')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as cache_dir:
+        runs = [run_once(args.path, args.warm, cache_dir) for _ in range(args.runs)]
+
+    results = {'runs': len(runs), 'path': args.path, 'warm': args.warm,
+               'yt_dlp_loaded': all(r['yt_dlp_loaded'] for r in runs)}
+    for key in ('import_s', 'warm_s', 'first_request_s', 'total_s'):
+        values = [r[key] for r in runs]
+        results[key] = {
+            'median_ms': round(statistics.median(values) * 1000, 1),
+            'max_ms': round(max(values) * 1000, 1),
+        }
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name, value in results.items():
+            print(f"{name:>16}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for TikTok URL validation and canonicalization
+
+Compares the single-pass canonicalizer in utils.urls against the old
+seven-pattern validator over a synthetic corpus built from real-world URL
+shapes (share links with tracking parameters, short links, mobile links
+and non-TikTok noise), and checks that both accept exactly the same URLs.
+
+Usage:
+    python benchmarks/bench_urls.py [--count 200000] [--json]
+"""
+
+import os
+import re
+import sys
+import json
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.urls import canonicalize
+
+URL_SHAPES = [
+    'https://www.tiktok.com/@{user}/video/{id}',
+    'https://www.tiktok.com/@{user}/video/{id}?is_from_webapp=1&sender_device=pc&web_id={web_id}',
+    'https://www.tiktok.com/@{user}/video/{id}?_r=1&_t=8{token}&checksum={hex}&sec_user_id={token}&share_app_id=1233',
+    'https://www.tiktok.com/@{user}/video/{id}?lang=en',
+    'https://tiktok.com/@{user}/video/{id}',
+    'http://www.tiktok.com/@{user}/video/{id}#comments',
+    'https://m.tiktok.com/v/{id}.html',
+    'https://m.tiktok.com/v/{id}.html?_d=secCgYIASAHKAE&language=en&preview_pb=0',
+    'https://vm.tiktok.com/ZM{token}/',
+    'https://vt.tiktok.com/ZS{token}/',
+    'https://www.tiktok.com/t/ZT{token}/',
+    'https://www.tiktok.com/@{user}',
+    'https://www.tiktok.com/embed/v2/{id}',
+    '  https://www.tiktok.com/@{user}/video/{id}  ',
+    'https://www.youtube.com/watch?v={token}',
+    'https://tiktok.com.{user}.example/video/{id}',
+    'https://www.instagram.com/reel/{token}/',
+    'not a url at all',
+]
+
+
+def legacy_is_valid(url):
+    """The validator as it was before utils.urls existed"""
+    if not url or not isinstance(url, str):
+        return False
+    url_lower = url.strip().lower()
+    if not ('tiktok.com' in url_lower or 'vm.tiktok.com' in url_lower or 'vt.tiktok.com' in url_lower):
+        return False
+    tiktok_patterns = [
+        r'^https?://(www\.)?tiktok\.com/@[\w.-]+/video/\d+',
+        r'^https?://vm\.tiktok\.com/[\w\-]+',
+        r'^https?://vt\.tiktok\.com/[\w\-]+',
+        r'^https?://m\.tiktok\.com/v/\d+',
+        r'^https?://(www\.)?tiktok\.com/t/[\w\-]+',
+        r'^https?://(www\.)?tiktok\.com/@[\w.-]+/video/\d+\?.*',
+        r'^https?://(www\.)?tiktok\.com/[\w\-@.\/]+',
+    ]
+    for pattern in tiktok_patterns:
+        if re.match(pattern, url.strip()):
+            return True
+    return False
+
+
+def build_corpus(count, seed=1234):
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    corpus = []
+    for _ in range(count):
+        shape = rng.choice(URL_SHAPES)
+        corpus.append(shape.format(
+            user=''.join(rng.choices(alphabet + '._', k=rng.randint(3, 20))),
+            id=str(rng.randint(10 ** 18, 10 ** 19 - 1)),
+            token=''.join(rng.choices(alphabet, k=rng.randint(6, 10))),
+            web_id=str(rng.randint(10 ** 18, 10 ** 19 - 1)),
+            hex=''.join(rng.choices('0123456789abcdef', k=32)),
+        ))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000, help='URLs in the corpus')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is reported)')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.count)
+
+    mismatches = [u for u in corpus if legacy_is_valid(u) != (canonicalize(u) is not None)]
+    if mismatches:
+        print(f"Validators disagree on {len(mismatches)} URLs, e.g. {mismatches[0]!r}", file=sys.stderr)
+        sys.exit(1)
+
+    def run(fn):
+        return min(timeit.repeat(lambda: [fn(u) for u in corpus], number=1, repeat=args.repeat))
+
+    legacy = run(legacy_is_valid)
+    current = run(canonicalize)
+    keys = {c.key for c in map(canonicalize, corpus) if c}
+
+    results = {
+        'urls': len(corpus),
+        'valid': sum(1 for u in corpus if canonicalize(u)),
+        'distinct_keys': len(keys),
+        'legacy_ns_per_url': round(legacy / len(corpus) * 1e9, 1),
+        'canonicalize_ns_per_url': round(current / len(corpus) * 1e9, 1),
+        'speedup': round(legacy / current, 2),
+    }
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name, value in results.items():
+            print(f"{name:>24}: {value}")
+
+
+if __name__ == '__main__':
+    main()
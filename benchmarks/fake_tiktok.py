@@ -0,0 +1,397 @@
+"""
+Local stand-in for TikTok, for benchmarks and load tests
+
+``FakeOrigin`` is an HTTP server that serves synthetic MP4 payloads with
+configurable size, latency, bandwidth and error rate. ``FakeYoutubeDL``
+replaces ``yt_dlp.YoutubeDL`` with an extractor that never leaves the
+machine: it "extracts" info pointing at the origin and downloads from it,
+so the app and ``TikTokDownloader`` run their real code paths end to end.
+
+Every extraction also makes a request to the origin's ``/info/<id>``, so
+faults injected there (latency, a slow tail, errors) hit extract_info
+the way a struggling TikTok would. Faults can be changed while the origin
+runs with ``FakeOrigin.set_faults`` or, from another process, by POSTing
+the same keyword arguments as JSON to ``/_faults``.
+
+The app side is configured through environment variables so it also
+works inside gunicorn workers (see ``load_app.py``):
+
+    FAKE_ORIGIN_URL           Base URL of a running FakeOrigin
+    FAKE_EXTRACT_LATENCY      Seconds each extract_info call takes
+    FAKE_EXTRACT_ERROR_RATE   Fraction of extract_info calls that fail
+    FAKE_EXTRACT_CPU          CPU seconds each call burns holding the GIL,
+                              like yt-dlp parsing a page
+    FAKE_EXTRACT_LEAK         Bytes each call leaks, like yt-dlp's caches
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Smallest box sequence players recognise as MP4; the rest is padding
+MP4_HEADER = b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom'
+CHUNK_SIZE = 64 * 1024
+
+_VIDEO_PATH = re.compile(r'^/media/(?P<video_id>\w+)\.mp4$')
+_INFO_PATH = re.compile(r'^/info/(?P<video_id>\w+)$')
+
+# Extraction faults ``set_faults`` accepts
+FAULTS = ('extract_latency', 'extract_slow_rate', 'extract_slow_latency', 'extract_error_rate', 'extract_error_status')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def make_payload(size):
+    """Deterministic MP4-looking payload of ``size`` bytes"""
+    filler = bytes(range(256)) * (CHUNK_SIZE // 256)
+    body = MP4_HEADER + filler * (size // len(filler) + 1)
+    return body[:size]
+
+
+class _OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != '/_faults':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            self.server.origin.set_faults(**json.loads(self.rfile.read(length) or b'{}'))
+        except (TypeError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        self._send_json(self.server.origin.faults())
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _info(self, video_id):
+        origin = self.server.origin
+        with origin.lock:
+            origin.info_requests += 1
+            slow = origin.extract_slow_rate and origin.random.random() < origin.extract_slow_rate
+            failed = origin.extract_error_rate and origin.random.random() < origin.extract_error_rate
+            origin.info_errors += bool(failed)
+            faults = origin.faults()
+        delay = faults['extract_slow_latency'] if slow else faults['extract_latency']
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self.send_error(faults['extract_error_status'])
+            return
+        self._send_json({'id': video_id})
+
+    def do_GET(self):
+        origin = self.server.origin
+        path = self.path.split('?', 1)[0]
+        info = _INFO_PATH.match(path)
+        if info is not None:
+            self._info(info.group('video_id'))
+            return
+        match = _VIDEO_PATH.match(path)
+        if match is None:
+            self.send_error(404)
+            return
+
+        if origin.latency:
+            time.sleep(origin.latency)
+        with origin.lock:
+            origin.requests += 1
+            failed = origin.error_rate and origin.random.random() < origin.error_rate
+            origin.errors += bool(failed)
+        if failed:
+            self.send_error(503)
+            return
+
+        payload = origin.payload
+        start, end = 0, len(payload)
+        status = 200
+        byte_range = _RANGE.match(self.headers.get('Range', ''))
+        if byte_range and origin.ranges and any(byte_range.groups()):
+            first, last = byte_range.groups()
+            if first:
+                start = int(first)
+                end = min(int(last) + 1, len(payload)) if last else len(payload)
+            else:
+                start = max(len(payload) - int(last), 0)
+            if start >= len(payload) or start >= end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(payload)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start))
+        if origin.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(payload)}')
+        self.end_headers()
+
+        view = memoryview(payload)
+        for offset in range(start, end, CHUNK_SIZE):
+            chunk = view[offset:min(offset + CHUNK_SIZE, end)]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if origin.bandwidth:
+                time.sleep(len(chunk) / origin.bandwidth)
+        with origin.lock:
+            origin.bytes_sent += end - start
+
+
+class _OriginServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early (probes, aborted segments) is normal
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeOrigin:
+    """
+    Threaded HTTP server that plays the part of TikTok's video CDN
+
+    Every ``/media/<id>.mp4`` returns the same payload; ``/info/<id>`` is
+    what the fake extractor calls, and where extraction faults apply.
+
+    Args:
+        size (int): Payload size in bytes
+        latency (float): Seconds before the response headers are sent
+        bandwidth (float): Per-connection bytes/second, 0 for unlimited
+        error_rate (float): Fraction of requests answered with a 503
+        ranges (bool): Whether to honour Range requests
+        seed (int): Seed for the error dice, for repeatable runs
+        **faults: Initial extraction faults, see ``set_faults``
+    """
+
+    def __init__(self, size=1024 * 1024, latency=0.0, bandwidth=0.0, error_rate=0.0,
+                 ranges=True, seed=1234, host='127.0.0.1', port=0, **faults):
+        self.payload = make_payload(size)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.ranges = ranges
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.info_requests = 0
+        self.info_errors = 0
+        self.extract_latency = 0.0
+        self.extract_slow_rate = 0.0
+        self.extract_slow_latency = 0.0
+        self.extract_error_rate = 0.0
+        self.extract_error_status = 503
+        self.set_faults(**faults)
+
+        self.server = _OriginServer((host, port), _OriginHandler)
+        self.server.origin = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-origin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_faults(self, **faults):
+        """
+        Change what extractions see, effective for the next request
+
+        Args:
+            extract_latency (float): Seconds every extraction takes
+            extract_slow_rate (float): Fraction of extractions that are slow
+            extract_slow_latency (float): Seconds a slow extraction takes
+            extract_error_rate (float): Fraction of extractions that fail
+            extract_error_status (int): HTTP status failed extractions get
+        """
+        unknown = set(faults) - set(FAULTS)
+        if unknown:
+            raise TypeError(f"Unknown faults: {', '.join(sorted(unknown))}")
+        with self.lock:
+            for name, value in faults.items():
+                setattr(self, name, int(value) if name == 'extract_error_status' else float(value))
+
+    def faults(self):
+        return {name: getattr(self, name) for name in FAULTS}
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors, 'bytes_sent': self.bytes_sent,
+                    'info_requests': self.info_requests, 'info_errors': self.info_errors}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeYoutubeDL:
+    """
+    Drop-in for the parts of ``yt_dlp.YoutubeDL`` the downloader uses
+
+    Configured through class attributes by ``install``.
+    """
+
+    origin_url = None
+    extract_latency = 0.0
+    extract_error_rate = 0.0
+    extract_cpu = 0.0
+    extract_leak = 0
+    _leaked = []
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self._progress_hooks = list(self.params.get('progress_hooks') or [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def get_info_extractor(self, ie_key):
+        return None
+
+    def add_progress_hook(self, hook):
+        self._progress_hooks.append(hook)
+
+    def extract_info(self, url, download=True):
+        import yt_dlp
+        from utils.urls import canonicalize
+
+        if self.extract_latency:
+            time.sleep(self.extract_latency)
+        if self.extract_cpu:
+            # Pure-Python work holds the GIL, as parsing does
+            busy_until = time.thread_time() + self.extract_cpu
+            while time.thread_time() < busy_until:
+                sum(range(1000))
+        if self.extract_leak:
+            self._leaked.append(bytearray(self.extract_leak))
+        if self.extract_error_rate and random.random() < self.extract_error_rate:
+            raise yt_dlp.DownloadError('ERROR: [TikTok] Video unavailable')
+
+        canonical = canonicalize(url)
+        # Short links resolve to a stable made-up id
+        video_id = canonical.video_id if canonical and canonical.video_id else str(zlib.crc32(url.encode()))
+        try:
+            with urllib.request.urlopen(f'{self.origin_url}/info/{video_id}',
+                                        timeout=self.params.get('socket_timeout') or 20):
+                pass
+        except urllib.error.HTTPError as e:
+            raise yt_dlp.DownloadError(
+                f'ERROR: [TikTok] {video_id}: Unable to download webpage: HTTP Error {e.code}: {e.reason}'
+            )
+        except OSError as e:
+            raise yt_dlp.DownloadError(f'ERROR: [TikTok] {video_id}: Unable to download webpage: {e}')
+        info = {
+            'id': video_id,
+            'ext': 'mp4',
+            'title': f'Benchmark video {video_id}',
+            'uploader': 'bench',
+            'duration': 15,
+            'webpage_url': f'https://www.tiktok.com/@bench/video/{video_id}',
+            'original_url': url,
+            'url': f'{self.origin_url}/media/{video_id}.mp4',
+            'http_headers': {'User-Agent': 'fake-tiktok'},
+            # Portrait like TikTok's: "540p" is the width, height is the long side
+            'formats': [
+                {'format_id': f'h264_{res}p', 'ext': 'mp4', 'width': res, 'height': res * 16 // 9,
+                 'filesize': len_hint, 'vcodec': 'h264', 'acodec': 'aac',
+                 'url': f'{self.origin_url}/media/{video_id}.mp4?format=h264_{res}p'}
+                for res, len_hint in ((540, 2 * 1024 ** 2), (720, 4 * 1024 ** 2), (1080, 8 * 1024 ** 2))
+            ],
+        }
+        # Format selection as yt-dlp does it: a callable picks, a selector string gets the best
+        selector = self.params.get('format')
+        chosen = next(iter(selector({'formats': info['formats']})), None) if callable(selector) else None
+        info.update({key: value for key, value in (chosen or info['formats'][-1]).items() if key != 'filesize'})
+        if download:
+            return self.process_ie_result(info, download=True)
+        return info
+
+    def process_ie_result(self, info, download=True):
+        import yt_dlp
+
+        outtmpl = self.params['outtmpl']
+        if isinstance(outtmpl, dict):
+            outtmpl = outtmpl['default']
+        file_path = outtmpl % {'id': info['id'], 'ext': info['ext']}
+        hooks = self._progress_hooks
+        try:
+            with urllib.request.urlopen(info['url']) as response, open(file_path, 'wb') as f:
+                total = int(response.headers.get('Content-Length') or 0) or None
+                downloaded = 0
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    for hook in hooks:
+                        hook({'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': total})
+        except urllib.error.HTTPError as e:
+            raise yt_dlp.DownloadError(f'ERROR: unable to download video data: HTTP Error {e.code}: {e.reason}')
+        for hook in hooks:
+            hook({'status': 'finished', 'downloaded_bytes': downloaded, 'total_bytes': total, 'filename': file_path})
+        return dict(info, requested_downloads=[{'filepath': file_path}])
+
+    def urlopen(self, request):
+        return urllib.request.urlopen(urllib.request.Request(request.url, headers=dict(request.headers)))
+
+
+def install(origin_url, extract_latency=0.0, extract_error_rate=0.0, extract_cpu=0.0, extract_leak=0):
+    """Replace ``yt_dlp.YoutubeDL`` with ``FakeYoutubeDL`` in this process"""
+    import yt_dlp
+
+    FakeYoutubeDL.origin_url = origin_url.rstrip('/')
+    FakeYoutubeDL.extract_latency = extract_latency
+    FakeYoutubeDL.extract_error_rate = extract_error_rate
+    FakeYoutubeDL.extract_cpu = extract_cpu
+    FakeYoutubeDL.extract_leak = extract_leak
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+
+
+def install_from_env():
+    """``install`` configured from the FAKE_* environment variables"""
+    install(
+        os.environ['FAKE_ORIGIN_URL'],
+        extract_latency=float(os.environ.get('FAKE_EXTRACT_LATENCY', 0)),
+        extract_error_rate=float(os.environ.get('FAKE_EXTRACT_ERROR_RATE', 0)),
+        extract_cpu=float(os.environ.get('FAKE_EXTRACT_CPU', 0)),
+        extract_leak=int(os.environ.get('FAKE_EXTRACT_LEAK', 0))
+    )
@@ -0,0 +1,21 @@
+"""
+WSGI entry point for load tests: the real app with yt-dlp replaced by
+the local TikTok stand-in (configured by the FAKE_* environment variables)
+
+    gunicorn -c gunicorn.conf.py benchmarks.load_app:app
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_tiktok import install_from_env
+
+# With the process engine yt-dlp only runs in the engine workers, which
+# install the stand-in themselves (ENGINE_WORKER_INIT)
+if os.environ.get('EXTRACTION_ENGINE', 'thread') != 'process':
+    install_from_env()
+
+from app import app  # noqa: E402
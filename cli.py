@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Bulk download TikTok videos from the command line
+
+Reads URLs (one per line) from a file or stdin, downloads them with
+TikTokDownloader and copies the videos into an output directory. Every
+outcome is appended to a JSONL manifest; running again with the same
+manifest resumes, skipping videos already archived.
+
+Videos pass through a private media cache: each is deleted from it once
+copied and the cache is removed at the end, so a long run doesn't fill
+the server's cache directory or keep a second copy of everything. With
+``--cache-dir`` the cache is kept, trimmed to its size budget. Metrics
+go to a private directory too, so they never show up in a running
+server's ``/metrics``.
+
+Usage:
+    python cli.py urls.txt --output archive/ [--concurrency 4] [--quality best]
+    cat urls.txt | python cli.py - --output archive/ --manifest archive/manifest.jsonl
+"""
+
+import os
+import sys
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.bulk import Manifest, Progress, archive, read_urls
+from utils.formats import LISTED_TIERS, parse_tier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help="File with one URL per line, or '-' for stdin")
+    parser.add_argument('--output', '-o', default='downloads', help='Directory to copy finished videos to')
+    parser.add_argument('--manifest', '-m', help='JSONL manifest to resume from (default: OUTPUT/manifest.jsonl)')
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help='Simultaneous downloads')
+    parser.add_argument('--quality', '-q', default='best',
+                        help=f"Quality tier: {', '.join(LISTED_TIERS)}, another height or a size cap like 10mb")
+    parser.add_argument('--cache-dir', help='Media cache to download through and keep (default: a temporary one)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log every download')
+    args = parser.parse_args()
+
+    tier = parse_tier(args.quality)
+    if tier is None:
+        parser.error(f"invalid quality tier: {args.quality}")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+
+    if args.input == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            urls = read_urls(f)
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest = Manifest(args.manifest or os.path.join(args.output, 'manifest.jsonl'))
+
+    # Set before utils.metrics and the downloader read them at import
+    workdir = tempfile.mkdtemp(prefix='tiktok-cli-')
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['MEDIA_CACHE_DIR'] = args.cache_dir or os.path.join(workdir, 'media')
+
+    # Imported late so --help doesn't pay for the caches and yt-dlp setup
+    from utils.downloader import TikTokDownloader
+
+    progress = Progress(len(urls))
+    try:
+        counts = archive(TikTokDownloader(), urls, args.output, manifest,
+                         concurrency=args.concurrency, tier=tier, progress=progress,
+                         keep_cache=bool(args.cache_dir))
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. {progress.line()}", file=sys.stderr)
+        print(f"Run again with --manifest {manifest.path} to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        manifest.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(progress.line(), file=sys.stderr)
+    sys.exit(1 if counts['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -54,9 +54,22 @@ raw_env = [
     f"SESSION_SECRET={os.environ.get('SESSION_SECRET', 'change-me-in-production')}",
 ]
 
+def on_starting(server):
+    """Callback before the master process is initialized"""
+    # Metrics from a previous run would otherwise be summed into this one
+    from utils.metrics import reset_multiproc_dir
+    reset_multiproc_dir()
+
 def when_ready(server):
     """Callback when server is ready"""
     server.log.info("TikTok Downloader server is ready. Listening on %s", server.address)
+    
+    # With preload_app the app is already imported in the master: load
+    # yt-dlp here once so forked workers share it copy-on-write
+    if server.cfg.preload_app:
+        from app import downloader
+        downloader.warm()
+        server.log.info("yt-dlp loaded in master before fork")
 
 def worker_int(worker):
     """Callback when worker receives INT signal"""
@@ -69,11 +82,30 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """Callback after worker fork"""
     server.log.info("Worker spawned (pid: %s)", worker.pid)
+    
+    # Background threads belong to workers, never to the master
+    from app import start_background_tasks
+    start_background_tasks()
 
 def post_worker_init(worker):
     """Callback after worker initialization"""
     worker.log.info("Worker initialized (pid: %s)", worker.pid)
 
+def pre_request(worker, req):
+    """Callback before a worker handles a request"""
+    from utils.metrics import WORKERS_BUSY
+    WORKERS_BUSY.inc()
+
+def post_request(worker, req, environ, resp):
+    """Callback after a worker has sent its response"""
+    from utils.metrics import WORKERS_BUSY
+    WORKERS_BUSY.dec()
+
+def child_exit(server, worker):
+    """Callback in the master after a worker has exited"""
+    from utils.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+
 def worker_abort(worker):
     """Callback when worker is aborted"""
     worker.log.info("Worker aborted (pid: %s)", worker.pid)
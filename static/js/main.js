@@ -25,10 +25,21 @@ function initializeDownloadForm() {
     
     if (!form || !urlInput || !downloadBtn) return;
     
+    // The server answered 429: hold the button until it will take requests again
+    const retryAfter = parseInt(form.dataset.retryAfter, 10);
+    if (retryAfter > 0) {
+        startRetryCountdown(downloadBtn, retryAfter);
+    }
+    
     // Form submission handler
     form.addEventListener('submit', function(e) {
         const url = urlInput.value.trim();
         
+        if (downloadBtn.dataset.retrying) {
+            e.preventDefault();
+            return;
+        }
+        
         if (!url) {
             e.preventDefault();
             showAlert('Please enter a TikTok video URL', 'error');
@@ -44,8 +55,13 @@ function initializeDownloadForm() {
         // Show loading state
         setLoadingState(downloadBtn, true);
         
-        // Allow form to submit normally for all devices
-        // The backend will handle mobile downloads with proper headers
+        // Phones prepare the file in the background and then download it
+        // natively; desktops submit the form and stream the response
+        if (isMobileDevice()) {
+            e.preventDefault();
+            const quality = document.getElementById('videoQuality');
+            handleMobileDownload(url, quality ? quality.value : '');
+        }
     });
     
     // URL input validation on paste
@@ -111,6 +127,33 @@ function setLoadingState(button, loading) {
     }
 }
 
+/**
+ * Show a "retry later" countdown on the download button
+ * @param {Element} button - Button element
+ * @param {number} seconds - Seconds to wait, from the Retry-After header
+ */
+function startRetryCountdown(button, seconds) {
+    let remaining = Math.ceil(seconds);
+    let timer = null;
+    
+    button.disabled = true;
+    button.dataset.retrying = 'true';
+    
+    const tick = function() {
+        if (remaining <= 0) {
+            clearInterval(timer);
+            delete button.dataset.retrying;
+            setLoadingState(button, false);
+            return;
+        }
+        button.innerHTML = `<i class="fas fa-hourglass-half me-2"></i>Retry in ${remaining}s`;
+        remaining--;
+    };
+    
+    tick();
+    timer = setInterval(tick, 1000);
+}
+
 /**
  * Show alert message
  * @param {string} message - Alert message
@@ -229,11 +272,11 @@ function formatFileSize(bytes) {
 }
 
 /**
- * Download progress tracker (if needed for future enhancements)
+ * Update the download progress bar
  * @param {number} percent - Download percentage
  */
 function updateDownloadProgress(percent) {
-    const progressBar = document.querySelector('.progress-bar');
+    const progressBar = document.querySelector('#downloadProgress .progress-bar');
     if (progressBar) {
         progressBar.style.width = percent + '%';
         progressBar.setAttribute('aria-valuenow', percent);
@@ -306,47 +349,125 @@ function isMobileDevice() {
 }
 
 /**
- * Handle mobile download with special headers
+ * Show or hide the progress bar and its status line
+ * @param {string|null} status - Status text, or null to hide
+ */
+function setDownloadStatus(status) {
+    const container = document.getElementById('downloadProgress');
+    const statusText = document.getElementById('downloadStatus');
+    if (!container) return;
+    
+    if (status === null) {
+        container.classList.add('d-none');
+        updateDownloadProgress(0);
+        return;
+    }
+    container.classList.remove('d-none');
+    if (statusText) {
+        statusText.textContent = status;
+    }
+}
+
+// Milliseconds between job status polls
+const JOB_POLL_INTERVAL = 750;
+// Milliseconds to wait for a job before giving up on it
+const JOB_WAIT_TIMEOUT = 5 * 60 * 1000;
+
+/**
+ * Poll a download job until it finishes
+ * @param {string} statusUrl - Job status URL from the jobs API
+ * @returns {Promise<Object>} - The finished job
+ */
+function waitForJob(statusUrl) {
+    const deadline = Date.now() + JOB_WAIT_TIMEOUT;
+    return new Promise((resolve, reject) => {
+        const poll = function() {
+            fetch(statusUrl, { cache: 'no-store' })
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'finished') {
+                        resolve(job);
+                        return;
+                    }
+                    if (job.status === 'failed' || job.error) {
+                        reject(new Error(job.error || 'Download failed'));
+                        return;
+                    }
+                    
+                    updateDownloadProgress(job.progress || 0);
+                    if (job.status === 'queued') {
+                        setDownloadStatus('Waiting for a free download slot...');
+                    } else if (job.total_bytes) {
+                        setDownloadStatus(`Preparing your video: ${formatFileSize(job.downloaded_bytes)} of ${formatFileSize(job.total_bytes)}`);
+                    } else {
+                        setDownloadStatus('Preparing your video...');
+                    }
+                    if (Date.now() > deadline) {
+                        reject(new Error('Preparing your video is taking too long. Please try again.'));
+                        return;
+                    }
+                    setTimeout(poll, JOB_POLL_INTERVAL);
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
+/**
+ * Handle mobile downloads without holding the video in memory
+ * 
+ * The server prepares the file as a background job while the page shows
+ * its progress; the browser then navigates to a short-lived signed link,
+ * so the video streams straight to disk and the download can resume.
+ * @param {string} url - TikTok video URL
+ * @param {string} quality - Quality tier, or empty for the device default
  */
-function handleMobileDownload(url) {
+function handleMobileDownload(url, quality) {
+    const downloadBtn = document.getElementById('downloadBtn');
     const formData = new FormData();
     formData.append('video_url', url);
+    formData.append('quality', quality || '');
     
-    fetch('/download', {
+    setDownloadStatus('Preparing your video...');
+    
+    fetch('/api/jobs', {
         method: 'POST',
         body: formData
     })
-    .then(response => {
-        if (response.ok) {
-            return response.blob();
+    .then(response => response.json().then(data => {
+        if (response.status === 429 || response.status === 503) {
+            const error = new Error(data.error || 'Too many requests');
+            error.retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+            throw error;
         }
-        throw new Error('Download failed');
-    })
-    .then(blob => {
-        // Create download link for mobile
-        const downloadUrl = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.style.display = 'none';
-        a.href = downloadUrl;
-        a.download = `tiktok_video_${Date.now()}.mp4`;
-        
-        // Add to DOM, click, then remove
-        document.body.appendChild(a);
-        a.click();
+        if (!response.ok) {
+            throw new Error(data.error || 'Download failed');
+        }
+        return data;
+    }))
+    .then(job => waitForJob(job.status_url))
+    .then(job => {
+        updateDownloadProgress(100);
+        setDownloadStatus('Download starting...');
         
-        // Clean up
-        setTimeout(() => {
-            document.body.removeChild(a);
-            window.URL.revokeObjectURL(downloadUrl);
-        }, 100);
+        // Served as an attachment, so the page stays put
+        window.location.href = job.download_url;
         
-        setLoadingState(document.getElementById('downloadBtn'), false);
+        setLoadingState(downloadBtn, false);
         showAlert('Download started! Check your downloads folder.', 'success');
+        setTimeout(() => setDownloadStatus(null), 3000);
     })
     .catch(error => {
         console.error('Download error:', error);
-        setLoadingState(document.getElementById('downloadBtn'), false);
-        showAlert('Download failed. Please try again.', 'error');
+        setDownloadStatus(null);
+        if (error.retryAfter) {
+            startRetryCountdown(downloadBtn, error.retryAfter);
+            showAlert(`The server is busy. Please try again in ${error.retryAfter} seconds.`, 'warning');
+            return;
+        }
+        setLoadingState(downloadBtn, false);
+        showAlert(error.message || 'Download failed. Please try again.', 'error');
     });
 }
 
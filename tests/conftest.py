@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+# utils.metrics picks its directory at import; keep test samples out of a
+# running server's /metrics
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='tiktok-test-metrics-')
+
+from fake_tiktok import FakeOrigin, install  # noqa: E402
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    """Local TikTok stand-in with yt-dlp pointed at it"""
+    import yt_dlp
+    # install() swaps the class on the module; put the real one back afterwards
+    monkeypatch.setattr(yt_dlp, 'YoutubeDL', yt_dlp.YoutubeDL)
+    with FakeOrigin(size=100 * 1024) as origin:
+        install(origin.url)
+        yield origin
+
+
+@pytest.fixture
+def cache_env(tmp_path, monkeypatch):
+    """Point every cache the app opens at a temporary directory"""
+    monkeypatch.setenv('MEDIA_CACHE_DIR', str(tmp_path / 'media'))
+    monkeypatch.setenv('METADATA_CACHE_PATH', str(tmp_path / 'metadata.sqlite3'))
+    return tmp_path
+
+
+@pytest.fixture
+def downloader(origin, cache_env):
+    from utils.downloader import TikTokDownloader
+    return TikTokDownloader()
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py, imported once: it reads its settings at import time"""
+    directory = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('MEDIA_CACHE_DIR', str(directory / 'media'))
+        patch.setenv('METADATA_CACHE_PATH', str(directory / 'metadata.sqlite3'))
+        patch.setenv('ASSET_BUILD_DIR', str(directory / 'assets'))
+        import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
@@ -0,0 +1,171 @@
+import threading
+import time
+
+import pytest
+
+from utils.admission import AdmissionControl, AdmissionDenied, ConcurrencyLimit, TokenBuckets
+
+VIDEO_URL = 'https://www.tiktok.com/@someone/video/7100000000000000002'
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def buckets(tmp_path, clock):
+    return TokenBuckets(str(tmp_path / 'admission.sqlite3'), rate=1, burst=3, clock=clock)
+
+
+@pytest.fixture
+def limit(tmp_path):
+    return ConcurrencyLimit(str(tmp_path / 'slots'), 2)
+
+
+def test_burst_then_refill(buckets, clock):
+    assert [buckets.take('a') for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('a') == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert buckets.take('a') == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.take('a') == 0
+
+
+def test_refill_stops_at_burst(buckets, clock):
+    clock.now += 3600
+    assert [buckets.take('a') for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('a') > 0
+
+
+def test_clients_have_their_own_buckets(buckets):
+    for _ in range(3):
+        buckets.take('a')
+
+    assert buckets.take('a') > 0
+    assert buckets.take('b') == 0
+
+
+def test_cost_above_burst_leaves_the_bucket_in_debt(buckets, clock):
+    # A full bucket admits it once, then the client waits the tokens out
+    assert buckets.take('a', cost=5) == 0
+    assert buckets.take('a') == pytest.approx(3.0)
+
+    clock.now += 3
+    assert buckets.take('a') == 0
+
+
+def test_workers_share_buckets(buckets, clock):
+    other_worker = TokenBuckets(buckets.db_path, rate=1, burst=3, clock=clock)
+    buckets.take('a', cost=3)
+
+    assert other_worker.take('a') > 0
+
+
+def test_slots_are_counted(limit):
+    first, second = limit.acquire(), limit.acquire()
+
+    assert first is not None and second is not None
+    assert limit.acquire() is None
+    assert limit.stats() == {'limit': 2, 'held': 2}
+
+    first.release()
+    first.release()
+    assert limit.stats()['held'] == 1
+    with limit.acquire() as third:
+        assert third is not None
+    assert limit.stats()['held'] == 1
+
+
+def test_slots_are_shared_between_workers(limit):
+    # Another worker process opens the same slot files
+    other_worker = ConcurrencyLimit(limit.lock_dir, limit.limit)
+    slots = [limit.acquire(), limit.acquire()]
+
+    assert other_worker.acquire() is None
+    slots[0].release()
+    assert other_worker.acquire() is not None
+
+
+def test_acquire_waits_for_a_free_slot(limit, monkeypatch):
+    monkeypatch.setattr(ConcurrencyLimit, 'POLL_INTERVAL', 0.01)
+    slots = [limit.acquire(), limit.acquire()]
+    threading.Timer(0.1, slots[0].release).start()
+
+    started = time.monotonic()
+    assert limit.acquire(timeout=0.05) is None
+    assert limit.acquire(timeout=1) is not None
+    assert time.monotonic() - started < 0.5
+
+
+def test_busy_requests_keep_their_tokens(buckets, limit):
+    admission = AdmissionControl(buckets, limit, busy_retry_after=7)
+    slots = [admission.admit('a'), admission.admit('a')]
+
+    with pytest.raises(AdmissionDenied) as denied:
+        admission.admit('a')
+    assert (denied.value.reason, denied.value.retry_after) == ('capacity', 7)
+    # Two spent on the admitted downloads, none on the rejected one
+    assert buckets.take('a') == 0
+    assert buckets.take('a') > 0
+
+
+def test_rate_limited_requests_give_their_slot_back(buckets, limit):
+    admission = AdmissionControl(buckets, limit)
+    buckets.take('a', cost=3)
+
+    with pytest.raises(AdmissionDenied) as denied:
+        admission.admit('a')
+    assert denied.value.reason == 'rate'
+    assert limit.stats()['held'] == 0
+
+
+def test_download_answers_429_when_busy(client, app_module, limit, monkeypatch):
+    monkeypatch.setattr(app_module.admission, 'limit', limit)
+    slots = [limit.acquire(), limit.acquire()]
+
+    response = client.post('/download', data={'video_url': VIDEO_URL})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After']
+    for slot in slots:
+        slot.release()
+
+
+def test_download_answers_429_over_the_rate_limit(client, app_module, buckets, monkeypatch):
+    monkeypatch.setattr(app_module.admission, 'buckets', buckets)
+    buckets.take('127.0.0.1', cost=3)
+
+    response = client.post('/download', data={'video_url': VIDEO_URL})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_cached_video_needs_no_slot(client, app_module, limit, monkeypatch):
+    cache = app_module.downloader.media_cache
+    path = cache.path('tiktok_7100000000000000002.mp4')
+    with open(path, 'wb') as f:
+        f.write(b'video')
+    cache.add(path)
+    monkeypatch.setattr(app_module.admission, 'limit', limit)
+    slots = [limit.acquire(), limit.acquire()]
+
+    try:
+        response = client.post('/download', data={'video_url': VIDEO_URL})
+    finally:
+        cache.discard('tiktok_7100000000000000002.mp4')
+        for slot in slots:
+            slot.release()
+
+    assert response.status_code == 303
+    assert response.headers['Location'].startswith('/media/tiktok_7100000000000000002.mp4?')
@@ -0,0 +1,80 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from fake_tiktok import make_payload
+
+VIDEO_URL = 'https://www.tiktok.com/@someone/video/7000000000000000001'
+
+
+@pytest.fixture
+def submitted(app_module, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(app_module.jobs, 'submit', lambda url, tier: submitted.append((url, tier)) or 'job-1')
+    return submitted
+
+
+@pytest.mark.parametrize('body', [
+    [VIDEO_URL],
+    VIDEO_URL,
+    {'video_url': [VIDEO_URL]},
+    {'url': 7000000000000000001},
+    {'video_url': VIDEO_URL, 'quality': 720},
+    {'video_url': VIDEO_URL, 'quality': {'height': 720}},
+])
+def test_create_job_rejects_malformed_bodies(client, submitted, body):
+    response = client.post('/api/jobs', json=body)
+
+    assert response.status_code == 400
+    assert response.json['error']
+    assert submitted == []
+
+
+def test_create_job_accepts_json_and_forms(client, submitted):
+    assert client.post('/api/jobs', json={'video_url': VIDEO_URL, 'quality': '540p'}).status_code == 202
+    assert client.post('/api/jobs', data={'url': VIDEO_URL}).status_code == 202
+
+    assert [(url, tier.key) for url, tier in submitted][0] == (VIDEO_URL, '540p')
+    assert len(submitted) == 2
+
+
+@pytest.mark.parametrize('body', [
+    [VIDEO_URL],
+    VIDEO_URL,
+    {'urls': VIDEO_URL},
+    {'urls': [VIDEO_URL, 7000000000000000002]},
+    {'urls': [VIDEO_URL, None]},
+    {'urls': [VIDEO_URL], 'quality': 720},
+])
+def test_batch_rejects_malformed_bodies(client, body):
+    response = client.post('/api/batch', json=body)
+
+    assert response.status_code == 400
+    assert response.json['error']
+
+
+def test_batch_size_is_limited(client, app_module, origin, monkeypatch):
+    monkeypatch.setattr(app_module, 'BATCH_MAX_URLS', 3)
+    urls = [f'https://www.tiktok.com/@someone/video/700000000000000001{index}' for index in range(4)]
+
+    assert client.post('/api/batch', json={'urls': urls}).status_code == 400
+    # Duplicates count once
+    assert client.post('/api/batch', json={'urls': [urls[0]] * 4}).status_code == 200
+
+
+def test_batch_zip_lists_failed_entries(client, origin):
+    video_url = 'https://www.tiktok.com/@someone/video/7000000000000000002'
+    bad_url = 'https://example.com/not-a-tiktok'
+
+    response = client.post('/api/batch', json={'urls': [video_url, bad_url]})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        manifest = json.loads(archive.read('manifest.json'))
+        assert archive.read('tiktok_7000000000000000002.mp4') == make_payload(100 * 1024)
+    assert (manifest['total'], manifest['succeeded'], manifest['failed']) == (2, 1, 1)
+    failed = [item for item in manifest['items'] if item['status'] == 'failed']
+    assert failed == [{'url': bad_url, 'status': 'failed', 'error': 'Invalid TikTok URL format'}]
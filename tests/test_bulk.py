@@ -0,0 +1,62 @@
+import os
+import threading
+
+import pytest
+
+from fake_tiktok import make_payload
+from utils.bulk import Manifest, Progress, archive
+
+URLS = [f'https://www.tiktok.com/@someone/video/700000000000000000{index}' for index in range(1, 5)]
+
+
+def media_files(downloader):
+    return [name for name in os.listdir(downloader.media_cache.directory) if name.startswith('tiktok_')]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    (tmp_path / 'out').mkdir()
+    manifest = Manifest(str(tmp_path / 'out' / 'manifest.jsonl'))
+    yield manifest
+    manifest.close()
+
+
+def test_archive_copies_and_resumes(downloader, origin, manifest, tmp_path):
+    output = tmp_path / 'out'
+    counts = archive(downloader, URLS + URLS[:1], str(output), manifest, concurrency=2)
+
+    assert counts == {'ok': 4, 'failed': 0, 'skipped': 1}
+    assert (output / 'tiktok_7000000000000000001.mp4').read_bytes() == make_payload(100 * 1024)
+
+    again = archive(downloader, URLS, str(output), Manifest(manifest.path))
+    assert again == {'ok': 0, 'failed': 0, 'skipped': 4}
+    assert origin.stats()['requests'] == 4
+
+
+def test_private_cache_is_emptied_after_each_copy(downloader, origin, manifest, tmp_path):
+    archive(downloader, URLS, str(tmp_path / 'out'), manifest, keep_cache=False)
+
+    assert len(os.listdir(tmp_path / 'out')) == len(URLS) + 1
+    assert media_files(downloader) == []
+
+
+def test_kept_cache_keeps_the_videos(downloader, origin, manifest, tmp_path):
+    archive(downloader, URLS, str(tmp_path / 'out'), manifest)
+
+    assert len(media_files(downloader)) == len(URLS)
+
+
+def test_interrupt_waits_for_running_downloads(downloader, origin, manifest, tmp_path):
+    origin.bandwidth = 200 * 1024
+
+    class Interrupted(Progress):
+        def add(self, status, size=0):
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        archive(downloader, URLS, str(tmp_path / 'out'), manifest, concurrency=1, progress=Interrupted(len(URLS)))
+
+    # Nothing is left writing into a cache the caller is about to remove
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith('bulk-download')]
+    # The downloads queued behind the running one never started
+    assert origin.stats()['requests'] <= 2
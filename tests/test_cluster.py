@@ -0,0 +1,38 @@
+from utils.admission import ConcurrencyLimit
+from utils.cluster import Cluster
+
+from fake_tiktok import make_payload
+
+VIDEO_URL = 'https://www.tiktok.com/@someone/video/7000000000000000001'
+SECRET = 'cluster-secret'
+
+
+def internal_media(client, secret=SECRET):
+    return client.get('/internal/media', query_string={'url': VIDEO_URL},
+                      headers={'Authorization': f'Bearer {secret}', 'X-Cluster-Node': 'b'})
+
+
+def test_internal_media_needs_the_cluster_secret(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'CLUSTER_SECRET', SECRET)
+    monkeypatch.setattr(app_module.downloader, 'cluster', Cluster('a', {'a': 'http://a', 'b': 'http://b'}, SECRET))
+
+    assert internal_media(client, secret='wrong').status_code == 401
+
+
+def test_internal_media_takes_a_download_slot(client, app_module, origin, monkeypatch, tmp_path):
+    limit = ConcurrencyLimit(str(tmp_path / 'slots'), 1)
+    monkeypatch.setattr(app_module, 'CLUSTER_SECRET', SECRET)
+    monkeypatch.setattr(app_module.downloader, 'cluster', Cluster('a', {'a': 'http://a', 'b': 'http://b'}, SECRET))
+    monkeypatch.setattr(app_module.admission, 'limit', limit)
+
+    with limit.acquire():
+        busy = internal_media(client)
+    # The asking node falls back to TikTok rather than waiting here
+    assert busy.status_code == 503
+    assert busy.headers['Retry-After']
+    assert origin.stats()['requests'] == 0
+
+    response = internal_media(client)
+    assert response.status_code == 200
+    assert response.data == make_payload(100 * 1024)
+    assert limit.stats()['held'] == 0
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+
+import pytest
+
+from fake_tiktok import make_payload
+from utils.downloader import parse_ttls
+
+VIDEO_URL = 'https://www.tiktok.com/@someone/video/7000000000000000001'
+SHORT_URL = 'https://vm.tiktok.com/ZMabc123/'
+
+
+def extractions(origin):
+    # Every FakeYoutubeDL.extract_info call fetches the origin's /info page
+    return origin.stats()['info_requests']
+
+
+def test_cache_miss_extracts_once(downloader, origin):
+    result = downloader.download_video(VIDEO_URL)
+
+    assert result['success']
+    assert os.path.getsize(result['file_path']) == 100 * 1024
+    assert extractions(origin) == 1
+    assert origin.stats()['requests'] == 1
+
+
+def test_cache_hit_does_not_extract(downloader, origin):
+    first = downloader.download_video(VIDEO_URL)
+    second = downloader.download_video(VIDEO_URL)
+
+    assert second['success']
+    assert second['filename'] == first['filename']
+    assert extractions(origin) == 1
+    assert origin.stats()['requests'] == 1
+
+
+def test_short_link_resolves_from_metadata_cache(downloader, origin):
+    assert downloader.download_video(SHORT_URL)['success']
+    assert downloader.download_video(SHORT_URL)['success']
+
+    assert extractions(origin) == 1
+
+
+def test_concurrent_downloads_share_one_extraction(downloader, origin):
+    results = [None] * 8
+
+    def download(index):
+        results[index] = downloader.download_video(VIDEO_URL)
+
+    threads = [threading.Thread(target=download, args=(index,)) for index in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(result['success'] for result in results)
+    assert extractions(origin) == 1
+    assert origin.stats()['requests'] == 1
+
+
+def test_stream_video_extracts_once(downloader, origin):
+    result = downloader.stream_video(VIDEO_URL)
+    body = b''.join(result['stream'])
+
+    assert result['success']
+    assert len(body) == 100 * 1024
+    assert downloader.stream_video(VIDEO_URL)['file_path'] is not None
+    assert extractions(origin) == 1
+
+
+def wait_for(path, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, f"{path} never appeared"
+        time.sleep(0.01)
+
+
+def test_second_client_follows_the_growing_file(downloader, origin):
+    size = 1024 * 1024
+    origin.payload = make_payload(size)
+    origin.bandwidth = 2 * 1024 * 1024  # about half a second per download
+
+    first = downloader.stream_video(VIDEO_URL)
+    partial_path = os.path.join(downloader.media_cache.directory, f"{first['filename']}.part")
+    wait_for(partial_path)
+    second = downloader.stream_video(VIDEO_URL)
+
+    assert second['success']
+    assert second['file_path'] is None
+    assert b''.join(second['stream']) == make_payload(size)
+    assert b''.join(first['stream']) == make_payload(size)
+    assert extractions(origin) == 1
+    assert origin.stats()['requests'] == 1
+
+
+def test_abandoned_partial_file_is_replaced(downloader, origin):
+    downloader.download_video(VIDEO_URL)
+    file_path = os.path.join(downloader.media_cache.directory, downloader.download_video(VIDEO_URL)['filename'])
+    # A writer killed mid-download leaves a partial file and no lock
+    os.replace(file_path, f"{file_path}.part")
+
+    result = downloader.stream_video(VIDEO_URL)
+
+    assert b''.join(result['stream']) == make_payload(100 * 1024)
+    assert origin.stats()['requests'] == 2
+
+
+def test_writer_dying_mid_stream_fails_followers(downloader, origin, monkeypatch):
+    import utils.downloader
+
+    size = 1024 * 1024
+    origin.payload = make_payload(size)
+    origin.bandwidth = 4 * 1024 * 1024
+    real_tee = utils.downloader.tee_to_file
+
+    class Dropped:
+        def __init__(self, response):
+            self.response = response
+            self.sent = 0
+
+        def read(self, n):
+            if self.sent > size // 2:
+                raise ConnectionResetError('connection reset by peer')
+            chunk = self.response.read(n)
+            self.sent += len(chunk)
+            return chunk
+
+    monkeypatch.setattr(utils.downloader, 'tee_to_file',
+                        lambda response, *args, **kwargs: real_tee(Dropped(response), *args, **kwargs))
+    result = downloader.stream_video(VIDEO_URL)
+
+    with pytest.raises(IOError):
+        b''.join(result['stream'])
+    assert not os.path.exists(os.path.join(downloader.media_cache.directory, f"{result['filename']}.part"))
+
+    monkeypatch.setattr(utils.downloader, 'tee_to_file', real_tee)
+    retry = downloader.stream_video(VIDEO_URL)
+    assert b''.join(retry['stream']) == make_payload(size)
+
+
+def test_download_deadline_aborts_a_slow_download(downloader, origin):
+    origin.payload = make_payload(1024 * 1024)
+    origin.bandwidth = 1024 * 1024
+    downloader.download_deadline = 0.2
+
+    result = downloader.download_video(VIDEO_URL)
+
+    assert not result['success']
+    assert 'too long' in result['error']
+    assert not [name for name in os.listdir(downloader.media_cache.directory) if name.startswith('tiktok_')]
+
+
+def test_download_deadline_aborts_the_tee(downloader, origin):
+    origin.payload = make_payload(1024 * 1024)
+    origin.bandwidth = 1024 * 1024
+    downloader.download_deadline = 0.2
+
+    result = downloader.stream_video(VIDEO_URL)
+
+    started = time.monotonic()
+    with pytest.raises(IOError):
+        b''.join(result['stream'])
+    assert time.monotonic() - started < 0.8
+    assert not os.path.exists(os.path.join(downloader.media_cache.directory, f"{result['filename']}.part"))
+
+
+def test_parse_ttls():
+    ttls = parse_ttls('private=10, forbidden=0,geo=30')
+
+    assert ttls['private'] == 10
+    assert ttls['geo'] == 30
+    assert 'forbidden' not in ttls
+    assert ttls['not_found'] == 24 * 3600
+    assert 'other' not in parse_ttls(None)
+
+
+def test_permanent_failures_are_remembered(downloader, origin):
+    origin.set_faults(extract_error_rate=1, extract_error_status=404)
+
+    first = downloader.download_video(VIDEO_URL)
+    second = downloader.download_video(VIDEO_URL)
+
+    assert first['error'] == second['error'] == 'Video not found. Please check the URL'
+    assert extractions(origin) == 1
+
+
+def test_unclassified_failures_are_not_remembered(downloader, origin):
+    downloader.upstream.retries = 0
+    origin.set_faults(extract_error_rate=1, extract_error_status=500)
+
+    assert not downloader.download_video(VIDEO_URL)['success']
+    assert not downloader.download_video(VIDEO_URL)['success']
+    assert extractions(origin) == 2
+
+
+def test_categories_without_a_ttl_are_not_remembered(downloader, origin):
+    downloader.negative_ttls = parse_ttls('not_found=0')
+    origin.set_faults(extract_error_rate=1, extract_error_status=404)
+
+    downloader.download_video(VIDEO_URL)
+    downloader.download_video(VIDEO_URL)
+
+    assert extractions(origin) == 2
+
+
+def test_remembered_failure_expires(downloader, origin):
+    downloader.negative_ttls['forbidden'] = 0.05
+    origin.set_faults(extract_error_rate=1, extract_error_status=403)
+    assert 'Access denied' in downloader.download_video(VIDEO_URL)['error']
+    assert 'Access denied' in downloader.download_video(VIDEO_URL)['error']
+    assert extractions(origin) == 1
+
+    time.sleep(0.06)
+    origin.set_faults(extract_error_rate=0)
+    assert downloader.download_video(VIDEO_URL)['success']
+    assert extractions(origin) == 2
@@ -0,0 +1,85 @@
+import os
+import sys
+import pickle
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.formats import BEST, FormatSelector, media_filename, parse_tier, select_format, summarize_formats  # noqa: E402
+
+# What the TikTok extractor reports: portrait, height is the long side
+PORTRAIT = [
+    {'format_id': 'h264_540p', 'ext': 'mp4', 'width': 540, 'height': 960, 'filesize': 3 * 1024 ** 2,
+     'vcodec': 'h264', 'acodec': 'aac', 'tbr': 900},
+    {'format_id': 'h264_720p', 'ext': 'mp4', 'width': 720, 'height': 1280, 'filesize': 6 * 1024 ** 2,
+     'vcodec': 'h264', 'acodec': 'aac', 'tbr': 1500},
+    {'format_id': 'h265_1080p', 'ext': 'mp4', 'width': 1080, 'height': 1920, 'filesize': 12 * 1024 ** 2,
+     'vcodec': 'h265', 'acodec': 'aac', 'tbr': 3000},
+    {'format_id': 'audio', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'aac', 'filesize': 10 ** 5},
+]
+
+
+def selected(tier, formats=PORTRAIT):
+    return [f['format_id'] for f in tier.format({'formats': formats})]
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('best', 'h265_1080p'),
+    ('1080p', 'h265_1080p'),
+    ('720p', 'h264_720p'),
+    ('540p', 'h264_540p'),
+    ('360p', 'h264_540p'),  # Nothing fits: the smallest, not a failure
+])
+def test_height_tiers_cap_the_short_side(value, expected):
+    tier = parse_tier(value)
+    formats = summarize_formats({'formats': PORTRAIT})
+    assert select_format(formats, tier)['format_id'] == expected
+    if tier is not BEST:
+        assert selected(tier) == [expected]
+
+
+def test_landscape_formats_cap_the_short_side_too():
+    landscape = [dict(f, width=f.get('height'), height=f.get('width')) for f in PORTRAIT]
+    assert selected(parse_tier('720p'), landscape) == ['h264_720p']
+
+
+def test_size_tiers_use_mebibytes_in_selector_and_prediction():
+    tier = parse_tier('6mb')
+    assert tier.max_bytes == 6 * 1024 ** 2
+    # Exactly 6 MiB is not under the cap
+    assert selected(tier) == ['h264_540p']
+    assert select_format(summarize_formats({'formats': PORTRAIT}), tier)['format_id'] == 'h264_540p'
+    assert selected(parse_tier('7mb')) == ['h264_720p']
+
+
+def test_invalid_tiers():
+    for value in ('', '541p', '0mb', '501mb', 'worst', '720'):
+        assert parse_tier(value) is None
+
+
+def test_selector_survives_the_engine():
+    tier = parse_tier('540p')
+    copy = pickle.loads(pickle.dumps(tier))
+    assert copy == tier
+    assert repr(copy.format) == repr(tier.format)
+
+
+def test_tiers_cache_separately():
+    assert media_filename('1', 'mp4', BEST) == 'tiktok_1.mp4'
+    assert media_filename('1', 'mp4', parse_tier('540p')) == 'tiktok_1_540p.mp4'
+    assert isinstance(parse_tier('540p').format, FormatSelector)
+
+
+@pytest.mark.parametrize('value, expected', [('540p', 'h264_540p'), ('720p', 'h264_720p'), ('7mb', 'h264_720p')])
+def test_yt_dlp_accepts_the_selector(value, expected):
+    yt_dlp = pytest.importorskip('yt_dlp')
+    info = {
+        'id': '1', 'title': 'video', 'extractor': 'TikTok', 'extractor_key': 'TikTok',
+        'webpage_url': 'https://www.tiktok.com/@a/video/1',
+        'formats': [dict(f, url=f"https://example.com/{f['format_id']}") for f in PORTRAIT],
+    }
+    with yt_dlp.YoutubeDL({'format': parse_tier(value).format, 'quiet': True}) as ydl:
+        result = ydl.process_ie_result(info, download=False)
+    assert result['format_id'] == expected
@@ -0,0 +1,50 @@
+import pytest
+
+from utils.hashring import HashRing
+
+KEYS = [f"7{index:018d}" for index in range(5000)]
+
+
+def owners(ring):
+    return {key: ring.owner(key) for key in KEYS}
+
+
+def test_placement_is_stable():
+    # Same nodes in any order, in another ring (or process), same owners
+    assert owners(HashRing(['a', 'b', 'c'])) == owners(HashRing(['c', 'a', 'b', 'a']))
+
+
+def test_keys_spread_over_all_nodes():
+    placed = owners(HashRing(['a', 'b', 'c', 'd']))
+    for node in 'abcd':
+        assert 0.15 < list(placed.values()).count(node) / len(KEYS) < 0.35
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    before = owners(HashRing(['a', 'b', 'c']))
+    after = owners(HashRing(['a', 'b', 'c', 'd']))
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 'd' for key in moved)
+    # About 1/4 of the keys, not a reshuffle
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+
+
+def test_removing_a_node_only_moves_its_keys():
+    before = owners(HashRing(['a', 'b', 'c', 'd']))
+    after = owners(HashRing(['a', 'b', 'c']))
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert sorted(moved) == sorted(key for key in KEYS if before[key] == 'd')
+
+
+def test_share_covers_the_ring():
+    share = HashRing(['a', 'b', 'c']).share()
+
+    assert set(share) == {'a', 'b', 'c'}
+    assert sum(share.values()) == pytest.approx(1, abs=0.001)
+
+
+def test_ring_needs_a_node():
+    with pytest.raises(ValueError):
+        HashRing([])
@@ -0,0 +1,156 @@
+import os
+from email.utils import formatdate
+
+import pytest
+
+from utils import signing
+
+FILENAME = 'tiktok_7100000000000000001.mp4'
+BODY = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def media_url(app_module):
+    cache = app_module.downloader.media_cache
+    path = cache.path(FILENAME)
+    with open(path, 'wb') as f:
+        f.write(BODY)
+    cache.add(path)
+    expires, sig = signing.sign(app_module.app.secret_key, FILENAME, 60)
+    yield f'/media/{FILENAME}?expires={expires}&sig={sig}'
+    cache.discard(FILENAME)
+
+
+def test_whole_file(client, media_url):
+    response = client.get(media_url)
+
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag']
+    assert response.headers['Content-Length'] == str(len(BODY))
+
+
+def test_single_range(client, media_url):
+    response = client.get(media_url, headers={'Range': 'bytes=100-199'})
+
+    assert response.status_code == 206
+    assert response.data == BODY[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(BODY)}'
+    assert response.headers['Content-Length'] == '100'
+
+
+def test_open_ended_range(client, media_url):
+    response = client.get(media_url, headers={'Range': 'bytes=10000-'})
+
+    assert response.status_code == 206
+    assert response.data == BODY[10000:]
+    assert response.headers['Content-Range'] == f'bytes 10000-{len(BODY) - 1}/{len(BODY)}'
+
+
+def test_suffix_range(client, media_url):
+    response = client.get(media_url, headers={'Range': 'bytes=-5'})
+
+    assert response.status_code == 206
+    assert response.data == BODY[-5:]
+
+
+def test_unsatisfiable_range(client, media_url):
+    response = client.get(media_url, headers={'Range': f'bytes={len(BODY)}-'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(BODY)}'
+    assert response.data == b''
+
+
+def test_if_range_with_the_current_etag_resumes(client, media_url):
+    etag = client.get(media_url).headers['ETag']
+
+    response = client.get(media_url, headers={'Range': 'bytes=100-199', 'If-Range': etag})
+
+    assert response.status_code == 206
+    assert response.data == BODY[100:200]
+
+
+def test_stale_if_range_sends_the_whole_file(client, media_url):
+    response = client.get(media_url, headers={'Range': 'bytes=100-199', 'If-Range': '"some-older-version"'})
+
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert 'Content-Range' not in response.headers
+
+
+def test_if_range_date_before_the_file_sends_the_whole_file(client, app_module, media_url):
+    modified = os.stat(app_module.downloader.media_cache.path(FILENAME)).st_mtime
+    stale = formatdate(modified - 3600, usegmt=True)
+
+    response = client.get(media_url, headers={'Range': 'bytes=100-199', 'If-Range': stale})
+
+    assert response.status_code == 200
+    assert response.data == BODY
+
+
+def test_matching_etag_is_not_modified(client, media_url):
+    etag = client.get(media_url).headers['ETag']
+
+    response = client.get(media_url, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_other_etag_sends_the_file(client, media_url):
+    response = client.get(media_url, headers={'If-None-Match': '"something-else"'})
+
+    assert response.status_code == 200
+    assert response.data == BODY
+
+
+def test_missing_file_redirects_home(client, app_module):
+    expires, sig = signing.sign(app_module.app.secret_key, 'tiktok_1.mp4', 60)
+
+    response = client.get(f'/media/tiktok_1.mp4?expires={expires}&sig={sig}')
+
+    assert response.status_code == 302
+
+
+def test_unsigned_link_is_forbidden(client, media_url):
+    response = client.get(f'/media/{FILENAME}')
+
+    assert response.status_code == 403
+    assert BODY not in response.data
+
+
+@pytest.mark.parametrize('query', [
+    'expires={expires}&sig=AAAAAAAAAAAAAAAAAAAAAA',
+    'expires={later}&sig={sig}',
+    'expires={expires}',
+    'sig={sig}',
+])
+def test_tampered_link_is_forbidden(client, app_module, media_url, query):
+    expires, sig = signing.sign(app_module.app.secret_key, FILENAME, 60)
+
+    response = client.get(f'/media/{FILENAME}?' + query.format(expires=expires, sig=sig, later=expires + 3600))
+
+    assert response.status_code == 403
+
+
+def test_link_for_another_file_is_forbidden(client, app_module, media_url):
+    expires, sig = signing.sign(app_module.app.secret_key, 'tiktok_7100000000000000009.mp4', 60)
+
+    assert client.get(f'/media/{FILENAME}?expires={expires}&sig={sig}').status_code == 403
+
+
+def test_expired_link_is_gone(client, app_module, media_url):
+    expires, sig = signing.sign(app_module.app.secret_key, FILENAME, -1)
+
+    assert client.get(f'/media/{FILENAME}?expires={expires}&sig={sig}').status_code == 410
+
+
+def test_unsigned_links_work_when_signing_is_optional(client, app_module, media_url, monkeypatch):
+    monkeypatch.setattr(app_module, 'REQUIRE_SIGNED_MEDIA', False)
+
+    assert client.get(f'/media/{FILENAME}').data == BODY
+    # A signature that is there still has to be right
+    assert client.get(f'/media/{FILENAME}?expires=1&sig=x').status_code == 403
@@ -0,0 +1,109 @@
+import sqlite3
+import time
+
+import pytest
+
+from utils.metadata_cache import MetadataCache
+
+INFO = {'id': '7000000000000000001', 'title': 'video', 'ext': 'mp4', 'formats': []}
+KEYS = ['7000000000000000001', 'vm.tiktok.com/ZMabc123']
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MetadataCache(str(tmp_path / 'metadata.sqlite3'), ttl_seconds=60, max_entries=2)
+
+
+def accessed_at(cache, video_id):
+    with sqlite3.connect(cache.db_path) as conn:
+        return conn.execute("SELECT accessed_at FROM videos WHERE video_id = ?", (video_id,)).fetchone()[0]
+
+
+def test_get_by_any_key(cache):
+    cache.put(KEYS, INFO)
+
+    for key in KEYS:
+        assert cache.get(key)['title'] == 'video'
+    assert cache.get('unknown') is None
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_expired_entries_are_misses(cache):
+    cache.put(KEYS, INFO)
+    cache.ttl_seconds = 0
+
+    assert cache.get(KEYS[0]) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_hits_do_not_write(cache):
+    cache.put(KEYS, INFO)
+    stored = accessed_at(cache, INFO['id'])
+
+    # Another worker holding the write lock doesn't hold up a hit
+    writer = sqlite3.connect(cache.db_path)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        started = time.monotonic()
+        assert cache.get(KEYS[0]) is not None
+        assert time.monotonic() - started < 1
+    finally:
+        writer.rollback()
+        writer.close()
+    assert accessed_at(cache, INFO['id']) == stored
+
+
+def test_access_times_and_counters_are_flushed_periodically(cache, monkeypatch):
+    cache.put(KEYS, INFO)
+    stored = accessed_at(cache, INFO['id'])
+    cache.get(KEYS[0])
+
+    monkeypatch.setattr(cache, 'FLUSH_INTERVAL', 0)
+    cache.get(KEYS[1])
+
+    assert accessed_at(cache, INFO['id']) > stored
+    with sqlite3.connect(cache.db_path) as conn:
+        assert dict(conn.execute("SELECT name, value FROM stats"))['hits'] == 2
+
+
+def test_eviction_sees_buffered_access_times(cache):
+    cache.put(['1'], dict(INFO, id='1'))
+    cache.put(['2'], dict(INFO, id='2'))
+    # '1' was stored first but used last; '2' goes
+    cache.get('1')
+    cache.put(['3'], dict(INFO, id='3'))
+
+    assert cache.get('1') is not None
+    assert cache.get('2') is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_failures_expire(cache):
+    cache.put_failure(KEYS, 'not_found', 'Video not found', ttl_seconds=0.05)
+
+    assert cache.get_failure(KEYS[1]) == ('not_found', 'Video not found')
+    assert cache.stats()['failures'] == 2
+    time.sleep(0.06)
+    assert cache.get_failure(KEYS[1]) is None
+    assert cache.stats()['failures'] == 0
+
+
+def test_success_clears_remembered_failures(cache):
+    cache.put_failure(KEYS, 'private', 'This is a private video', ttl_seconds=60)
+
+    cache.put(KEYS[:1], INFO)
+
+    assert cache.get_failure(KEYS[0]) is None
+    # Keys the success wasn't stored under keep their failure
+    assert cache.get_failure(KEYS[1]) is not None
+
+
+def test_invalidate_forgets_failures_and_info(cache):
+    cache.put(KEYS, INFO)
+    cache.put_failure(['other'], 'forbidden', 'Access denied', ttl_seconds=60)
+
+    assert cache.invalidate(KEYS[1]) == 1
+    assert cache.get(KEYS[0]) is None
+    assert cache.invalidate('other') == 1
+    assert cache.get_failure('other') is None
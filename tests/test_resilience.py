@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+from utils.resilience import (CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded, ResilientCaller,
+                              is_transient)
+
+
+class Upstream:
+    """Callable that plays back a script of results and errors, the last one repeating"""
+
+    def __init__(self, *script, delays=(0.0,)):
+        self.script = list(script)
+        self.delays = list(delays)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            index = self.calls
+            self.calls += 1
+        time.sleep(self.delays[min(index, len(self.delays) - 1)])
+        outcome = self.script[min(index, len(self.script) - 1)]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def caller(**options):
+    options = {'deadline': 5, 'retries': 2, 'base_delay': 0.001, 'max_delay': 0.001, **options}
+    return ResilientCaller(**options)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen) as error:
+        breaker.before_call()
+    assert error.value.retry_after > 0
+
+
+def test_breaker_success_resets_the_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+    # The trial is still running: everyone else is turned away
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+@pytest.mark.parametrize('message, transient', [
+    ('HTTP Error 503: Service Unavailable', True),
+    ('HTTP Error 429: Too Many Requests', True),
+    ('Read timed out', True),
+    ('Connection reset by peer', True),
+    ('HTTP Error 404: Not Found', False),
+    ('This video is private', False),
+])
+def test_transient_errors(message, transient):
+    assert is_transient(Exception(message)) is transient
+
+
+def test_transient_errors_are_retried():
+    upstream = Upstream(Exception('HTTP Error 503'), Exception('Connection reset by peer'), 'info')
+
+    assert caller().call(upstream) == 'info'
+    assert upstream.calls == 3
+
+
+def test_permanent_errors_are_not_retried():
+    breaker = CircuitBreaker(failure_threshold=1)
+    upstream = Upstream(Exception('This video is private'))
+
+    with pytest.raises(Exception, match='private'):
+        caller(breaker=breaker).call(upstream)
+    assert upstream.calls == 1
+    # The upstream answered, so the breaker stays closed
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_run_out():
+    upstream = Upstream(Exception('HTTP Error 503'))
+
+    with pytest.raises(Exception, match='503'):
+        caller(retries=2).call(upstream)
+    assert upstream.calls == 3
+
+
+def test_open_breaker_rejects_without_calling():
+    upstream = Upstream(Exception('HTTP Error 503'))
+    resilient = caller(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60), retries=5)
+
+    with pytest.raises(CircuitOpen):
+        resilient.call(upstream)
+    assert upstream.calls == 2
+
+
+def test_deadline_abandons_a_slow_call():
+    upstream = Upstream('late', delays=(0.5,))
+    discarded = []
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        caller(deadline=0.1, retries=0).call(upstream, discard=discarded.append)
+    assert time.monotonic() - started < 0.4
+
+    # The abandoned attempt still finishes, and its result is released
+    time.sleep(0.6)
+    assert discarded == ['late']
+
+
+def test_slow_attempt_is_hedged():
+    resilient = caller(hedge_percentile=50, retries=0)
+    for _ in range(resilient.latency.min_samples):
+        resilient.latency.observe(0.01)
+    # The first attempt stalls; the hedge answers quickly
+    upstream = Upstream('slow', 'fast', delays=(0.5, 0.0))
+    discarded = []
+
+    started = time.monotonic()
+    assert resilient.call(upstream, discard=discarded.append) == 'fast'
+    assert time.monotonic() - started < 0.4
+    assert upstream.calls == 2
+
+    time.sleep(0.6)
+    assert discarded == ['slow']
+
+
+def test_no_hedge_without_latency_samples():
+    resilient = caller(hedge_percentile=50, retries=0)
+    upstream = Upstream('info', delays=(0.05,))
+
+    assert resilient.call(upstream) == 'info'
+    assert upstream.calls == 1
+
+
+def test_deadline_check():
+    deadline = Deadline(0.05, stage='Download')
+    deadline.check({'status': 'downloading'})
+    assert 0 < deadline.remaining() <= 0.05
+
+    time.sleep(0.06)
+    assert deadline.remaining() == 0
+    with pytest.raises(DeadlineExceeded, match='Download did not finish within 0.05s'):
+        deadline.check()
@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from fake_tiktok import FakeOrigin, make_payload
+from utils.segmented import RangeNotSupported, SegmentedDownloadError, SegmentedDownloader
+
+SIZE = 1024 * 1024
+# Doesn't divide SIZE, so the last segment is short
+SEGMENT_SIZE = 300 * 1024
+
+
+@pytest.fixture
+def ranged_origin():
+    with FakeOrigin(size=SIZE) as origin:
+        yield origin
+
+
+def media_url(origin):
+    return f'{origin.url}/media/1.mp4'
+
+
+def segmented(**options):
+    return SegmentedDownloader(**{'connections': 4, 'segment_size': SEGMENT_SIZE, 'min_size': 0, **options})
+
+
+def test_segments_cover_the_file():
+    assert segmented().segments(SIZE) == [
+        (0, 307199), (307200, 614399), (614400, 921599), (921600, 1048575)
+    ]
+
+
+def test_reassembles_byte_exact(ranged_origin, tmp_path):
+    file_path = tmp_path / 'video.mp4'
+    progress = []
+
+    written = segmented().download(media_url(ranged_origin), str(file_path), progress_hook=progress.append)
+
+    assert written == SIZE
+    assert file_path.read_bytes() == make_payload(SIZE)
+    # One probe plus one request per segment
+    assert ranged_origin.stats()['requests'] == 5
+    assert progress[-1]['status'] == 'finished'
+    assert progress[-2]['downloaded_bytes'] == SIZE
+
+
+def test_origin_without_ranges_is_detected_before_writing(tmp_path):
+    file_path = tmp_path / 'video.mp4'
+    with FakeOrigin(size=SIZE, ranges=False) as origin:
+        with pytest.raises(RangeNotSupported):
+            segmented().download(media_url(origin), str(file_path))
+
+    assert not file_path.exists()
+
+
+def test_small_files_are_not_split(ranged_origin, tmp_path):
+    with pytest.raises(RangeNotSupported):
+        segmented(min_size=SIZE + 1).download(media_url(ranged_origin), str(tmp_path / 'video.mp4'))
+
+
+def test_segment_answered_with_200_is_not_retried(ranged_origin, tmp_path):
+    downloader = segmented()
+    probe = downloader.probe
+
+    def probe_then_drop_ranges(url, headers):
+        size = probe(url, headers)
+        ranged_origin.ranges = False
+        return size
+
+    downloader.probe = probe_then_drop_ranges
+    with pytest.raises(RangeNotSupported):
+        downloader.download(media_url(ranged_origin), str(tmp_path / 'video.mp4'))
+    assert ranged_origin.stats()['requests'] <= 5
+
+
+def test_failed_segments_are_retried(ranged_origin, tmp_path):
+    file_path = tmp_path / 'video.mp4'
+    downloader = segmented(retries=6)
+    probe = downloader.probe
+
+    def probe_then_fail(url, headers):
+        size = probe(url, headers)
+        ranged_origin.error_rate = 0.4
+        return size
+
+    downloader.probe = probe_then_fail
+    downloader.download(media_url(ranged_origin), str(file_path))
+
+    assert file_path.read_bytes() == make_payload(SIZE)
+    assert ranged_origin.stats()['errors'] > 0
+    assert ranged_origin.stats()['requests'] == 5 + ranged_origin.stats()['errors']
+
+
+def test_segment_gives_up_after_its_retries(ranged_origin, tmp_path):
+    downloader = segmented(retries=1)
+    probe = downloader.probe
+
+    def probe_then_fail(url, headers):
+        size = probe(url, headers)
+        ranged_origin.error_rate = 1.0
+        return size
+
+    downloader.probe = probe_then_fail
+    with pytest.raises(SegmentedDownloadError):
+        downloader.download(media_url(ranged_origin), str(tmp_path / 'video.mp4'))
+
+
+VIDEO_URL = 'https://www.tiktok.com/@someone/video/7000000000000000001'
+
+
+@pytest.fixture
+def segmented_downloader(origin, cache_env, monkeypatch):
+    from utils.downloader import TikTokDownloader
+
+    origin.payload = make_payload(SIZE)
+    monkeypatch.setenv('SEGMENTED_DOWNLOADS', 'true')
+    monkeypatch.setenv('SEGMENT_SIZE', str(SEGMENT_SIZE))
+    monkeypatch.setenv('SEGMENTED_MIN_SIZE', '0')
+    return TikTokDownloader()
+
+
+def test_downloader_fetches_in_segments(segmented_downloader, origin):
+    result = segmented_downloader.download_video(VIDEO_URL)
+
+    assert result['success']
+    with open(result['file_path'], 'rb') as f:
+        assert f.read() == make_payload(SIZE)
+    assert origin.stats()['requests'] == 5
+
+
+def test_downloader_falls_back_to_a_single_stream(segmented_downloader, origin):
+    origin.ranges = False
+
+    result = segmented_downloader.download_video(VIDEO_URL)
+
+    assert result['success']
+    with open(result['file_path'], 'rb') as f:
+        assert f.read() == make_payload(SIZE)
+    # The probe, then yt-dlp's own download
+    assert origin.stats()['requests'] == 2
+    assert not [name for name in os.listdir(segmented_downloader.media_cache.directory) if name.endswith('.partial')]
@@ -0,0 +1,54 @@
+import pytest
+
+from utils import signing
+
+SECRET = 'secret'
+FILENAME = 'tiktok_7000000000000000001.mp4'
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def link():
+    return signing.sign(SECRET, FILENAME, 900, now=NOW)
+
+
+def test_valid_link(link):
+    expires, sig = link
+
+    assert expires == NOW + 900
+    assert signing.verify(SECRET, FILENAME, str(expires), sig, now=NOW) is None
+    assert signing.verify(SECRET, FILENAME, str(expires), sig, now=NOW + 900) is None
+
+
+def test_expired_link(link):
+    expires, sig = link
+
+    assert signing.verify(SECRET, FILENAME, str(expires), sig, now=NOW + 901) == 'expired'
+
+
+@pytest.mark.parametrize('filename, expires, sig', [
+    ('tiktok_7000000000000000002.mp4', None, None),  # Another file
+    (FILENAME, str(NOW + 9000), None),  # Extended expiry
+    (FILENAME, None, 'AAAAAAAAAAAAAAAAAAAAAA'),  # Forged signature
+    (FILENAME, None, ''),  # Missing signature
+    (FILENAME, '', None),  # Missing expiry
+    (FILENAME, '-1', None),
+])
+def test_tampered_links_are_invalid(link, filename, expires, sig):
+    valid_expires, valid_sig = link
+    expires = str(valid_expires) if expires is None else expires
+    sig = valid_sig if sig is None else sig
+
+    assert signing.verify(SECRET, filename, expires, sig, now=NOW) == 'invalid'
+
+
+def test_other_secret_is_invalid(link):
+    expires, sig = link
+
+    assert signing.verify('other', FILENAME, str(expires), sig, now=NOW) == 'invalid'
+
+
+def test_tampered_expired_link_is_invalid_not_expired(link):
+    expires, sig = link
+
+    assert signing.verify(SECRET, FILENAME, str(expires), sig[:-1] + 'A', now=NOW + 901) == 'invalid'
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from utils.storage import LocalStorage, SharedStorage, open_storage
+
+
+@pytest.fixture(params=[LocalStorage, SharedStorage])
+def storage(request, tmp_path):
+    return request.param(str(tmp_path / 'storage'))
+
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / 'tiktok_1.mp4'
+    path.write_bytes(b'video' * 1000)
+    return str(path)
+
+
+def test_put_and_get(storage, media, tmp_path):
+    storage.put(media)
+    dest = tmp_path / 'copy.mp4'
+
+    assert storage.exists('tiktok_1.mp4')
+    assert storage.get('tiktok_1.mp4', str(dest))
+    assert dest.read_bytes() == b'video' * 1000
+
+
+def test_files_fan_out_into_buckets(storage, media):
+    storage.put(media)
+    path = storage.path('tiktok_1.mp4')
+
+    assert os.path.dirname(os.path.dirname(path)) == storage.directory
+    assert len(os.path.basename(os.path.dirname(path))) == 2
+    assert os.path.exists(path)
+
+
+def test_get_missing_file(storage, tmp_path):
+    dest = tmp_path / 'copy.mp4'
+
+    assert not storage.get('tiktok_2.mp4', str(dest))
+    assert not storage.exists('tiktok_2.mp4')
+
+
+def test_put_leaves_a_stored_file_alone(storage, media):
+    storage.put(media)
+    stored = storage.path('tiktok_1.mp4')
+    mtime = os.stat(stored).st_mtime_ns
+
+    storage.put(media)
+
+    assert os.stat(stored).st_mtime_ns == mtime
+    # No temporary files left behind
+    assert os.listdir(os.path.dirname(stored)) == ['tiktok_1.mp4']
+
+
+def test_remove(storage, media):
+    storage.put(media)
+
+    assert storage.remove('tiktok_1.mp4')
+    assert not storage.remove('tiktok_1.mp4')
+    assert not storage.exists('tiktok_1.mp4')
+
+
+def test_open_storage(tmp_path):
+    assert open_storage(None, None) is None
+    assert open_storage('none', str(tmp_path)) is None
+    assert isinstance(open_storage('shared', str(tmp_path)), SharedStorage)
+    assert type(open_storage(' Local ', str(tmp_path))) is LocalStorage
+    with pytest.raises(ValueError):
+        open_storage('s3', str(tmp_path))
+    with pytest.raises(ValueError):
+        open_storage('local', '')
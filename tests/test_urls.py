@@ -0,0 +1,49 @@
+import pytest
+
+from utils.urls import CanonicalUrl, canonicalize, video_key
+
+VIDEO = CanonicalUrl('video', 'video:7000000000000000001', '7000000000000000001')
+
+
+@pytest.mark.parametrize('url, expected', [
+    # /@user/video/<id>: the user, www., scheme, query and fragment don't matter
+    ('https://www.tiktok.com/@someone/video/7000000000000000001', VIDEO),
+    ('https://tiktok.com/@someone/video/7000000000000000001', VIDEO),
+    ('http://www.tiktok.com/@some.one_else/video/7000000000000000001', VIDEO),
+    ('https://www.tiktok.com/@some-one/video/7000000000000000001/', VIDEO),
+    ('https://www.tiktok.com/@someone/video/7000000000000000001?is_from_webapp=1&sender_device=pc', VIDEO),
+    ('https://www.tiktok.com/@someone/video/7000000000000000001?_r=1&_t=8abc#comments', VIDEO),
+    ('  https://www.tiktok.com/@someone/video/7000000000000000001  ', VIDEO),
+    # Mobile hosts
+    ('https://m.tiktok.com/v/7000000000000000001', VIDEO),
+    ('https://m.tiktok.com/v/7000000000000000001.html?u_code=abc', VIDEO),
+    # Short links resolve later; the token is the key
+    ('https://vm.tiktok.com/ZMabc123/', CanonicalUrl('short', 'short:vm/ZMabc123', None)),
+    ('https://vm.tiktok.com/ZMabc123', CanonicalUrl('short', 'short:vm/ZMabc123', None)),
+    ('https://vm.tiktok.com/ZMabc123/?k=1', CanonicalUrl('short', 'short:vm/ZMabc123', None)),
+    ('https://vt.tiktok.com/ZS-abc_12/', CanonicalUrl('short', 'short:vt/ZS-abc_12', None)),
+    ('https://www.tiktok.com/t/ZTabc123/', CanonicalUrl('short', 'short:t/ZTabc123', None)),
+    ('https://tiktok.com/t/ZTabc123', CanonicalUrl('short', 'short:t/ZTabc123', None)),
+    # Other pages on tiktok.com
+    ('https://www.tiktok.com/@someone/photo/7000000000000000001/',
+     CanonicalUrl('page', 'page:/@someone/photo/7000000000000000001', None)),
+    # Not TikTok video URLs
+    ('https://www.youtube.com/watch?v=abc', None),
+    ('https://tiktok.com.evil.example/@someone/video/1', None),
+    ('https://eviltiktok.com/@someone/video/7000000000000000001', None),
+    ('ftp://www.tiktok.com/@someone/video/7000000000000000001', None),
+    ('www.tiktok.com/@someone/video/7000000000000000001', None),
+    ('', None),
+    (None, None),
+])
+def test_canonicalize(url, expected):
+    assert canonicalize(url) == expected
+
+
+def test_every_spelling_shares_one_key():
+    spellings = [
+        'https://www.tiktok.com/@someone/video/7000000000000000001',
+        'https://tiktok.com/@other/video/7000000000000000001?lang=en',
+        'https://m.tiktok.com/v/7000000000000000001',
+    ]
+    assert {canonicalize(url).key for url in spellings} == {video_key('7000000000000000001')}
@@ -0,0 +1,266 @@
+import os
+import time
+import fcntl
+import random
+import sqlite3
+import logging
+import threading
+from typing import Callable, Optional
+from utils.db import SQLiteStore
+
+
+class AdmissionDenied(Exception):
+    """Raised when a request is over its rate limit or the server is at capacity"""
+
+    def __init__(self, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBuckets(SQLiteStore):
+    """
+    Per-client token buckets shared by all workers
+
+    Each client gets ``burst`` tokens that refill at ``rate`` per second;
+    a request spends one, a batch one per video. Buckets live in SQLite so
+    a client is limited the same no matter which worker it lands on.
+    """
+
+    # Fraction of admitted requests that also prune idle buckets
+    PRUNE_PROBABILITY = 0.01
+
+    def __init__(self, db_path: str, rate: float, burst: float, clock: Callable[[], float] = time.time):
+        super().__init__(db_path)
+        self.logger = logging.getLogger(__name__)
+        self.rate = rate
+        self.burst = burst
+        # Wall-clock time, shared by every worker; replaceable in tests
+        self.clock = clock
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    client TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def take(self, client: str, cost: float = 1) -> float:
+        """
+        Spend tokens from a client's bucket
+
+        A cost above ``burst`` could never be paid up front; it is
+        admitted once the bucket is full and leaves it in debt, so the
+        client waits as long afterwards as the tokens take to refill.
+
+        Args:
+            client (str): Client identifier, e.g. the remote address
+            cost (float): Tokens the request costs
+
+        Returns:
+            float: 0 if admitted, otherwise seconds until enough tokens refill
+        """
+        now = self.clock()
+        try:
+            conn = self._connect()
+            with conn:
+                # Take the write lock up front so read-modify-write is atomic
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE client = ?", (client,)
+                ).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                needed = min(cost, self.burst)
+                if tokens < needed:
+                    return (needed - tokens) / self.rate
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (client, tokens, updated_at) VALUES (?, ?, ?)",
+                    (client, tokens - cost, now)
+                )
+                if random.random() < self.PRUNE_PROBABILITY:
+                    # Buckets idle this long are full again; dropping them is free
+                    conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.burst / self.rate,))
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter shouldn't take the site down
+            self.logger.error(f"Rate limiter error for {client}: {str(e)}")
+        return 0.0
+
+
+class Slot:
+    """One held unit of a ``ConcurrencyLimit``; release it exactly when done"""
+
+    def __init__(self, limit: 'ConcurrencyLimit', fd: int):
+        self._limit = limit
+        self._fd: Optional[int] = fd
+
+    def release(self) -> None:
+        """Give the slot back (idempotent)"""
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+            self._limit._released()
+
+    def __enter__(self) -> 'Slot':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class ConcurrencyLimit:
+    """
+    Global cap on concurrent work across all worker processes
+
+    Each of the ``limit`` slots is a file in ``lock_dir``; holding a slot
+    means holding a non-blocking exclusive flock() on it. The kernel drops
+    the lock if a worker dies, so a crashed or killed worker never leaks
+    capacity.
+    """
+
+    def __init__(self, lock_dir: str, limit: int):
+        os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.limit = limit
+        self._guard = threading.Lock()
+        self._held = 0
+
+    # Seconds between attempts while waiting for a slot
+    POLL_INTERVAL = 0.25
+
+    def acquire(self, timeout: Optional[float] = 0) -> Optional[Slot]:
+        """
+        Take a free slot
+
+        Args:
+            timeout (float): Seconds to wait for a slot to free up; 0 to
+                not wait, None to wait as long as it takes
+
+        Returns:
+            Slot: Held slot, or None if every slot stayed taken
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self._try_acquire()
+            if slot is not None or (deadline is not None and time.monotonic() >= deadline):
+                return slot
+            time.sleep(self.POLL_INTERVAL)
+
+    def _try_acquire(self) -> Optional[Slot]:
+        # Start at a random slot so workers don't all contend on slot 0
+        first = random.randrange(self.limit)
+        for i in range(self.limit):
+            path = os.path.join(self.lock_dir, f"slot-{(first + i) % self.limit}.lock")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            with self._guard:
+                self._held += 1
+            return Slot(self, fd)
+        return None
+
+    def _released(self) -> None:
+        with self._guard:
+            self._held -= 1
+
+    def stats(self) -> dict:
+        """
+        Get this worker's view of the limit
+
+        Returns:
+            dict: Global limit and slots held by this process
+        """
+        with self._guard:
+            return {'limit': self.limit, 'held': self._held}
+
+
+class AdmissionControl:
+    """
+    Gate in front of downloads: per-client rate limit plus global capacity
+
+    Either part may be None to disable it. Over-limit requests fail fast
+    with ``AdmissionDenied`` so they can be answered with a 429 instead of
+    tying up a worker until gunicorn's timeout kills it.
+    """
+
+    def __init__(self, buckets: Optional[TokenBuckets], limit: Optional[ConcurrencyLimit],
+                 busy_retry_after: float = 5):
+        self.buckets = buckets
+        self.limit = limit
+        self.busy_retry_after = busy_retry_after
+
+    def check_rate(self, client: str, cost: float = 1) -> None:
+        """
+        Spend a client's tokens without taking a capacity slot
+
+        Raises:
+            AdmissionDenied: If the client is over its rate limit
+        """
+        if self.buckets is None:
+            return
+        wait = self.buckets.take(client, cost)
+        if wait > 0:
+            raise AdmissionDenied(f"Rate limit exceeded for {client}", wait, 'rate')
+
+    def admit(self, client: str) -> Optional[Slot]:
+        """
+        Admit one download
+
+        Args:
+            client (str): Client identifier, e.g. the remote address
+
+        Returns:
+            Slot: Capacity slot to release when the download is done,
+            or None if there is no global limit
+
+        Raises:
+            AdmissionDenied: If the client is over its rate limit or every slot is taken
+        """
+        slot = self.take_slot()
+
+        # Capacity first, so a request turned away as busy keeps its tokens
+        try:
+            self.check_rate(client)
+        except AdmissionDenied:
+            if slot is not None:
+                slot.release()
+            raise
+        return slot
+
+    def take_slot(self) -> Optional[Slot]:
+        """
+        Take a capacity slot without charging any client's rate limit
+
+        Returns:
+            Slot: Capacity slot to release when the download is done,
+            or None if there is no global limit
+
+        Raises:
+            AdmissionDenied: If every slot is taken
+        """
+        if self.limit is None:
+            return None
+        slot = self.limit.acquire()
+        if slot is None:
+            raise AdmissionDenied(
+                f"All {self.limit.limit} download slots are busy", self.busy_retry_after, 'capacity'
+            )
+        return slot
+
+    def stats(self) -> dict:
+        """
+        Get admission settings and this worker's capacity usage
+
+        Returns:
+            dict: Rate limit settings and global slot usage
+        """
+        return {
+            'rate_per_second': self.buckets.rate if self.buckets else None,
+            'burst': self.buckets.burst if self.buckets else None,
+            'slots': self.limit.stats() if self.limit else None,
+        }
@@ -0,0 +1,128 @@
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional, Tuple
+
+# Brotli is optional: without it assets are served gzip or uncompressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth fingerprinting; everything else stays under /static
+ASSET_EXTENSIONS = ('.css', '.js', '.svg')
+
+# Smaller files don't gain enough from compression to be worth it
+MIN_COMPRESS_SIZE = 512
+
+# Preferred encoding first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# mtime=0 keeps gzip output identical from build to build
+COMPRESSORS = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=11)
+
+
+class AssetManifest:
+    """
+    Fingerprinted, precompressed copies of the static assets
+
+    ``build`` copies each asset to ``<name>.<hash>.<ext>`` in ``build_dir``,
+    next to gzip and (if available) brotli versions, so they can be served
+    with immutable caching and without compressing per request. Names are
+    content hashes, so workers or instances building at the same time
+    write identical files.
+    """
+
+    def __init__(self, static_dir: str, build_dir: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self.static_dir = static_dir
+        self.build_dir = build_dir or os.path.join(tempfile.gettempdir(), 'tiktok-assets')
+        # logical path -> fingerprinted path, and fingerprinted path -> encodings on disk
+        self.paths: Dict[str, str] = {}
+        self.encodings: Dict[str, Tuple[str, ...]] = {}
+
+    def build(self) -> 'AssetManifest':
+        """
+        Fingerprint and compress every asset under ``static_dir``
+
+        Returns:
+            AssetManifest: self, for chaining
+        """
+        os.makedirs(self.build_dir, exist_ok=True)
+        for root, _, files in os.walk(self.static_dir):
+            for name in sorted(files):
+                if not name.endswith(ASSET_EXTENSIONS):
+                    continue
+                source = os.path.join(root, name)
+                logical = os.path.relpath(source, self.static_dir).replace(os.sep, '/')
+                try:
+                    self._build_one(logical, source)
+                except OSError as e:
+                    # The asset is still served unhashed from /static
+                    self.logger.error(f"Failed to build asset {logical}: {str(e)}")
+
+        self.logger.info(f"Built {len(self.paths)} static assets into {self.build_dir}")
+        return self
+
+    def _build_one(self, logical: str, source: str) -> None:
+        with open(source, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(logical)
+        hashed = f"{stem}.{digest}{ext}"
+        target = os.path.join(self.build_dir, hashed)
+
+        encodings = ()
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self._write(target, data)
+        if len(data) >= MIN_COMPRESS_SIZE:
+            for encoding, suffix in ENCODINGS:
+                if encoding not in COMPRESSORS:
+                    continue
+                if not os.path.exists(target + suffix):
+                    self._write(target + suffix, COMPRESSORS[encoding](data))
+                encodings += (encoding,)
+
+        self.paths[logical] = hashed
+        self.encodings[hashed] = encodings
+
+    def _write(self, path: str, data: bytes) -> None:
+        # Write-then-rename so a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def hashed(self, logical: str) -> Optional[str]:
+        """Fingerprinted path of an asset, or None if it wasn't built"""
+        return self.paths.get(logical)
+
+    def resolve(self, hashed: str, accepted) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Pick the file to send for a fingerprinted asset
+
+        Args:
+            hashed (str): Fingerprinted path, as handed out by ``hashed``
+            accepted: The request's Accept-Encoding (werkzeug ``Accept``)
+
+        Returns:
+            tuple: File path and content encoding (None for identity), or
+            None if there is no such asset
+        """
+        encodings = self.encodings.get(hashed)
+        if encodings is None:
+            return None
+        path = os.path.join(self.build_dir, hashed)
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and accepted.quality(encoding) > 0:
+                return path + suffix, encoding
+        return path, None
@@ -0,0 +1,168 @@
+import io
+import os
+import json
+import time
+import logging
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from utils.admission import ConcurrencyLimit
+from utils.formats import BEST, Tier
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Manifest error for videos the batch ran out of time for
+TOO_LONG = 'The batch took too long for this video. Please download it separately'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable buffer that zipfile streams the archive into"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _finished(futures: Iterable[Future], ends_at: float) -> Iterator[Future]:
+    """Futures as they complete, until ``ends_at`` (a monotonic time)"""
+    try:
+        for future in as_completed(futures, timeout=max(0.0, ends_at - time.monotonic())):
+            if time.monotonic() >= ends_at:
+                return
+            yield future
+    except FuturesTimeout:
+        return
+
+
+def _download(downloader, url: str, tier: Tier, limit: Optional[ConcurrencyLimit],
+              slot_wait: float, ends_at: float) -> Dict[str, Any]:
+    # Nothing started after the deadline would make it into the archive
+    remaining = ends_at - time.monotonic()
+    if remaining <= 0:
+        return {'success': False, 'error': TOO_LONG}
+    # Each video takes a global download slot, like a single download
+    # does, unless it is already cached
+    if limit is None:
+        return downloader.download_video(url, tier=tier)
+    cached = downloader.cached_file(url, tier)
+    if cached:
+        return cached
+    slot = limit.acquire(timeout=min(slot_wait, remaining))
+    if slot is None:
+        return {'success': False, 'error': 'The server is busy right now. Please try again later'}
+    with slot:
+        return downloader.download_video(url, tier=tier)
+
+
+def stream_zip(downloader, urls: List[str], parallelism: int = 4, tier: Tier = BEST,
+               limit: Optional[ConcurrencyLimit] = None, slot_wait: float = 30,
+               deadline: float = 60) -> Iterator[bytes]:
+    """
+    Download many videos concurrently and stream them out as one ZIP
+
+    Entries are written as soon as each download finishes, so the archive
+    is never staged in memory or on disk; only the current copy chunk is
+    buffered. Videos are stored uncompressed (MP4 doesn't shrink) and a
+    ``manifest.json`` entry at the end lists every URL with its outcome,
+    so one bad URL doesn't abort the batch.
+
+    The whole archive is produced inside one request, so it has to end
+    before the server's worker timeout. Videos not written by
+    ``deadline`` are listed as failed and the archive is closed.
+
+    Args:
+        downloader (TikTokDownloader): Downloader to fetch videos with
+        urls (list): TikTok video URLs
+        parallelism (int): Maximum concurrent downloads
+        tier (Tier): Quality tier for every video
+        limit (ConcurrencyLimit): Global download slots, if capped
+        slot_wait (float): Seconds a video waits for a slot before it is
+            recorded as failed
+        deadline (float): Seconds after which no more videos are added
+
+    Yields:
+        bytes: Consecutive pieces of the ZIP archive
+    """
+    sink = _ChunkSink()
+    manifest: List[Dict[str, Any]] = []
+    written = set()
+    ends_at = time.monotonic() + deadline
+
+    executor = ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix='batch-download')
+    try:
+        futures = {
+            executor.submit(_download, downloader, url, tier, limit, slot_wait, ends_at): url
+            for url in urls
+        }
+        unfinished = set(futures)
+
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for future in _finished(futures, ends_at):
+                unfinished.discard(future)
+                url = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Batch download crashed for {url}: {str(e)}")
+                    result = {'success': False, 'error': 'An unexpected error occurred'}
+
+                if not result['success']:
+                    manifest.append({'url': url, 'status': 'failed', 'error': result['error']})
+                    continue
+
+                filename = result['filename']
+                if filename in written:
+                    # Two URLs for the same video; the file is already in the archive
+                    manifest.append({'url': url, 'status': 'ok', 'file': filename})
+                    continue
+
+                lease = downloader.media_cache.acquire(filename)
+                if lease is None:
+                    manifest.append({'url': url, 'status': 'failed', 'error': 'File expired before it could be sent'})
+                    continue
+
+                with lease:
+                    zinfo = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                    zinfo.file_size = os.fstat(lease.fileno()).st_size
+                    with zf.open(zinfo, 'w') as entry:
+                        for chunk in iter(lambda: lease.read(COPY_CHUNK_SIZE), b''):
+                            entry.write(chunk)
+                            yield sink.drain()
+
+                written.add(filename)
+                manifest.append({'url': url, 'status': 'ok', 'file': filename})
+                yield sink.drain()
+
+            if unfinished:
+                logger.warning(f"Batch deadline passed with {len(unfinished)} of {len(urls)} videos left")
+                for future, url in futures.items():
+                    if future in unfinished:
+                        manifest.append({'url': url, 'status': 'failed', 'error': TOO_LONG})
+
+            succeeded = sum(1 for item in manifest if item['status'] == 'ok')
+            zf.writestr('manifest.json', json.dumps({
+                'total': len(urls),
+                'succeeded': succeeded,
+                'failed': len(urls) - succeeded,
+                'items': manifest,
+            }, indent=2))
+
+        yield sink.drain()
+    finally:
+        # Stop queued downloads if the client went away or time ran out
+        executor.shutdown(wait=False, cancel_futures=True)
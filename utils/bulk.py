@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Set, TextIO
+from utils.formats import BEST, Tier
+from utils.urls import CanonicalUrl, canonicalize, video_key
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+def read_urls(lines: Iterable[str]) -> List[str]:
+    """
+    URLs from a text file, one per line
+
+    Blank lines and ``#`` comments are skipped, so lists can be annotated.
+    """
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return urls
+
+
+class Manifest:
+    """
+    Append-only JSONL record of a bulk run, one line per finished URL
+
+    Reopening the same manifest resumes the run: videos recorded as
+    ``ok`` are skipped, failures are tried again. Each line is flushed as
+    soon as it is written, so an interrupted run loses at most the
+    downloads that were in flight; a torn last line is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Canonical keys (and resolved video keys) of finished videos
+        self.completed: Set[str] = set()
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('status') == 'ok':
+                        self.completed.update(key for key in (entry.get('key'), entry.get('video_key')) if key)
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, *keys: Optional[str]) -> bool:
+        with self._lock:
+            return any(key in self.completed for key in keys if key)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Append one outcome and make it durable before returning"""
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if entry.get('status') == 'ok':
+                self.completed.update(key for key in (entry.get('key'), entry.get('video_key')) if key)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Progress:
+    """Counts outcomes and prints throughput and ETA at most every ``interval`` seconds"""
+
+    def __init__(self, total: int, stream: TextIO = sys.stderr, interval: float = PROGRESS_INTERVAL):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.started = time.monotonic()
+        self.counts = {'ok': 0, 'failed': 0, 'skipped': 0}
+        self.bytes = 0
+        self._last_print = self.started
+        self._lock = threading.Lock()
+
+    def add(self, status: str, size: int = 0) -> None:
+        with self._lock:
+            self.counts[status] += 1
+            self.bytes += size
+            now = time.monotonic()
+            if now - self._last_print >= self.interval:
+                self._last_print = now
+                self.stream.write(self.line() + '\n')
+                self.stream.flush()
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        # Skips are free; only real work says how fast the rest will go
+        worked = self.counts['ok'] + self.counts['failed']
+        done = worked + self.counts['skipped']
+        rate = worked / elapsed
+        remaining = self.total - done
+        eta = format_duration(remaining / rate) if rate > 0 else '?'
+        return (f"[{done}/{self.total}] {self.counts['ok']} ok, {self.counts['failed']} failed, "
+                f"{self.counts['skipped']} skipped | {rate:.2f} videos/s, "
+                f"{self.bytes / elapsed / 1024 ** 2:.2f} MB/s | elapsed {format_duration(elapsed)}, ETA {eta}")
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def _copy_out(downloader, filename: str, output_dir: str) -> Optional[int]:
+    """
+    Copy a finished download out of the media cache, which may evict it
+
+    Returns:
+        int: Bytes copied, or None if the file left the cache first
+    """
+    lease = downloader.media_cache.acquire(filename)
+    if lease is None:
+        return None
+    with lease:
+        # Write-then-rename so an interrupted copy never looks finished
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(lease, out, COPY_CHUNK_SIZE)
+            os.replace(tmp_path, os.path.join(output_dir, filename))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return os.fstat(lease.fileno()).st_size
+
+
+def _resolved_key(downloader, canonical: CanonicalUrl) -> Optional[str]:
+    """Video key for a URL, if it is known without network access"""
+    if canonical.video_id:
+        return video_key(canonical.video_id)
+    info = downloader.metadata_cache.get(canonical.key)
+    return video_key(info['id']) if info and info.get('id') else None
+
+
+def archive(downloader, urls: List[str], output_dir: str, manifest: Manifest, concurrency: int = 4,
+            tier: Tier = BEST, progress: Optional[Progress] = None, keep_cache: bool = True) -> Dict[str, int]:
+    """
+    Download a list of videos into a directory, resumably
+
+    URLs are deduplicated by canonical key before anything is fetched,
+    and again by video id once short links resolve. Videos the manifest
+    already has as ``ok`` are skipped. Every outcome is appended to the
+    manifest as soon as it is known.
+
+    Args:
+        downloader (TikTokDownloader): Downloader to fetch videos with
+        urls (list): TikTok video URLs
+        output_dir (str): Where finished videos are copied to
+        manifest (Manifest): Record of this and earlier runs
+        concurrency (int): Maximum concurrent downloads
+        tier (Tier): Quality tier for every video
+        progress (Progress): Optional progress reporter
+        keep_cache (bool): Leave copied videos in the media cache (trimmed
+            to its budget); False deletes each one once it is copied
+
+    Returns:
+        dict: Counts of ``ok``, ``failed`` and ``skipped`` URLs
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    progress = progress or Progress(len(urls))
+
+    def skip(url: str, reason: str) -> None:
+        logger.debug(f"Skipping {url}: {reason}")
+        progress.add('skipped')
+
+    pending: Dict[str, str] = {}
+    for url in urls:
+        canonical = canonicalize(url)
+        if canonical is None:
+            manifest.record({'url': url, 'status': 'failed', 'error': 'Invalid TikTok URL format',
+                             'finished_at': time.time()})
+            progress.add('failed')
+        elif canonical.key in pending or manifest.is_done(canonical.key, _resolved_key(downloader, canonical)):
+            skip(url, 'duplicate or already archived')
+        else:
+            pending[canonical.key] = url
+
+    def one(key: str, url: str) -> Dict[str, Any]:
+        entry = {'url': url, 'key': key}
+        result = downloader.download_video(url, tier=tier)
+        if not result['success']:
+            return {**entry, 'status': 'failed', 'error': result['error']}
+
+        info = downloader.metadata_cache.get(key) or {}
+        entry['video_key'] = video_key(info['id']) if info.get('id') else None
+        if entry['video_key'] != key and manifest.is_done(entry['video_key']):
+            # A short link to a video that is already archived
+            return {**entry, 'status': 'skipped'}
+
+        size = _copy_out(downloader, result['filename'], output_dir)
+        # The copy is what's kept; don't let the cache grow past its budget
+        if keep_cache:
+            downloader.media_cache.reap()
+        else:
+            downloader.media_cache.discard(result['filename'])
+        if size is None:
+            return {**entry, 'status': 'failed', 'error': 'File expired before it could be copied'}
+        return {**entry, 'status': 'ok', 'file': result['filename'], 'bytes': size,
+                'title': (result.get('video_info') or {}).get('title')}
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='bulk-download')
+    futures = {}
+    try:
+        futures = {executor.submit(one, key, url): (key, url) for key, url in pending.items()}
+        for future in as_completed(futures):
+            key, url = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                logger.error(f"Bulk download crashed for {url}: {str(e)}")
+                entry = {'url': url, 'key': key, 'status': 'failed', 'error': 'An unexpected error occurred'}
+
+            if entry['status'] == 'skipped':
+                skip(url, 'already archived')
+                continue
+            manifest.record({**entry, 'finished_at': time.time()})
+            progress.add(entry['status'], entry.get('bytes', 0))
+    except BaseException:
+        running = sum(future.running() for future in futures)
+        if running:
+            logger.warning(f"Waiting for {running} running downloads to stop")
+        raise
+    finally:
+        # On Ctrl-C, drop what hasn't started; finished work is in the
+        # manifest. Running downloads can't be interrupted, so wait for
+        # them: the caller may remove the cache they are writing to
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return dict(progress.counts)
@@ -0,0 +1,121 @@
+import os
+import json
+import shutil
+import logging
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, Optional
+from utils.hashring import HashRing
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class PeerRefused(Exception):
+    """The owning node answered but could not produce the video"""
+
+
+def parse_nodes(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parse ``CLUSTER_NODES``: comma-separated ``node_id=base_url`` pairs
+
+    Example: ``a=http://10.0.0.1:5000,b=http://10.0.0.2:5000``
+    """
+    nodes = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        node_id, sep, base_url = item.partition('=')
+        if not sep or not node_id.strip() or not base_url.strip():
+            raise ValueError(f"Invalid CLUSTER_NODES entry: {item!r}")
+        nodes[node_id.strip()] = base_url.strip().rstrip('/')
+    return nodes
+
+
+class Cluster:
+    """
+    Which node owns which video, and fetching from the owner
+
+    Video ids are spread over the nodes with a consistent-hash ring. A
+    node asked for a video it doesn't own fetches the file from the owner
+    (``/internal/media``), which downloads it at most once for the whole
+    cluster, instead of going to TikTok itself.
+    """
+
+    def __init__(self, node_id: str, nodes: Dict[str, str], secret: str, timeout: float = 60,
+                 vnodes: int = 128):
+        self.logger = logging.getLogger(__name__)
+        if node_id not in nodes:
+            raise ValueError(f"NODE_ID {node_id!r} is not one of CLUSTER_NODES")
+        self.node_id = node_id
+        self.nodes = nodes
+        self.secret = secret
+        self.timeout = timeout
+        self.ring = HashRing(nodes, vnodes)
+        if not secret:
+            self.logger.warning("CLUSTER_SECRET is not set; nodes will fetch from upstream instead of each other")
+
+    def owner(self, video_id: str) -> str:
+        return self.ring.owner(video_id)
+
+    def is_local(self, video_id: str) -> bool:
+        """Whether this node owns a video"""
+        return self.owner(video_id) == self.node_id
+
+    def fetch(self, url: str, video_id: str, quality: str, dest_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Have the owning node produce a video and copy it here
+
+        Args:
+            url (str): TikTok video URL
+            video_id (str): Video id, which picks the owner
+            quality (str): Quality tier key
+            dest_path (str): Where to write the file; the caller publishes it
+
+        Returns:
+            dict: Video info sent by the owner, or None if the owner could
+            not be reached (the caller falls back to upstream)
+
+        Raises:
+            PeerRefused: If the owner answered with an error for this video
+        """
+        if not self.secret:
+            return None
+        owner = self.owner(video_id)
+        query = urllib.parse.urlencode({'url': url, 'quality': quality})
+        request = urllib.request.Request(f"{self.nodes[owner]}/internal/media?{query}", headers={
+            'Authorization': f"Bearer {self.secret}",
+            'X-Cluster-Node': self.node_id,
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response, open(dest_path, 'wb') as f:
+                shutil.copyfileobj(response, f, COPY_CHUNK_SIZE)
+                info = response.headers.get('X-Video-Info')
+            return json.loads(info) if info else {}
+        except urllib.error.HTTPError as e:
+            # 422 is the owner's answer for this video; anything else is about the owner
+            if e.code == 422:
+                try:
+                    message = json.loads(e.read()).get('error')
+                except ValueError:
+                    message = None
+                raise PeerRefused(message or f"Node {owner} answered {e.code}") from e
+            self.logger.warning(f"Fetching {video_id} from node {owner} failed: HTTP {e.code}")
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Fetching {video_id} from node {owner} failed: {str(e)}")
+
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cluster membership
+
+        Returns:
+            dict: This node, all nodes and each node's share of the ring
+        """
+        return {'node': self.node_id, 'nodes': sorted(self.nodes), 'share': self.ring.share()}
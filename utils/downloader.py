@@ -1,10 +1,70 @@
 import os
+import sys
+import shutil
 import tempfile
 import logging
-import re
+import threading
 from urllib.parse import urlparse
-import yt_dlp
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from utils import metrics
+from utils.cluster import Cluster, PeerRefused, parse_nodes
+from utils.media_cache import MediaCache
+from utils.engine import RemoteDownloadError
+from utils.formats import BEST, Tier, media_filename
+from utils.metadata_cache import MetadataCache
+from utils.resilience import CircuitBreaker, CircuitOpen, Deadline, ResilientCaller, UpstreamError
+from utils.singleflight import SingleFlight
+from utils.storage import open_storage
+from utils.streaming import follow_file, tee_to_file
+from utils.urls import CanonicalUrl, canonicalize, video_key
+
+def load_yt_dlp():
+    """
+    Import yt-dlp on first use
+    
+    yt-dlp is by far the heaviest import in the app, so it is kept off the
+    import path: workers that only serve cached files never load it, and
+    ``TikTokDownloader.warm`` loads it once in the gunicorn master so
+    forked workers share those pages copy-on-write.
+    """
+    import yt_dlp
+    return yt_dlp
+
+# How long each kind of extraction failure is remembered, in seconds.
+# Removed videos stay removed; a 403 is often a transient geo/CDN block
+NEGATIVE_CACHE_TTLS = {
+    'not_found': 24 * 3600,
+    'unavailable': 6 * 3600,
+    'age_restricted': 6 * 3600,
+    'private': 3600,
+    'forbidden': 60,
+}
+
+
+def parse_ttls(value: Optional[str]) -> Dict[str, float]:
+    """
+    Negative cache TTLs with overrides from a ``category=seconds,...`` string
+    
+    A TTL of 0 stops that category from being cached; categories missing
+    from both are never cached.
+    """
+    ttls = dict(NEGATIVE_CACHE_TTLS)
+    for item in (value or '').split(','):
+        category, _, seconds = item.partition('=')
+        if category.strip() and seconds.strip():
+            ttls[category.strip()] = float(seconds)
+    return {category: ttl for category, ttl in ttls.items() if ttl > 0}
+
+def yt_dlp_download_error():
+    """
+    yt-dlp's DownloadError for use in ``except`` clauses
+    
+    Also matches the same error raised on an extraction engine worker.
+    yt-dlp's own class is left out while yt-dlp has not been imported,
+    since nothing in this process could have raised it yet.
+    """
+    yt_dlp = sys.modules.get('yt_dlp')
+    return (yt_dlp.DownloadError, RemoteDownloadError) if yt_dlp else RemoteDownloadError
 
 class TikTokDownloader:
     """TikTok video downloader using yt-dlp"""
@@ -12,10 +72,90 @@ class TikTokDownloader:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
+        # Finished downloads, bounded by size and shared by all workers
+        self.media_cache = MediaCache(
+            os.environ.get('MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'tiktok-media')),
+            max_bytes=int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 2 * 1024 ** 3)),
+            max_age_hours=float(os.environ.get('MEDIA_CACHE_MAX_AGE_HOURS', 24))
+        )
+        
+        # Longer-lived copies of finished files behind the media cache;
+        # with the shared backend, every node's downloads are visible here
+        self.storage = open_storage(os.environ.get('MEDIA_STORAGE'), os.environ.get('MEDIA_STORAGE_DIR'))
+        
+        # With several nodes, each video id has an owning node; the others
+        # get the file from it instead of from TikTok
+        self.cluster = None
+        nodes = parse_nodes(os.environ.get('CLUSTER_NODES'))
+        if len(nodes) > 1:
+            self.cluster = Cluster(
+                os.environ.get('NODE_ID', ''),
+                nodes,
+                secret=os.environ.get('CLUSTER_SECRET', ''),
+                timeout=float(os.environ.get('CLUSTER_TIMEOUT', 60))
+            )
+        
+        # Coalesces concurrent downloads of the same video across workers
+        self.flight = SingleFlight(os.path.join(self.media_cache.directory, 'locks'))
+        
+        # extract_info results shared by all workers and across restarts
+        self.metadata_cache = MetadataCache(
+            os.environ.get('METADATA_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'tiktok-metadata.sqlite3')),
+            ttl_seconds=int(os.environ.get('METADATA_CACHE_TTL', 6 * 3600)),
+            max_entries=int(os.environ.get('METADATA_CACHE_MAX_ENTRIES', 10000))
+        )
+        
+        # Remembered failures for deleted/private/blocked videos, per category
+        self.negative_ttls = parse_ttls(os.environ.get('NEGATIVE_CACHE_TTLS'))
+        
+        # Deadline, jittered retries, circuit breaker and optional hedging
+        # around extraction, so a slow or failing TikTok can't hold every
+        # worker until gunicorn kills it
+        hedge_percentile = os.environ.get('EXTRACT_HEDGE_PERCENTILE')
+        self.upstream = ResilientCaller(
+            CircuitBreaker(
+                failure_threshold=int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5)),
+                reset_timeout=float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+            ),
+            deadline=float(os.environ.get('EXTRACT_DEADLINE', 30)),
+            retries=int(os.environ.get('EXTRACT_RETRIES', 2)),
+            hedge_percentile=float(hedge_percentile) if hedge_percentile else None
+        )
+        
+        # The media download can't be retried inside a request, but it
+        # gets a deadline too: extraction plus download must fit in the
+        # gunicorn timeout, or the worker is killed mid-write
+        self.download_deadline = float(os.environ.get('DOWNLOAD_DEADLINE', 80))
+        
+        # Optionally run yt-dlp in a pool of warm worker processes instead
+        # of in the web workers
+        self.engine = None
+        if os.environ.get('EXTRACTION_ENGINE', 'thread').lower() == 'process':
+            from utils.engine import ExtractionEngine
+            self.engine = ExtractionEngine(
+                workers=int(os.environ.get('ENGINE_WORKERS', 2)),
+                max_rss_bytes=int(os.environ.get('ENGINE_MAX_RSS_MB', 512)) * 1024 ** 2,
+                max_tasks=int(os.environ.get('ENGINE_MAX_TASKS', 500)),
+                extract_timeout=float(os.environ.get('ENGINE_EXTRACT_TIMEOUT', 60)),
+                download_timeout=float(os.environ.get('ENGINE_DOWNLOAD_TIMEOUT', 600)),
+                initializer=os.environ.get('ENGINE_WORKER_INIT') or None
+            )
+        
+        # Optional multi-connection fetch for direct-URL formats. requests is
+        # only imported when it is turned on, to keep it off the startup path
+        self.segmented = None
+        if os.environ.get('SEGMENTED_DOWNLOADS', 'false').lower() == 'true':
+            from utils.segmented import SegmentedDownloader
+            self.segmented = SegmentedDownloader(
+                connections=int(os.environ.get('SEGMENT_CONNECTIONS', 4)),
+                segment_size=int(os.environ.get('SEGMENT_SIZE', 4 * 1024 ** 2)),
+                min_size=int(os.environ.get('SEGMENTED_MIN_SIZE', 8 * 1024 ** 2))
+            )
+        
         # yt-dlp configuration for TikTok
         self.ydl_opts = {
-            'format': 'best[ext=mp4]/best',  # Prefer mp4 format
-            'outtmpl': os.path.join(tempfile.gettempdir(), 'tiktok_%(id)s.%(ext)s'),
+            'format': BEST.format,  # Prefer mp4 format; quality tiers override this
+            'outtmpl': os.path.join(self.media_cache.directory, 'tiktok_%(id)s.%(ext)s'),
             'writeinfojson': False,
             'writesubtitles': False,
             'writeautomaticsub': False,
@@ -25,6 +165,7 @@ class TikTokDownloader:
             'writethumbnail': False,
             'extract_flat': False,
             'cookiefile': None,
+            'socket_timeout': float(os.environ.get('UPSTREAM_SOCKET_TIMEOUT', 20)),  # Stalled reads fail instead of hanging
             'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'referer': 'https://www.tiktok.com/',
             'http_headers': {
@@ -37,6 +178,20 @@ class TikTokDownloader:
             }
         }
     
+    def warm(self) -> None:
+        """
+        Load yt-dlp and the TikTok extractor ahead of the first request
+        
+        Meant to run once in the gunicorn master (``preload_app``), before
+        workers are forked. With the process engine the web workers never
+        load yt-dlp, so there is nothing to warm here.
+        """
+        if self.engine is not None:
+            return
+        yt_dlp = load_yt_dlp()
+        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+            ydl.get_info_extractor('TikTok')
+    
     def is_valid_tiktok_url(self, url: str) -> bool:
         """
         Validate if the URL is a valid TikTok video URL
@@ -47,30 +202,9 @@ class TikTokDownloader:
         Returns:
             bool: True if valid TikTok URL, False otherwise
         """
-        if not url or not isinstance(url, str):
-            return False
-        
-        # Basic check: must contain tiktok domain
-        url_lower = url.strip().lower()
-        if not ('tiktok.com' in url_lower or 'vm.tiktok.com' in url_lower or 'vt.tiktok.com' in url_lower):
-            return False
-        
-        # TikTok URL patterns - more permissive
-        tiktok_patterns = [
-            r'^https?://(www\.)?tiktok\.com/@[\w.-]+/video/\d+',
-            r'^https?://vm\.tiktok\.com/[\w\-]+',
-            r'^https?://vt\.tiktok\.com/[\w\-]+',
-            r'^https?://m\.tiktok\.com/v/\d+',
-            r'^https?://(www\.)?tiktok\.com/t/[\w\-]+',
-            r'^https?://(www\.)?tiktok\.com/@[\w.-]+/video/\d+\?.*',
-            r'^https?://(www\.)?tiktok\.com/[\w\-@.\/]+',
-        ]
-        
-        for pattern in tiktok_patterns:
-            if re.match(pattern, url.strip()):
-                return True
-        
-        return False
+        # Single compiled pass; see utils.urls for the accepted shapes
+        with metrics.URL_VALIDATION_SECONDS.time():
+            return canonicalize(url) is not None
     
     def extract_video_info(self, url: str) -> Optional[Dict[str, Any]]:
         """
@@ -82,148 +216,733 @@ class TikTokDownloader:
         Returns:
             dict: Video information or None if failed
         """
+        canonical = None
         try:
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if info is None:
-                    return None
-                return {
-                    'title': info.get('title', 'TikTok Video'),
-                    'duration': info.get('duration', 0),
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'upload_date': info.get('upload_date', ''),
-                    'view_count': info.get('view_count', 0),
-                    'like_count': info.get('like_count', 0),
-                    'description': info.get('description', ''),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'id': info.get('id', ''),
-                    'ext': info.get('ext', 'mp4'),
-                    'filesize': info.get('filesize', 0),
-                }
+            canonical = canonicalize(url)
+            cached_info = self.metadata_cache.get(canonical.key) if canonical else None
+            if cached_info:
+                return cached_info
+            if canonical and self.metadata_cache.get_failure(canonical.key):
+                return None
+            
+            ydl, info = self._extract(url, self.ydl_opts)
+            ydl.close()
+            if info is None:
+                return None
+            return self.metadata_cache.put(self._cache_keys(url, info), info)
+        except yt_dlp_download_error() as e:
+            self.logger.error(f"Error extracting video info: {str(e)}")
+            self._remember_failure(canonical, str(e))
+            return None
         except Exception as e:
             self.logger.error(f"Error extracting video info: {str(e)}")
             return None
     
-    def download_video(self, url: str) -> Dict[str, Any]:
+    def cached_file(self, url: str, tier: Tier = BEST) -> Optional[Dict[str, Any]]:
+        """
+        Result for a video that is already in the media cache
+        
+        Needs no yt-dlp work or network access, so callers check it before
+        taking a download slot: serving a cached file shouldn't wait for,
+        or be turned away by, downloads in progress.
+        
+        Args:
+            url (str): TikTok video URL
+            tier (Tier): Quality tier
+            
+        Returns:
+            dict: Same shape as a successful ``download_video`` result, or
+            None if the video has to be downloaded
+        """
+        canonical = canonicalize(url)
+        info = self._known_info(canonical) if canonical else None
+        result = self._existing_file(info, tier) if info else None
+        if result:
+            metrics.CACHE_REQUESTS.labels('media', 'hit').inc()
+        return result
+    
+    def download_video(self, url: str, progress_hook: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       tier: Tier = BEST, local_only: bool = False) -> Dict[str, Any]:
         """
         Download TikTok video without watermark
         
         Args:
             url (str): TikTok video URL
+            progress_hook (callable): Optional yt-dlp progress hook
+            tier (Tier): Quality tier; each tier is cached as its own file
+            local_only (bool): Don't ask the owning node for the file (set
+                when serving a request another node routed here)
             
         Returns:
             dict: Download result with success status, file path, and error message
         """
+        canonical = None
         try:
             # Validate URL
-            if not self.is_valid_tiktok_url(url):
-                return {
-                    'success': False,
-                    'error': 'Invalid TikTok URL format',
-                    'file_path': None,
-                    'filename': None
-                }
+            canonical = canonicalize(url)
+            if canonical is None:
+                metrics.DOWNLOAD_ERRORS.labels('invalid_url').inc()
+                return self._failure('Invalid TikTok URL format')
             
             self.logger.info(f"Starting download for URL: {url}")
             
-            # Create temporary directory for downloads
-            temp_dir = tempfile.gettempdir()
+            # Serve an already-downloaded file without any upstream round trip
+            cached_info = self._known_info(canonical)
+            result = self._existing_file(cached_info, tier) if cached_info else None
+            metrics.CACHE_REQUESTS.labels('media', 'hit' if result else 'miss').inc()
+            if result:
+                return result
             
-            # Update output template with temporary directory
-            opts = self.ydl_opts.copy()
-            opts['outtmpl'] = os.path.join(temp_dir, 'tiktok_%(id)s.%(ext)s')
+            failure = self._cached_failure(canonical)
+            if failure:
+                return failure
+            
+            if cached_info and canonical.video_id:
+                # The id is known offline, so take the lock before extracting:
+                # concurrent callers wait for one extraction and download
+                # instead of each extracting before they queue up
+                key = media_filename(cached_info['id'], cached_info['ext'], tier)
+                return self.flight.run(
+                    key,
+                    lambda: self._existing_file(cached_info, tier) or self._cached_failure(canonical),
+                    lambda: self._fetch_from_cluster(url, cached_info, tier, local_only)
+                    or self._download(url, tier, progress_hook, local_only, locked_key=key)
+                )
+            
+            if cached_info:
+                result = self._from_cluster(url, cached_info, tier, local_only)
+                if result:
+                    return result
             
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                # Extract video info first
-                info = ydl.extract_info(url, download=False)
+            return self._download(url, tier, progress_hook, local_only)
+                    
+        except Exception as e:
+            return self._download_failure(e, url, canonical)
+    
+    def _download(self, url: str, tier: Tier, progress_hook: Optional[Callable[[Dict[str, Any]], None]],
+                  local_only: bool, locked_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract a video's info and download it into the media cache
+        
+        Args:
+            url (str): TikTok video URL
+            tier (Tier): Quality tier
+            progress_hook (callable): Optional yt-dlp progress hook
+            local_only (bool): Don't ask the owning node for the file
+            locked_key (str): Single-flight key the caller already holds
+            
+        Returns:
+            dict: Download result
+        """
+        # Stage into a private directory; on success the file is
+        # published with an atomic rename so readers never see it partial
+        cache_dir = self.media_cache.directory
+        staging_dir = tempfile.mkdtemp(prefix='tiktok_', suffix='.partial', dir=cache_dir)
+        opts = self.ydl_opts.copy()
+        opts['format'] = tier.format
+        opts['outtmpl'] = os.path.join(staging_dir, media_filename('%(id)s', '%(ext)s', tier))
+        if progress_hook:
+            opts['progress_hooks'] = [progress_hook]
+        
+        try:
+            # Extract video info once; the download below reuses it
+            ydl, info = self._extract(url, opts)
+            with ydl:
                 if not info:
-                    return {
-                        'success': False,
-                        'error': 'Could not extract video information',
-                        'file_path': None,
-                        'filename': None
-                    }
+                    return self._failure('Could not extract video information')
+                self.metadata_cache.put(self._cache_keys(url, info), info)
                 
-                # Generate filename
                 video_id = info.get('id', 'unknown')
-                ext = info.get('ext', 'mp4')
-                filename = f"tiktok_{video_id}.{ext}"
-                file_path = os.path.join(temp_dir, filename)
-                
-                # Check if file already exists
-                if os.path.exists(file_path):
-                    self.logger.info(f"File already exists: {filename}")
-                    return {
-                        'success': True,
-                        'file_path': file_path,
-                        'filename': filename,
-                        'video_info': {
-                            'title': info.get('title', 'TikTok Video'),
-                            'uploader': info.get('uploader', 'Unknown'),
-                            'duration': info.get('duration', 0),
-                        }
-                    }
+                video_info = {
+                    'title': info.get('title', 'TikTok Video'),
+                    'uploader': info.get('uploader', 'Unknown'),
+                    'duration': info.get('duration', 0),
+                }
                 
-                # Download the video
-                ydl.download([url])
+                key = media_filename(video_id, info.get('ext', 'mp4'), tier)
                 
-                # Verify file was created
-                if os.path.exists(file_path):
+                def fetch():
+                    # Short links only resolve to an id here; the caller
+                    # already asked about the key it locked
+                    if key != locked_key:
+                        result = self._fetch_from_cluster(url, info, tier, local_only)
+                        if result:
+                            return {**result, 'video_info': video_info}
+                    
+                    # Download from the info dict we already have instead
+                    # of extracting the URL a second time; the deadline
+                    # hook aborts it once it runs too long
+                    deadline = Deadline(self.download_deadline)
+                    ydl.add_progress_hook(deadline.check)
+                    with metrics.DOWNLOADS_IN_FLIGHT.track_inprogress(), metrics.MEDIA_DOWNLOAD_SECONDS.time():
+                        staged_path = self._segmented_fetch(ydl, info, tier, staging_dir, progress_hook, deadline)
+                        if staged_path is None:
+                            result = ydl.process_ie_result(info, download=True)
+                            downloads = (result or {}).get('requested_downloads') or []
+                            staged_path = downloads[0].get('filepath') if downloads else None
+                    
+                    # Verify file was created
+                    if not staged_path or not os.path.exists(staged_path):
+                        return self._failure('Video file was not created')
+                    
+                    filename = os.path.basename(staged_path)
+                    file_path = os.path.join(cache_dir, filename)
+                    os.replace(staged_path, file_path)
+                    self.media_cache.add(file_path)
+                    self._store(file_path)
+                    
                     file_size = os.path.getsize(file_path)
                     self.logger.info(f"Download successful: {filename} ({file_size} bytes)")
-                    
                     return {
                         'success': True,
                         'file_path': file_path,
                         'filename': filename,
                         'file_size': file_size,
-                        'video_info': {
-                            'title': info.get('title', 'TikTok Video'),
-                            'uploader': info.get('uploader', 'Unknown'),
-                            'duration': info.get('duration', 0),
-                        }
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error': 'Video file was not created',
-                        'file_path': None,
-                        'filename': None
+                        'video_info': video_info
                     }
-                    
-        except yt_dlp.DownloadError as e:
-            error_msg = str(e)
-            self.logger.error(f"yt-dlp download error: {error_msg}")
+                
+                # Only one thread/worker fetches a given file; the rest
+                # wait for it and pick up the finished file
+                if key == locked_key:
+                    return self._existing_file(info, tier) or fetch()
+                return self.flight.run(key, lambda: self._existing_file(info, tier), fetch)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def stream_video(self, url: str, tier: Tier = BEST, local_only: bool = False) -> Dict[str, Any]:
+        """
+        Start (or join) a download and stream it while it is in progress
+        
+        The upstream media is teed into the cache file by a background
+        thread; the returned ``stream`` follows that file as it grows, so
+        the first bytes reach the client long before the download ends.
+        A second caller for the same video follows the same file.
+        
+        Args:
+            url (str): TikTok video URL
+            tier (Tier): Quality tier; each tier is cached as its own file
+            local_only (bool): Don't ask the owning node for the file
+            
+        Returns:
+            dict: Same shape as ``download_video``; when the file is not on
+            disk yet ``stream`` is a chunk iterator and ``file_path`` is None
+        """
+        canonical = None
+        try:
+            # Validate URL
+            canonical = canonicalize(url)
+            if canonical is None:
+                metrics.DOWNLOAD_ERRORS.labels('invalid_url').inc()
+                return self._failure('Invalid TikTok URL format')
+            
+            cache_dir = self.media_cache.directory
             
-            # Provide user-friendly error messages
-            if "Video unavailable" in error_msg:
-                error_msg = "Video is unavailable or has been removed"
-            elif "Private video" in error_msg:
-                error_msg = "This is a private video and cannot be downloaded"
-            elif "Sign in to confirm your age" in error_msg:
-                error_msg = "Age-restricted video cannot be downloaded"
-            elif "HTTP Error 403" in error_msg:
-                error_msg = "Access denied. The video may be region-restricted"
-            elif "HTTP Error 404" in error_msg:
-                error_msg = "Video not found. Please check the URL"
+            cached_info = self._known_info(canonical)
+            result = self._existing_file(cached_info, tier) if cached_info else None
+            metrics.CACHE_REQUESTS.labels('media', 'hit' if result else 'miss').inc()
+            if result:
+                return result
+            
+            failure = self._cached_failure(canonical)
+            if failure:
+                return failure
+            
+            if cached_info:
+                # Someone is already downloading it: follow along without
+                # touching upstream at all
+                filename = media_filename(cached_info['id'], cached_info['ext'], tier)
+                partial_path = os.path.join(cache_dir, f"{filename}.part")
+                if self._is_being_written(filename, partial_path):
+                    self.logger.info(f"Following in-progress download: {filename}")
+                    return self._stream_result(cached_info, partial_path, os.path.join(cache_dir, filename))
+                
+                # Another node may have it; that beats streaming from TikTok
+                result = self._from_cluster(url, cached_info, tier, local_only)
+                if result:
+                    return result
+            
+            self.logger.info(f"Starting streamed download for URL: {url}")
+            
+            opts = self.ydl_opts.copy()
+            opts['format'] = tier.format
+            ydl, info = self._extract(url, opts)
+            
+            if not info:
+                ydl.close()
+                return self._failure('Could not extract video information')
+            self.metadata_cache.put(self._cache_keys(url, info), info)
+            
+            result = self._existing_file(info, tier) or self._from_cluster(url, info, tier, local_only)
+            if result:
+                ydl.close()
+                return result
+            
+            # Merged formats need post-processing and can't be teed
+            if not info.get('url') or info.get('requested_formats'):
+                ydl.close()
+                self.logger.info(f"Streaming unsupported for this format, downloading first: {url}")
+                return self.download_video(url, tier=tier, local_only=local_only)
+            
+            video_id = info.get('id', 'unknown')
+            filename = media_filename(video_id, info.get('ext', 'mp4'), tier)
+            file_path = os.path.join(cache_dir, filename)
+            partial_path = f"{file_path}.part"
+            
+            def tee():
+                # Past the deadline the partial file is removed, which
+                # fails every follower instead of leaving them waiting
+                deadline = Deadline(self.download_deadline)
+                with metrics.DOWNLOADS_IN_FLIGHT.track_inprogress(), metrics.MEDIA_DOWNLOAD_SECONDS.time():
+                    if self.engine is not None:
+                        written = ydl.tee(info, partial_path, file_path, deadline)
+                    else:
+                        from yt_dlp.networking import Request
+                        response = ydl.urlopen(Request(info['url'], headers=info.get('http_headers') or {}))
+                        try:
+                            written = tee_to_file(response, partial_path, file_path, check=deadline.check)
+                        finally:
+                            response.close()
+                self.media_cache.add(file_path)
+                self._store(file_path)
+                self.logger.info(f"Download successful: {filename} ({written} bytes)")
+                return True
+            
+            def produce():
+                try:
+                    # The lock still makes sure only one worker fetches
+                    self.flight.run(filename, lambda: True if os.path.exists(file_path) else None, tee)
+                except Exception as e:
+                    self.logger.error(f"Streamed download failed for {filename}: {str(e)}")
+                    metrics.DOWNLOAD_ERRORS.labels(self._classify_error(str(e))[0]).inc()
+                finally:
+                    ydl.close()
+            
+            if self._is_being_written(filename, partial_path):
+                ydl.close()
+                self.logger.info(f"Following in-progress download: {filename}")
             else:
-                error_msg = "Failed to download video. Please try again"
+                threading.Thread(target=produce, daemon=True).start()
+            return self._stream_result(info, partial_path, file_path)
+        
+        except Exception as e:
+            return self._download_failure(e, url, canonical)
+    
+    def _extract(self, url: str, opts: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Run extract_info under the upstream deadline, retry and breaker policy
+        
+        Each attempt gets its own YoutubeDL: instances aren't thread-safe,
+        and the winner's cookies are needed for the media download. With
+        the process engine the attempt runs on an engine worker and a
+        ``RemoteYoutubeDL`` stands in for the YoutubeDL.
+        
+        Args:
+            url (str): TikTok video URL
+            opts (dict): yt-dlp options
             
-            return {
-                'success': False,
-                'error': error_msg,
-                'file_path': None,
-                'filename': None
+        Returns:
+            tuple: The YoutubeDL that extracted the info (the caller closes
+            it) and the info dict
+        """
+        if self.engine is not None:
+            def attempt():
+                with metrics.EXTRACT_INFO_SECONDS.time():
+                    return self.engine.extract(url, opts)
+            
+            return self.upstream.call(attempt, discard=lambda result: result[0].close())
+        
+        yt_dlp = load_yt_dlp()
+        
+        def attempt():
+            ydl = yt_dlp.YoutubeDL(opts)
+            try:
+                with metrics.EXTRACT_INFO_SECONDS.time():
+                    return ydl, ydl.extract_info(url, download=False)
+            except BaseException:
+                ydl.close()
+                raise
+        
+        return self.upstream.call(attempt, discard=lambda result: result[0].close())
+    
+    @staticmethod
+    def _failure(message: str) -> Dict[str, Any]:
+        """Failed download result carrying a message we can show users"""
+        return {
+            'success': False,
+            'error': message,
+            'file_path': None,
+            'filename': None
+        }
+    
+    def _download_failure(self, error: Exception, url: str, canonical: Optional[CanonicalUrl]) -> Dict[str, Any]:
+        """
+        Map an exception raised while downloading to a failed result
+        
+        Counts the failure by category and remembers permanent yt-dlp
+        failures in the negative cache.
+        
+        Args:
+            error (Exception): What the download raised
+            url (str): Requested URL
+            canonical (CanonicalUrl): Canonicalized URL, if it got that far
+            
+        Returns:
+            dict: Failed download result
+        """
+        if isinstance(error, yt_dlp_download_error()):
+            error_msg = str(error)
+            self.logger.error(f"yt-dlp download error: {error_msg}")
+            category, message = self._classify_error(error_msg)
+            metrics.DOWNLOAD_ERRORS.labels(category).inc()
+            self._remember_failure(canonical, error_msg)
+            return self._failure(message)
+        
+        if isinstance(error, UpstreamError):
+            return self._upstream_failure(error)
+        
+        if isinstance(error, PeerRefused):
+            self.logger.error(f"Owning node could not download {url}: {str(error)}")
+            metrics.DOWNLOAD_ERRORS.labels('peer').inc()
+            return self._failure(str(error))
+        
+        self.logger.error(f"Unexpected error during download: {str(error)}")
+        metrics.DOWNLOAD_ERRORS.labels('unexpected').inc()
+        return self._failure('An unexpected error occurred. Please try again')
+    
+    def _upstream_failure(self, error: UpstreamError) -> Dict[str, Any]:
+        """
+        Download result for an upstream that is too slow or failing
+        
+        Args:
+            error (UpstreamError): Deadline or circuit breaker error
+            
+        Returns:
+            dict: Failed download result
+        """
+        self.logger.error(f"Upstream unavailable: {str(error)}")
+        if isinstance(error, CircuitOpen):
+            metrics.DOWNLOAD_ERRORS.labels('circuit_open').inc()
+            message = "TikTok is not responding right now. Please try again in a minute"
+        else:
+            metrics.DOWNLOAD_ERRORS.labels('timeout').inc()
+            message = "TikTok took too long to respond. Please try again"
+        return self._failure(message)
+    
+    def _segmented_fetch(self, ydl, info: Dict[str, Any], tier: Tier, staging_dir: str,
+                         progress_hook: Optional[Callable] = None,
+                         deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        Fetch a direct-URL format over parallel Range requests
+        
+        Args:
+            ydl (YoutubeDL): Instance the info was extracted with (for cookies)
+            info (dict): Info dict returned by ``extract_info``
+            tier (Tier): Quality tier the format was selected for
+            staging_dir (str): Private directory to write into
+            progress_hook (callable): Optional yt-dlp progress hook
+            deadline (Deadline): Budget for the download; running out
+                aborts it rather than falling back to a single stream
+            
+        Returns:
+            str: Path of the finished file, or None if segmented mode is off
+            or doesn't apply, in which case yt-dlp should download it
+        """
+        if self.segmented is None:
+            return None
+        # Merged and fragmented formats need yt-dlp's own downloaders
+        if not info.get('url') or info.get('requested_formats') or info.get('protocol', 'https') not in ('http', 'https'):
+            return None
+        
+        from utils.segmented import RangeNotSupported, SegmentedDownloadError
+        import requests
+        
+        headers = dict(info.get('http_headers') or {})
+        cookiejar = getattr(ydl, 'cookiejar', None)
+        if cookiejar is not None:
+            cookie_header = cookiejar.get_cookie_header(info['url'])
+            if cookie_header:
+                headers['Cookie'] = cookie_header
+        
+        def hook(d):
+            if deadline:
+                deadline.check(d)
+            if progress_hook:
+                progress_hook(d)
+        
+        file_path = os.path.join(staging_dir, media_filename(info['id'], info.get('ext', 'mp4'), tier))
+        try:
+            self.segmented.download(info['url'], file_path, headers, hook)
+            return file_path
+        except RangeNotSupported as e:
+            self.logger.info(f"Segmented download not possible, using a single stream: {str(e)}")
+        except (SegmentedDownloadError, requests.RequestException, OSError) as e:
+            self.logger.warning(f"Segmented download failed, retrying as a single stream: {str(e)}")
+        
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        return None
+    
+    def _is_being_written(self, filename: str, partial_path: str) -> bool:
+        """
+        Whether a partial file has a live writer to follow
+        
+        A partial file whose writer died (e.g. a worker killed by the
+        gunicorn timeout, which never runs the tee's cleanup) would make
+        followers wait for bytes that never come. It is removed instead,
+        under the single-flight lock so a new writer can't start meanwhile.
+        
+        Args:
+            filename (str): Media file name, also the single-flight key
+            partial_path (str): In-progress path of that file
+            
+        Returns:
+            bool: True if someone holds the lock for the file
+        """
+        if not os.path.exists(partial_path):
+            return False
+        try:
+            with self.flight.lock(filename, blocking=False):
+                try:
+                    os.remove(partial_path)
+                    self.logger.warning(f"Removed abandoned partial download: {os.path.basename(partial_path)}")
+                except FileNotFoundError:
+                    pass
+                return False
+        except BlockingIOError:
+            return True
+    
+    def _stream_result(self, info: Dict[str, Any], partial_path: str, file_path: str) -> Dict[str, Any]:
+        return {
+            'success': True,
+            'file_path': None,
+            'filename': os.path.basename(file_path),
+            'stream': follow_file(partial_path, file_path),
+            'video_info': {
+                'title': info.get('title', 'TikTok Video'),
+                'uploader': info.get('uploader', 'Unknown'),
+                'duration': info.get('duration', 0),
             }
+        }
+    
+    def _classify_error(self, error_msg: str) -> Tuple[str, str]:
+        """
+        Map a yt-dlp error to a category and a message we can show users
+        
+        Args:
+            error_msg (str): Error text raised by yt-dlp
             
-        except Exception as e:
-            self.logger.error(f"Unexpected error during download: {str(e)}")
-            return {
-                'success': False,
-                'error': 'An unexpected error occurred. Please try again',
-                'file_path': None,
-                'filename': None
+        Returns:
+            tuple: Error category (used as a metrics label) and user-friendly message
+        """
+        if "Video unavailable" in error_msg:
+            return 'unavailable', "Video is unavailable or has been removed"
+        elif "Private video" in error_msg:
+            return 'private', "This is a private video and cannot be downloaded"
+        elif "Sign in to confirm your age" in error_msg:
+            return 'age_restricted', "Age-restricted video cannot be downloaded"
+        elif "HTTP Error 403" in error_msg:
+            return 'forbidden', "Access denied. The video may be region-restricted"
+        elif "HTTP Error 404" in error_msg:
+            return 'not_found', "Video not found. Please check the URL"
+        else:
+            return 'other', "Failed to download video. Please try again"
+    
+    def _cached_failure(self, canonical: CanonicalUrl) -> Optional[Dict[str, Any]]:
+        """
+        Answer from the negative cache when this URL recently failed
+        
+        Args:
+            canonical (CanonicalUrl): Canonicalized request URL
+            
+        Returns:
+            dict: Failed download result with the remembered message, or None
+        """
+        failure = self.metadata_cache.get_failure(canonical.key)
+        if failure is None:
+            return None
+        category, message = failure
+        metrics.DOWNLOAD_ERRORS.labels(category).inc()
+        return self._failure(message)
+    
+    def _remember_failure(self, canonical: Optional[CanonicalUrl], error_msg: str) -> None:
+        """
+        Put a yt-dlp failure in the negative cache if its category has a TTL
+        
+        Args:
+            canonical (CanonicalUrl): Canonicalized request URL
+            error_msg (str): Error text raised by yt-dlp
+        """
+        category, message = self._classify_error(error_msg)
+        ttl = self.negative_ttls.get(category)
+        if canonical is None or not ttl:
+            return
+        self.metadata_cache.put_failure([canonical.key], category, message, ttl)
+    
+    def invalidate(self, url: str) -> int:
+        """
+        Forget cached info and any remembered failure for a video
+        
+        Args:
+            url (str): TikTok video URL or bare video id
+            
+        Returns:
+            int: Number of cache entries removed
+        """
+        canonical = canonicalize(url)
+        key = canonical.key if canonical else video_key(url.strip())
+        return self.metadata_cache.invalidate(key)
+    
+    def _cache_keys(self, url: str, info: Dict[str, Any]) -> List[str]:
+        """
+        Every key a video's metadata should be reachable under
+        
+        Args:
+            url (str): URL the info was extracted from
+            info (dict): Info dict returned by ``extract_info``
+            
+        Returns:
+            list: Canonical keys for the request URL, the resolved URLs and the id
+        """
+        keys = [video_key(info['id'])] if info.get('id') else []
+        for candidate in (url, info.get('webpage_url'), info.get('original_url')):
+            canonical = canonicalize(candidate)
+            if canonical and canonical.key not in keys:
+                keys.append(canonical.key)
+        return keys
+    
+    def _known_info(self, canonical: CanonicalUrl) -> Optional[Dict[str, Any]]:
+        """
+        Get what we know about a video before doing any yt-dlp work
+        
+        Args:
+            canonical (CanonicalUrl): Canonicalized request URL
+            
+        Returns:
+            dict: Cached info, a bare ``id``/``ext`` dict when the URL itself
+            carries the id, or None
+        """
+        cached_info = self.metadata_cache.get(canonical.key)
+        if cached_info:
+            return cached_info
+        
+        # Desktop and m.tiktok.com URLs carry the id, which is all the
+        # file name needs (TikTok serves mp4)
+        if canonical.video_id:
+            return {'id': canonical.video_id, 'ext': 'mp4'}
+        return None
+    
+    def _from_cluster(self, url: str, info: Dict[str, Any], tier: Tier,
+                      local_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get a file the media cache doesn't have from storage or the owning node
+        
+        Runs under the download's single-flight lock, so a node asks for a
+        given file once no matter how many of its workers want it.
+        
+        Args:
+            url (str): TikTok video URL
+            info (dict): Video info with at least ``id`` and ``ext``
+            tier (Tier): Quality tier of the file
+            local_only (bool): Only look in storage, not at other nodes
+            
+        Returns:
+            dict: Download result once the file is in the media cache, or
+            None if it has to come from upstream
+        """
+        if self.storage is None and (self.cluster is None or local_only):
+            return None
+        return self.flight.run(
+            media_filename(info['id'], info.get('ext', 'mp4'), tier),
+            lambda: self._existing_file(info, tier),
+            lambda: self._fetch_from_cluster(url, info, tier, local_only)
+        )
+    
+    def _fetch_from_cluster(self, url: str, info: Dict[str, Any], tier: Tier,
+                            local_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Copy a file from storage or the owning node into the media cache
+        
+        The caller holds the single-flight lock for the file. Falls through
+        (returns None) when neither has it or the owner is unreachable.
+        
+        Raises:
+            PeerRefused: If the owner couldn't produce the video either
+        """
+        if self.storage is None and (self.cluster is None or local_only):
+            return None
+        
+        video_id = info.get('id', 'unknown')
+        filename = media_filename(video_id, info.get('ext', 'mp4'), tier)
+        staging_dir = tempfile.mkdtemp(prefix='tiktok_', suffix='.partial', dir=self.media_cache.directory)
+        staged_path = os.path.join(staging_dir, filename)
+        try:
+            source, video_info = None, {}
+            if self.storage is not None:
+                found = self.storage.get(filename, staged_path)
+                metrics.CACHE_REQUESTS.labels('storage', 'hit' if found else 'miss').inc()
+                if found:
+                    source = 'storage'
+            
+            if source is None and self.cluster is not None and not local_only and not self.cluster.is_local(video_id):
+                video_info = self.cluster.fetch(url, video_id, tier.key, staged_path)
+                metrics.CACHE_REQUESTS.labels('peer', 'miss' if video_info is None else 'hit').inc()
+                if video_info is not None:
+                    source = f"node {self.cluster.owner(video_id)}"
+            
+            if source is None:
+                return None
+            
+            file_path = self.media_cache.path(filename)
+            os.replace(staged_path, file_path)
+            self.media_cache.add(file_path)
+            self.logger.info(f"Copied {filename} from {source}")
+            # A bare id/ext info gets the title and uploader the owner sent
+            return self._existing_file({**info, **video_info}, tier)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def _store(self, file_path: str) -> None:
+        """Keep a file fetched from upstream in storage; failures only cost a refetch"""
+        if self.storage is None:
+            return
+        try:
+            self.storage.put(file_path)
+        except OSError as e:
+            self.logger.error(f"Failed to store {os.path.basename(file_path)}: {str(e)}")
+    
+    def _existing_file(self, info: Dict[str, Any], tier: Tier = BEST) -> Optional[Dict[str, Any]]:
+        """
+        Build a download result for a video that is already in the media cache
+        
+        Args:
+            info (dict): Video info with at least ``id`` and ``ext``
+            tier (Tier): Quality tier of the file to look for
+            
+        Returns:
+            dict: Download result, or None if the file is not there yet
+        """
+        filename = media_filename(info.get('id', 'unknown'), info.get('ext', 'mp4'), tier)
+        file_path = self.media_cache.path(filename)
+        
+        # Check if file already exists
+        if not os.path.exists(file_path):
+            return None
+        
+        self.media_cache.touch(filename)
+        self.logger.info(f"File already exists: {filename}")
+        return {
+            'success': True,
+            'file_path': file_path,
+            'filename': filename,
+            'file_size': os.path.getsize(file_path),
+            'video_info': {
+                'title': info.get('title', 'TikTok Video'),
+                'uploader': info.get('uploader', 'Unknown'),
+                'duration': info.get('duration', 0),
             }
+        }
     
     def get_supported_sites(self) -> list:
         """
@@ -239,26 +958,11 @@ class TikTokDownloader:
             self.logger.error(f"Error getting supported sites: {str(e)}")
             return ['TikTok']
     
-    def cleanup_old_files(self, max_age_hours: int = 24) -> None:
+    def cleanup_old_files(self) -> None:
         """
-        Clean up old downloaded files
-        
-        Args:
-            max_age_hours (int): Maximum age of files in hours before cleanup
+        Evict expired and least-recently-used files from the media cache
         """
         try:
-            import time
-            temp_dir = tempfile.gettempdir()
-            current_time = time.time()
-            max_age_seconds = max_age_hours * 3600
-            
-            for filename in os.listdir(temp_dir):
-                if filename.startswith('tiktok_'):
-                    filepath = os.path.join(temp_dir, filename)
-                    if os.path.isfile(filepath):
-                        file_age = current_time - os.path.getmtime(filepath)
-                        if file_age > max_age_seconds:
-                            os.remove(filepath)
-                            self.logger.info(f"Cleaned up old file: {filename}")
+            self.media_cache.reap()
         except Exception as e:
             self.logger.error(f"Error during cleanup: {str(e)}")
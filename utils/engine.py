@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import logging
+import importlib
+import threading
+import urllib.request
+import multiprocessing
+from http.cookiejar import CookieJar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils import metrics
+from utils.resilience import Deadline, DeadlineExceeded
+from utils.streaming import tee_to_file
+
+# Progress fields worth sending back from a worker; the rest of yt-dlp's
+# progress dict (info_dict, ...) is large and not picklable
+PROGRESS_FIELDS = ('status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate',
+                   'filename', 'elapsed', 'speed', 'eta')
+
+# Seconds between progress messages from a worker
+PROGRESS_INTERVAL = 0.25
+
+
+class EngineError(Exception):
+    """Raised when an engine worker crashes or fails outside yt-dlp"""
+
+
+class RemoteDownloadError(Exception):
+    """A yt-dlp DownloadError raised in an engine worker; carries its message"""
+
+
+def _rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # Peak rather than current, but better than nothing off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _load(path: str) -> Callable:
+    """Resolve a ``module:function`` path"""
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+class _WorkerState:
+    """What an engine worker keeps between tasks"""
+
+    def __init__(self, conn):
+        import yt_dlp
+        self.yt_dlp = yt_dlp
+        self.conn = conn
+        self.sessions: Dict[str, Any] = {}
+        self.progress = False
+        self.last_progress = 0.0
+
+    def session(self, opts: Dict[str, Any]) -> Any:
+        """
+        A long-lived YoutubeDL per set of options
+
+        Keeping it around keeps the extractor instances, compiled
+        regexes and HTTP connections warm between tasks.
+        """
+        key = json.dumps(opts, sort_keys=True, default=str)
+        ydl = self.sessions.get(key)
+        if ydl is None:
+            ydl = self.yt_dlp.YoutubeDL(opts)
+            ydl.add_progress_hook(self.report_progress)
+            self.sessions[key] = ydl
+        return ydl
+
+    def report_progress(self, d: Dict[str, Any]) -> None:
+        if not self.progress:
+            return
+        now = time.monotonic()
+        if d.get('status') == 'downloading' and now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        self.conn.send(('progress', {field: d.get(field) for field in PROGRESS_FIELDS if field in d}))
+
+    def extract(self, url: str, opts: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Any]]:
+        ydl = self.session(opts)
+        info = ydl.extract_info(url, download=False)
+        if info is not None and hasattr(ydl, 'sanitize_info'):
+            info = ydl.sanitize_info(info)
+        return info, list(getattr(ydl, 'cookiejar', None) or [])
+
+    def download(self, info: Dict[str, Any], opts: Dict[str, Any], outtmpl: str,
+                 cookies: List[Any]) -> Dict[str, Any]:
+        ydl = self._prepare(opts, cookies)
+        ydl.params['outtmpl'] = {'default': outtmpl}
+        self.progress = True
+        try:
+            result = ydl.process_ie_result(info, download=True) or {}
+        finally:
+            self.progress = False
+        downloads = result.get('requested_downloads') or []
+        return {'requested_downloads': [{'filepath': d.get('filepath')} for d in downloads]}
+
+    def tee(self, info: Dict[str, Any], opts: Dict[str, Any], cookies: List[Any],
+            partial_path: str, file_path: str, timeout: float) -> int:
+        from yt_dlp.networking import Request
+        deadline = Deadline(timeout)
+        ydl = self._prepare(opts, cookies)
+        response = ydl.urlopen(Request(info['url'], headers=info.get('http_headers') or {}))
+        try:
+            return tee_to_file(response, partial_path, file_path, check=deadline.check)
+        finally:
+            response.close()
+
+    def _prepare(self, opts: Dict[str, Any], cookies: List[Any]) -> Any:
+        ydl = self.session(opts)
+        jar = getattr(ydl, 'cookiejar', None)
+        if jar is not None:
+            for cookie in cookies:
+                jar.set_cookie(cookie)
+        return ydl
+
+
+def _serve(conn, initializer: Optional[str]) -> None:
+    """Engine worker main loop: run tasks from the pipe until told to stop"""
+    if initializer:
+        _load(initializer)()
+    state = _WorkerState(conn)
+    operations = {'extract': state.extract, 'download': state.download, 'tee': state.tee}
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+
+        operation, args = message
+        try:
+            reply = ('ok', operations[operation](*args))
+        except state.yt_dlp.DownloadError as e:
+            reply = ('download_error', str(e))
+        except Exception as e:
+            reply = ('error', f"{type(e).__name__}: {str(e)}")
+        conn.send(('result', reply[0], reply[1], _rss_bytes()))
+
+
+class _Worker:
+    """Parent-side handle on one engine worker process"""
+
+    def __init__(self, context, initializer: Optional[str]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, initializer),
+                                       name='extraction-engine', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.rss = 0
+
+    def stop(self) -> None:
+        """Ask the worker to exit once idle; it is reaped later"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            self.process.kill()
+        self.conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ExtractionEngine:
+    """
+    Pool of warm worker processes that run yt-dlp for the web workers
+
+    yt-dlp holds the GIL while parsing, is memory hungry and leaks; here
+    it runs in separate long-lived processes (forked from a forkserver
+    that has already imported it) instead of in the gunicorn workers.
+    Each web worker gets its own pool on first use.
+
+    A worker is retired once its RSS passes ``max_rss_bytes`` or after
+    ``max_tasks`` tasks, and killed outright when a task runs past its
+    deadline, since yt-dlp can't be interrupted any other way.
+    """
+
+    def __init__(self, workers: int = 2, max_rss_bytes: int = 512 * 1024 ** 2, max_tasks: int = 500,
+                 extract_timeout: float = 60, download_timeout: float = 600,
+                 initializer: Optional[str] = None, start_method: str = 'forkserver'):
+        self.logger = logging.getLogger(__name__)
+        self.workers = workers
+        self.max_rss_bytes = max_rss_bytes
+        self.max_tasks = max_tasks
+        self.extract_timeout = extract_timeout
+        self.download_timeout = download_timeout
+        self.initializer = initializer
+        self.start_method = start_method
+        self.counts = {'spawned': 0, 'recycled': 0, 'killed': 0, 'crashed': 0}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self) -> None:
+        # Processes and pipes don't survive fork; each web worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._context = multiprocessing.get_context(self.start_method)
+            if self.start_method == 'forkserver':
+                self._context.set_forkserver_preload(['yt_dlp', 'utils.engine'])
+            self._idle: List[_Worker] = []
+            self._slots = threading.BoundedSemaphore(self.workers)
+            self._pid = os.getpid()
+
+    def _checkout(self, timeout: float) -> _Worker:
+        self._ensure_pool()
+        if not self._slots.acquire(timeout=timeout):
+            raise DeadlineExceeded(f"No extraction engine worker free within {timeout:g}s")
+        # Reap retired workers that have exited since
+        multiprocessing.active_children()
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.conn.close()
+                self.counts['crashed'] += 1
+                metrics.ENGINE_EVENTS.labels('crashed').inc()
+        try:
+            worker = _Worker(self._context, self.initializer)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.counts['spawned'] += 1
+        metrics.ENGINE_EVENTS.labels('spawned').inc()
+        return worker
+
+    def _checkin(self, worker: _Worker, healthy: bool) -> None:
+        try:
+            if not healthy:
+                worker.kill()
+                event = 'killed'
+            elif worker.rss > self.max_rss_bytes or worker.tasks >= self.max_tasks:
+                self.logger.info(f"Recycling engine worker {worker.process.pid} "
+                                 f"({worker.rss // 1024 ** 2} MB RSS, {worker.tasks} tasks)")
+                worker.stop()
+                event = 'recycled'
+            else:
+                with self._lock:
+                    self._idle.append(worker)
+                return
+            with self._lock:
+                self.counts[event] += 1
+            metrics.ENGINE_EVENTS.labels(event).inc()
+        finally:
+            self._slots.release()
+
+    def call(self, operation: str, args: tuple, timeout: float,
+             progress_hook: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+        """
+        Run one task on a worker
+
+        Args:
+            operation (str): ``extract``, ``download`` or ``tee``
+            args (tuple): Picklable arguments for the operation
+            timeout (float): Hard deadline; the worker is killed past it
+            progress_hook (callable): Receives progress dicts from downloads
+
+        Returns:
+            The operation's result
+
+        Raises:
+            RemoteDownloadError: If yt-dlp raised a DownloadError
+            DeadlineExceeded: If the task ran past ``timeout``
+            EngineError: If the worker died or failed otherwise
+        """
+        deadline = time.monotonic() + timeout
+        worker = self._checkout(timeout)
+        healthy = False
+        try:
+            worker.conn.send((operation, args))
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    self.logger.warning(f"Killing engine worker {worker.process.pid}: "
+                                        f"{operation} ran past {timeout:g}s")
+                    raise DeadlineExceeded(f"Engine {operation} did not finish within {timeout:g}s")
+                message = worker.conn.recv()
+                if message[0] == 'progress':
+                    if progress_hook:
+                        progress_hook(message[1])
+                    continue
+
+                _, status, value, rss = message
+                healthy = True
+                worker.tasks += 1
+                worker.rss = rss
+                if status == 'ok':
+                    return value
+                if status == 'download_error':
+                    raise RemoteDownloadError(value)
+                raise EngineError(value)
+        except (EOFError, OSError) as e:
+            with self._lock:
+                self.counts['crashed'] += 1
+            metrics.ENGINE_EVENTS.labels('crashed').inc()
+            raise EngineError(f"Engine worker died during {operation}: {str(e)}") from e
+        finally:
+            self._checkin(worker, healthy)
+
+    def extract(self, url: str, opts: Dict[str, Any]) -> Tuple['RemoteYoutubeDL', Optional[Dict[str, Any]]]:
+        """
+        Extract video info on a worker
+
+        Args:
+            url (str): TikTok video URL
+            opts (dict): yt-dlp options; progress hooks stay in this process
+
+        Returns:
+            tuple: A ``RemoteYoutubeDL`` standing in for the YoutubeDL that
+            did the extraction, and the info dict
+        """
+        remote = RemoteYoutubeDL(self, opts)
+        info, cookies = self.call('extract', (url, remote.opts), self.extract_timeout)
+        remote.cookiejar.update(cookies)
+        return remote, info
+
+    def stats(self) -> dict:
+        """
+        Get this web worker's pool state
+
+        Returns:
+            dict: Pool size, idle workers and lifetime event counts
+        """
+        with self._lock:
+            idle = len(self._idle) if self._pid == os.getpid() else 0
+            return {'workers': self.workers, 'idle': idle, **self.counts}
+
+
+class _Cookies(CookieJar):
+    """Cookies from a worker's extraction, for requests made from here"""
+
+    def update(self, cookies: List[Any]) -> None:
+        for cookie in cookies:
+            self.set_cookie(cookie)
+
+    def get_cookie_header(self, url: str) -> Optional[str]:
+        request = urllib.request.Request(url)
+        self.add_cookie_header(request)
+        return request.get_header('Cookie')
+
+
+class RemoteYoutubeDL:
+    """
+    Stands in for a YoutubeDL whose work happens on engine workers
+
+    Supports the parts ``TikTokDownloader`` uses after extraction; the
+    extraction's cookies travel with each task, so the download may run
+    on a different worker than the extraction did.
+    """
+
+    def __init__(self, engine: ExtractionEngine, opts: Dict[str, Any]):
+        self.engine = engine
+        self.progress_hooks = list(opts.get('progress_hooks') or [])
+        # Functions can't cross the pipe; outtmpl differs per download
+        self.opts = {key: value for key, value in opts.items() if key not in ('progress_hooks', 'outtmpl')}
+        self.outtmpl = opts.get('outtmpl')
+        self.cookiejar = _Cookies()
+
+    def __enter__(self) -> 'RemoteYoutubeDL':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def add_progress_hook(self, hook: Callable[[Dict[str, Any]], None]) -> None:
+        self.progress_hooks.append(hook)
+
+    def _progress(self, d: Dict[str, Any]) -> None:
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def process_ie_result(self, info: Dict[str, Any], download: bool = True) -> Dict[str, Any]:
+        return self.engine.call('download', (info, self.opts, self.outtmpl, list(self.cookiejar)),
+                                self.engine.download_timeout, self._progress)
+
+    def tee(self, info: Dict[str, Any], partial_path: str, file_path: str,
+            deadline: Optional[Deadline] = None) -> int:
+        """Download straight into the cache while followers read along"""
+        timeout = deadline.remaining() if deadline else self.engine.download_timeout
+        try:
+            return self.engine.call('tee', (info, self.opts, list(self.cookiejar), partial_path, file_path, timeout),
+                                    min(timeout + 5, self.engine.download_timeout))
+        except BaseException:
+            # A killed worker can't clean up after itself
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,191 @@
+import re
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+# Resolutions a tier may cap at; a short fixed list keeps the media cache
+# from fragmenting into one file per arbitrary number. TikTok videos are
+# portrait, so like "540p" these are the short side (width), not height
+HEIGHT_TIERS = (360, 480, 540, 720, 1080)
+
+# Size caps are accepted in whole megabytes within this range
+MAX_SIZE_TIER_MB = 500
+
+# Tiers listed by the info API
+LISTED_TIERS = ('best', '1080p', '720p', '540p', '360p')
+
+_TIER = re.compile(r'^(?:(?P<height>\d{3,4})p|(?P<megabytes>\d{1,3})mb)$')
+
+# Fields of each yt-dlp format worth showing a client
+FORMAT_FIELDS = ('format_id', 'ext', 'width', 'height', 'filesize', 'tbr', 'vcodec', 'acodec', 'format_note')
+
+
+def short_side(f: Dict[str, Any]) -> int:
+    """A format's smaller dimension: what "540p" means for portrait and landscape alike"""
+    sides = [side for side in (f.get('width'), f.get('height')) if side]
+    return min(sides) if sides else 0
+
+
+def _size(f: Dict[str, Any]) -> Optional[int]:
+    return f.get('filesize') or f.get('filesize_approx')
+
+
+def choose_format(formats: List[Dict[str, Any]], max_height: Optional[int] = None,
+                  max_bytes: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Pick the format a capped tier downloads
+
+    The best combined (audio and video) format whose short side is at
+    most ``max_height`` and whose size is under ``max_bytes``, preferring
+    mp4; if none fits, the smallest one rather than failing.
+
+    Args:
+        formats (list): yt-dlp format dicts or ``summarize_formats`` output
+        max_height (int): Cap on the short side in pixels
+        max_bytes (int): Cap on the file size in bytes
+
+    Returns:
+        dict: One of ``formats``, or None if there are none
+    """
+    combined = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none'] or formats
+    if not combined:
+        return None
+
+    def fits(f):
+        if max_height and short_side(f) > max_height:
+            return False
+        if max_bytes and not (_size(f) and _size(f) < max_bytes):
+            return False
+        return True
+
+    def quality(f):
+        return (f.get('ext') == 'mp4', short_side(f), f.get('tbr') or 0, _size(f) or 0)
+
+    candidates = [f for f in combined if fits(f)]
+    if candidates:
+        return max(candidates, key=quality)
+    return min(combined, key=lambda f: (short_side(f), _size(f) or 0))
+
+
+class FormatSelector:
+    """
+    yt-dlp ``format`` option for a capped tier
+
+    yt-dlp's selector language can only compare a field with a number, so
+    it can't cap the short side of a format; yt-dlp accepts a callable
+    instead. Picklable, so it also works in the extraction engine.
+    """
+
+    def __init__(self, max_height: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_height = max_height
+        self.max_bytes = max_bytes
+
+    def __call__(self, ctx: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        chosen = choose_format(ctx['formats'], self.max_height, self.max_bytes)
+        if chosen is not None:
+            yield chosen
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, FormatSelector) and repr(self) == repr(other)
+
+    def __repr__(self) -> str:
+        # Stable, since the engine keys its cached YoutubeDL sessions on it
+        return f"FormatSelector(max_height={self.max_height}, max_bytes={self.max_bytes})"
+
+
+class Tier(NamedTuple):
+    """A quality tier: how to pick a format and how its file is named"""
+
+    key: str  # 'best', '540p' or '10mb'; part of the cached file name
+    format: Union[str, Callable[[Dict[str, Any]], Iterator[Dict[str, Any]]]]  # yt-dlp format option
+    max_height: Optional[int] = None  # Cap on the short side
+    max_bytes: Optional[int] = None
+
+
+BEST = Tier('best', 'best[ext=mp4]/best')
+
+
+def parse_tier(value: Optional[str]) -> Optional[Tier]:
+    """
+    Parse a quality tier as given by a client
+
+    Accepts ``best``, a resolution cap such as ``540p`` (one of
+    ``HEIGHT_TIERS``, applied to the short side), or a size cap such as
+    ``10mb`` meaning the best format under 10 MiB. Formats that don't fit
+    fall back to the smallest one available rather than failing.
+
+    Args:
+        value (str): Tier name, case-insensitive
+
+    Returns:
+        Tier: Parsed tier, or None if the value is not a valid tier
+    """
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value == 'best':
+        return BEST
+
+    match = _TIER.match(value)
+    if match is None:
+        return None
+
+    if match.group('height'):
+        height = int(match.group('height'))
+        if height not in HEIGHT_TIERS:
+            return None
+        return Tier(f'{height}p', FormatSelector(max_height=height), max_height=height)
+
+    megabytes = int(match.group('megabytes'))
+    if not 1 <= megabytes <= MAX_SIZE_TIER_MB:
+        return None
+    max_bytes = megabytes * 1024 ** 2
+    return Tier(f'{megabytes}mb', FormatSelector(max_bytes=max_bytes), max_bytes=max_bytes)
+
+
+def media_filename(video_id: str, ext: str = 'mp4', tier: Tier = BEST) -> str:
+    """
+    Name of a video's file in the media cache
+
+    The default tier keeps the original ``tiktok_<id>.<ext>`` name so
+    files cached before tiers existed are still found.
+    """
+    if tier.key == BEST.key:
+        return f"tiktok_{video_id}.{ext}"
+    return f"tiktok_{video_id}_{tier.key}.{ext}"
+
+
+def summarize_formats(info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Reduce yt-dlp's format list to what a client needs to choose
+
+    Args:
+        info (dict): Info dict from ``extract_info`` (or an already trimmed one)
+
+    Returns:
+        list: Video formats, smallest first, without URLs or headers
+    """
+    formats = []
+    for f in info.get('formats') or []:
+        if f.get('vcodec') == 'none':
+            continue
+        summary = {field: f.get(field) for field in FORMAT_FIELDS}
+        summary['filesize'] = f.get('filesize') or f.get('filesize_approx')
+        formats.append(summary)
+    formats.sort(key=lambda f: (short_side(f), f['filesize'] or 0))
+    return formats
+
+
+def select_format(formats: List[Dict[str, Any]], tier: Tier) -> Optional[Dict[str, Any]]:
+    """
+    Predict which format a tier will download
+
+    Uses the same choice as the tier's yt-dlp selector, so clients see
+    the size of the file they will actually get.
+
+    Args:
+        formats (list): Output of ``summarize_formats``
+        tier (Tier): Quality tier
+
+    Returns:
+        dict: The chosen format summary, or None if there are no formats
+    """
+    return choose_format(formats, tier.max_height, tier.max_bytes)
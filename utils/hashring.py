@@ -0,0 +1,55 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List
+
+
+def _point(value: str) -> int:
+    # Stable across processes and Python versions, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes
+
+    Each node owns ``vnodes`` points on the ring and a key belongs to the
+    node with the next point clockwise. Adding or removing a node only
+    moves the keys next to its points (about 1/N of them); every other
+    key keeps its owner, so caches on the remaining nodes stay warm.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes: List[str] = sorted(set(nodes))
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+
+        ring: Dict[int, str] = {}
+        for node in self.nodes:
+            for replica in range(vnodes):
+                ring[_point(f"{node}#{replica}")] = node
+        self._points = sorted(ring)
+        self._owners = [ring[point] for point in self._points]
+
+    def owner(self, key: str) -> str:
+        """
+        Node that owns a key
+
+        Args:
+            key (str): Anything stable, e.g. a video id
+
+        Returns:
+            str: Node name
+        """
+        index = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
+
+    def share(self) -> Dict[str, float]:
+        """Fraction of the ring each node owns"""
+        shares = dict.fromkeys(self.nodes, 0)
+        space = 2 ** 64
+        previous = self._points[-1] - space
+        for point, node in zip(self._points, self._owners):
+            shares[node] += point - previous
+            previous = point
+        return {node: round(arc / space, 4) for node, arc in shares.items()}
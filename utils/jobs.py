@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional, Set
+from utils import metrics
+from utils.admission import ConcurrencyLimit
+from utils.db import SQLiteStore
+from utils.formats import BEST, Tier
+
+
+class QueueFull(Exception):
+    """Raised when the download queue can't take another job"""
+
+
+# Error for a job whose worker died before finishing it
+ORPHANED = 'The server restarted while preparing your video. Please try again'
+
+
+class JobStore(SQLiteStore):
+    """
+    Job status shared by all workers, so any worker can answer a poll
+
+    A job only runs in the memory of the worker that accepted it. Active
+    jobs record that worker's pid and are touched by its heartbeat; one
+    whose worker is gone (killed by the timeout, OOM, recycled) or whose
+    heartbeat stopped is reported as failed instead of running forever.
+    """
+
+    def __init__(self, db_path: str, max_age_hours: float = 24, stale_after: float = 60):
+        super().__init__(db_path)
+        self.logger = logging.getLogger(__name__)
+        self.max_age_seconds = max_age_hours * 3600
+        self.stale_after = stale_after
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    downloaded_bytes INTEGER NOT NULL DEFAULT 0,
+                    total_bytes INTEGER,
+                    filename TEXT,
+                    error TEXT,
+                    video_info TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner_pid INTEGER
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'owner_pid' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+
+    def create(self, url: str) -> str:
+        """Record a new queued job and prune expired ones; returns its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, url, status, created_at, updated_at, owner_pid) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, url, now, now, os.getpid())
+            )
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.max_age_seconds,))
+        return job_id
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """Set columns on a job"""
+        if 'video_info' in fields:
+            fields['video_info'] = json.dumps(fields['video_info'])
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        except sqlite3.Error as e:
+            self.logger.error(f"Error updating job {job_id}: {str(e)}")
+
+    def heartbeat(self, job_ids: Iterable[str]) -> None:
+        """Mark active jobs as still owned by a live worker"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        placeholders = ', '.join('?' * len(job_ids))
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    f"UPDATE jobs SET updated_at = ? WHERE id IN ({placeholders}) AND status IN ('queued', 'running')",
+                    (time.time(), *job_ids)
+                )
+        except sqlite3.Error as e:
+            self.logger.error(f"Error updating job heartbeats: {str(e)}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a job as a dict, or None if unknown or expired"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.row_factory = None
+        if row is None:
+            return None
+
+        job = dict(row)
+        if job['status'] in ('queued', 'running') and self._is_orphaned(job):
+            self.logger.warning(f"Job {job_id} lost its worker (pid {job['owner_pid']})")
+            job['status'] = 'failed'
+            job['error'] = ORPHANED
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ? WHERE id = ? AND status IN ('queued', 'running')",
+                    (ORPHANED, job_id)
+                )
+        job['video_info'] = json.loads(job['video_info']) if job['video_info'] else None
+        return job
+
+    def _is_orphaned(self, job: Dict[str, Any]) -> bool:
+        if time.time() - job['updated_at'] > self.stale_after:
+            return True
+        # A pid can be reused, so this only speeds up the heartbeat check
+        pid = job['owner_pid']
+        if pid is None or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+
+class JobQueue:
+    """
+    Bounded pool that runs downloads off the request path
+
+    At most ``workers`` downloads run at once in this process and at most
+    ``max_queued`` more wait for a slot; anything beyond that is rejected
+    with ``QueueFull`` instead of piling up behind gunicorn's timeout.
+    A job also waits (still ``queued``) for a global download slot when
+    ``limit`` is set, so jobs count against the same cap as every other
+    download.
+    """
+
+    # Don't write progress to SQLite more often than this
+    PROGRESS_INTERVAL = 0.5
+    # Seconds between heartbeats for this worker's active jobs; well under
+    # the store's stale_after
+    HEARTBEAT_INTERVAL = 10
+
+    def __init__(self, downloader, store: JobStore, workers: int = 4, max_queued: int = 32,
+                 limit: Optional[ConcurrencyLimit] = None):
+        self.logger = logging.getLogger(__name__)
+        self.downloader = downloader
+        self.store = store
+        self.limit = limit
+        self.workers = workers
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active: Set[str] = set()
+        self._heartbeat_pid = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download-job')
+
+    def submit(self, url: str, tier: Tier = BEST) -> str:
+        """
+        Queue a download
+
+        Args:
+            url (str): Validated TikTok video URL
+            tier (Tier): Quality tier to download
+
+        Returns:
+            str: Job id to poll
+
+        Raises:
+            QueueFull: If every worker is busy and the queue is at capacity
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.max_queued:
+                raise QueueFull(f"Download queue is full ({self._pending} jobs)")
+            self._pending += 1
+        metrics.DOWNLOADS_QUEUED.inc()
+        self._start_heartbeat()
+
+        job_id = None
+        try:
+            job_id = self.store.create(url)
+            with self._lock:
+                self._active.add(job_id)
+            self._executor.submit(self._run, job_id, url, tier)
+        except Exception:
+            metrics.DOWNLOADS_QUEUED.dec()
+            self._done(job_id)
+            raise
+        return job_id
+
+    def _done(self, job_id: Optional[str]) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._active.discard(job_id)
+
+    def _start_heartbeat(self) -> None:
+        # Started in the process that runs the jobs, never before a fork
+        with self._lock:
+            if self._heartbeat_pid == os.getpid():
+                return
+            self._heartbeat_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.HEARTBEAT_INTERVAL)
+                with self._lock:
+                    active = list(self._active)
+                self.store.heartbeat(active)
+
+        threading.Thread(target=run, name='job-heartbeat', daemon=True).start()
+
+    def _progress_hook(self, job_id: str):
+        last_update = [0.0]
+
+        def hook(d: Dict[str, Any]) -> None:
+            if d.get('status') != 'downloading':
+                return
+            now = time.monotonic()
+            if now - last_update[0] < self.PROGRESS_INTERVAL:
+                return
+            last_update[0] = now
+
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            self.store.update(
+                job_id,
+                downloaded_bytes=downloaded,
+                total_bytes=total,
+                progress=round(downloaded / total * 100, 1) if total else 0
+            )
+
+        return hook
+
+    def _run(self, job_id: str, url: str, tier: Tier) -> None:
+        slot = None
+        try:
+            try:
+                # The job stays queued until a global download slot is
+                # free; a cached video doesn't need one
+                result = self.downloader.cached_file(url, tier)
+                if result is None and self.limit is not None:
+                    slot = self.limit.acquire(timeout=None)
+            finally:
+                metrics.DOWNLOADS_QUEUED.dec()
+            self.store.update(job_id, status='running')
+            if result is None:
+                result = self.downloader.download_video(url, progress_hook=self._progress_hook(job_id), tier=tier)
+
+            if result['success']:
+                self.store.update(
+                    job_id,
+                    status='finished',
+                    progress=100,
+                    filename=result['filename'],
+                    downloaded_bytes=result.get('file_size') or 0,
+                    total_bytes=result.get('file_size'),
+                    video_info=result.get('video_info')
+                )
+            else:
+                self.store.update(job_id, status='failed', error=result['error'])
+        except Exception as e:
+            self.logger.error(f"Job {job_id} crashed: {str(e)}")
+            self.store.update(job_id, status='failed', error='An unexpected error occurred. Please try again')
+        finally:
+            if slot is not None:
+                slot.release()
+            self._done(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get this worker's queue occupancy
+
+        Returns:
+            dict: Pool size, queue depth and jobs currently admitted
+        """
+        with self._lock:
+            pending = self._pending
+        return {
+            'workers': self.workers,
+            'max_queued': self.max_queued,
+            'running': min(pending, self.workers),
+            'queued': max(pending - self.workers, 0),
+        }
@@ -0,0 +1,374 @@
+import io
+import os
+import time
+import fcntl
+import hashlib
+import shutil
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Optional
+from utils.db import SQLiteStore
+
+
+class MediaLease(io.FileIO):
+    """
+    Open handle on a cached file that keeps it from being evicted
+
+    The handle holds a shared flock() for as long as it is open, so it can
+    be handed straight to ``send_file``: the WSGI server closes it once
+    the response is done, which ends the lease. ``on_close`` is called at
+    that point too, for bookkeeping that has to wait for the transfer.
+    """
+
+    def __init__(self, cache: 'MediaCache', name: str):
+        super().__init__(cache.path(name), 'rb')
+        self.cache = cache
+        self.name = name
+        self.leased = False
+        self.on_close: Optional[Callable[[], None]] = None
+
+    def close(self) -> None:
+        try:
+            if self.leased:
+                self.leased = False
+                self.cache._release(self.name)
+                if self.on_close is not None:
+                    self.on_close()
+        finally:
+            super().close()
+
+
+class MediaCache(SQLiteStore):
+    """
+    Size-bounded LRU cache of finished downloads
+
+    Finished files live in one dedicated directory and are tracked in a
+    SQLite index shared by all workers. Files being served are leased: the
+    lease holds a shared flock() on the file (so other workers see it) and
+    bumps an in-memory reference count (so this worker sees it cheaply),
+    and the reaper never evicts a leased file.
+    """
+
+    INDEX_NAME = 'index.sqlite3'
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3,
+                 max_age_hours: float = 24, reap_interval: float = 60):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(os.path.join(directory, self.INDEX_NAME))
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_hours * 3600
+        self.reap_interval = reap_interval
+
+        # In-memory side of the index: leases held by this process and
+        # access times not yet flushed to SQLite
+        self._guard = threading.Lock()
+        self._refs: Dict[str, int] = {}
+        self._touched: Dict[str, float] = {}
+
+        self._wakeup = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    etag TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            if 'etag' not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN etag TEXT")
+
+    def path(self, filename: str) -> str:
+        """Absolute path of a cache entry"""
+        return os.path.join(self.directory, filename)
+
+    def add(self, file_path: str) -> None:
+        """
+        Record a file that was just published into the cache directory
+
+        Args:
+            file_path (str): Path inside the cache directory
+        """
+        name = os.path.basename(file_path)
+        try:
+            size = os.path.getsize(file_path)
+            etag = self._hash_file(file_path)
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (name, size, last_access, etag) VALUES (?, ?, ?, ?)",
+                    (name, size, time.time(), etag)
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                self._wakeup.set()
+        except (OSError, sqlite3.Error) as e:
+            self.logger.error(f"Error indexing cached file {name}: {str(e)}")
+
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:32]
+
+    def etag(self, filename: str) -> Optional[str]:
+        """
+        Get the content-based ETag of a cache entry
+
+        Entries indexed without one (e.g. picked up by ``reconcile``) are
+        hashed on first use.
+
+        Args:
+            filename (str): Name of the cache entry
+
+        Returns:
+            str: Hex digest of the file contents, or None if not cached
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT etag FROM entries WHERE name = ?", (filename,)).fetchone()
+            if row and row[0]:
+                return row[0]
+
+            etag = self._hash_file(self.path(filename))
+            with conn:
+                conn.execute("UPDATE entries SET etag = ? WHERE name = ?", (etag, filename))
+            return etag
+        except (OSError, sqlite3.Error) as e:
+            self.logger.error(f"Error computing ETag for {filename}: {str(e)}")
+            return None
+
+    def touch(self, filename: str) -> None:
+        """Mark an entry as recently used; flushed by the reaper"""
+        with self._guard:
+            self._touched[filename] = time.time()
+
+    def acquire(self, filename: str) -> Optional[MediaLease]:
+        """
+        Open a cached file and lease it so it can't be evicted while served
+
+        Args:
+            filename (str): Name of the cache entry
+
+        Returns:
+            MediaLease: Open binary file; close it to end the lease.
+            None if the file is not in the cache.
+        """
+        try:
+            lease = MediaLease(self, filename)
+        except FileNotFoundError:
+            return None
+
+        try:
+            fcntl.flock(lease.fileno(), fcntl.LOCK_SH)
+            # The reaper may have unlinked it between our open and lock
+            if os.stat(self.path(filename)).st_ino != os.fstat(lease.fileno()).st_ino:
+                lease.close()
+                return None
+        except OSError:
+            lease.close()
+            return None
+
+        with self._guard:
+            self._refs[filename] = self._refs.get(filename, 0) + 1
+            self._touched[filename] = time.time()
+        lease.leased = True
+        return lease
+
+    def _release(self, filename: str) -> None:
+        # The flock goes away with the file descriptor
+        with self._guard:
+            remaining = self._refs.get(filename, 1) - 1
+            if remaining > 0:
+                self._refs[filename] = remaining
+            else:
+                self._refs.pop(filename, None)
+
+    def _flush_touches(self, conn: sqlite3.Connection) -> None:
+        with self._guard:
+            touched, self._touched = self._touched, {}
+        if touched:
+            with conn:
+                conn.executemany(
+                    "UPDATE entries SET last_access = MAX(last_access, ?) WHERE name = ?",
+                    [(ts, name) for name, ts in touched.items()]
+                )
+
+    def _try_remove(self, name: str) -> bool:
+        with self._guard:
+            if self._refs.get(name):
+                return False
+
+        file_path = self.path(name)
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+
+        try:
+            # Any worker serving the file holds a shared lock on it
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(fd)
+        return True
+
+    def discard(self, filename: str) -> bool:
+        """
+        Remove one entry right away, unless someone is still reading it
+
+        Args:
+            filename (str): Media file name
+
+        Returns:
+            bool: True if the file is gone
+        """
+        if not self._try_remove(filename):
+            return False
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE name = ?", (filename,))
+        return True
+
+    def _remove_stale_partials(self, now: float) -> None:
+        # Leftovers of crashed downloads; only this directory is scanned
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(('.part', '.partial')):
+                continue
+            try:
+                if now - entry.stat().st_mtime < 3600:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                self.logger.info(f"Removed stale partial download: {entry.name}")
+            except OSError:
+                continue
+
+    def reap(self) -> int:
+        """
+        Evict expired and least-recently-used entries over the byte budget
+
+        Only one worker reaps at a time; the others just flush their
+        access times and return.
+
+        Returns:
+            int: Number of files evicted
+        """
+        conn = self._connect()
+        self._flush_touches(conn)
+
+        lock_fd = os.open(os.path.join(self.directory, 'reaper.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+
+            now = time.time()
+            evicted = 0
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            rows = conn.execute("SELECT name, size, last_access FROM entries ORDER BY last_access").fetchall()
+
+            for name, size, last_access in rows:
+                expired = self.max_age_seconds and now - last_access > self.max_age_seconds
+                if total <= self.max_bytes and not expired:
+                    continue
+                if not self._try_remove(name):
+                    continue
+                with conn:
+                    conn.execute("DELETE FROM entries WHERE name = ?", (name,))
+                total -= size
+                evicted += 1
+                self.logger.info(f"Evicted cached file: {name} ({size} bytes)")
+
+            self._remove_stale_partials(now)
+            return evicted
+        finally:
+            os.close(lock_fd)
+
+    def reconcile(self, in_use: Callable[[str], bool]) -> None:
+        """
+        Bring the index in line with the directory after a restart
+
+        Partial files whose writer is gone are removed right away rather
+        than after the hourly sweep, so no follower waits on them.
+
+        Args:
+            in_use (callable): Whether a file name is still being written,
+                e.g. ``SingleFlight.is_held``
+        """
+        conn = self._connect()
+        on_disk = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.part'):
+                if not in_use(entry.name[:-len('.part')]):
+                    try:
+                        os.remove(entry.path)
+                        self.logger.info(f"Removed abandoned partial download: {entry.name}")
+                    except FileNotFoundError:
+                        pass
+            elif entry.is_file() and entry.name.startswith('tiktok_'):
+                stat = entry.stat()
+                on_disk[entry.name] = (stat.st_size, stat.st_mtime)
+
+        with conn:
+            indexed = {row[0] for row in conn.execute("SELECT name FROM entries")}
+            conn.executemany(
+                "DELETE FROM entries WHERE name = ?",
+                [(name,) for name in indexed - on_disk.keys()]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (name, size, last_access) VALUES (?, ?, ?)",
+                [(name, size, mtime) for name, (size, mtime) in on_disk.items() if name not in indexed]
+            )
+
+    def start_reaper(self) -> None:
+        """Start this process's background reaper thread (idempotent)"""
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+
+        def run():
+            while True:
+                self._wakeup.wait(self.reap_interval)
+                self._wakeup.clear()
+                try:
+                    self.reap()
+                except Exception as e:
+                    self.logger.error(f"Error in cache reaper: {str(e)}")
+
+        self._reaper = threading.Thread(target=run, name='media-cache-reaper', daemon=True)
+        self._reaper.start()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get cache occupancy
+
+        Returns:
+            dict: Entry count, bytes used, byte budget and local leases
+        """
+        result = {'entries': 0, 'bytes': 0, 'max_bytes': self.max_bytes}
+        try:
+            row = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            result['entries'], result['bytes'] = row
+        except sqlite3.Error as e:
+            self.logger.error(f"Error reading media cache stats: {str(e)}")
+        with self._guard:
+            result['leases'] = sum(self._refs.values())
+        return result
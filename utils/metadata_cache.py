@@ -0,0 +1,309 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Iterable, Optional, Tuple
+from utils import metrics
+from utils.db import SQLiteStore
+from utils.formats import summarize_formats
+
+# Fields kept from yt-dlp's info dict; the rest (formats, fragments,
+# signed media URLs) is large and goes stale within minutes
+INFO_FIELDS = {
+    'id': '',
+    'title': 'TikTok Video',
+    'duration': 0,
+    'uploader': 'Unknown',
+    'upload_date': '',
+    'view_count': 0,
+    'like_count': 0,
+    'description': '',
+    'thumbnail': '',
+    'ext': 'mp4',
+    'filesize': 0,
+    'webpage_url': '',
+}
+
+
+def trim_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce a yt-dlp info dict to the fields we serve and cache
+
+    Args:
+        info (dict): Info dict returned by ``extract_info``
+
+    Returns:
+        dict: Trimmed info with defaults filled in
+    """
+    trimmed = {key: info.get(key) or default for key, default in INFO_FIELDS.items()}
+    trimmed['formats'] = summarize_formats(info)
+    return trimmed
+
+
+class MetadataCache(SQLiteStore):
+    """
+    SQLite-backed cache of extract_info results shared by all workers
+
+    Besides successful extractions it remembers failures that will keep
+    failing for a while (deleted, private, geo-blocked videos), each with
+    its own expiry, so repeat requests don't re-run yt-dlp just to get the
+    same error.
+
+    A hit is a read only: its access time and the hit/miss counters are
+    kept in memory and written in one transaction every
+    ``FLUSH_INTERVAL`` seconds, so lookups never queue behind the
+    database's single writer.
+    """
+
+    # Seconds between writes of buffered access times and counters
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, path: str, ttl_seconds: int = 6 * 3600, max_entries: int = 10000):
+        super().__init__(path)
+        self.logger = logging.getLogger(__name__)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # Access times and counters not yet flushed to SQLite
+        self._guard = threading.Lock()
+        self._accessed: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._flushed_at = time.monotonic()
+
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    info TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS videos_accessed_at ON videos (accessed_at);
+                CREATE TABLE IF NOT EXISTS video_keys (
+                    key TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS video_keys_video_id ON video_keys (video_id);
+                CREATE TABLE IF NOT EXISTS failures (
+                    key TEXT PRIMARY KEY,
+                    category TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def _record(self, name: str, video_id: Optional[str] = None, accessed_at: float = 0) -> None:
+        with self._guard:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            if video_id is not None:
+                self._accessed[video_id] = accessed_at
+
+    def _flush_pending(self, conn: sqlite3.Connection, force: bool = False) -> None:
+        """Write buffered access times and counters; the caller commits"""
+        with self._guard:
+            if not force and time.monotonic() - self._flushed_at < self.FLUSH_INTERVAL:
+                return
+            accessed, self._accessed = self._accessed, {}
+            counts, self._counts = self._counts, {}
+            self._flushed_at = time.monotonic()
+        conn.executemany(
+            "UPDATE videos SET accessed_at = MAX(accessed_at, ?) WHERE video_id = ?",
+            [(ts, video_id) for video_id, ts in accessed.items()]
+        )
+        for name, amount in counts.items():
+            self._bump(conn, name, amount)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up cached video info by any key it was stored under
+
+        Args:
+            key (str): Canonical key of an original, short or resolved URL
+
+        Returns:
+            dict: Trimmed video info, or None on a miss or expired entry
+        """
+        try:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT v.video_id, v.info, v.created_at FROM video_keys a "
+                "JOIN videos v ON v.video_id = a.video_id WHERE a.key = ?",
+                (key,)
+            ).fetchone()
+
+            if row is None or now - row[2] > self.ttl_seconds:
+                with conn:
+                    if row is not None:
+                        conn.execute("DELETE FROM videos WHERE video_id = ?", (row[0],))
+                        conn.execute("DELETE FROM video_keys WHERE video_id = ?", (row[0],))
+                    self._record('misses')
+                    self._flush_pending(conn, force=row is not None)
+                metrics.CACHE_REQUESTS.labels('metadata', 'miss').inc()
+                return None
+
+            self._record('hits', row[0], now)
+            with conn:
+                self._flush_pending(conn)
+            metrics.CACHE_REQUESTS.labels('metadata', 'hit').inc()
+            return json.loads(row[1])
+        except sqlite3.Error as e:
+            self.logger.error(f"Metadata cache lookup failed: {str(e)}")
+            return None
+
+    def put(self, keys: Iterable[str], info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store video info under every key it should be reachable by
+
+        Args:
+            keys (iterable): Canonical keys of the request URL, the URLs
+                yt-dlp resolved it to and the video id
+            info (dict): Info dict returned by ``extract_info``
+
+        Returns:
+            dict: The trimmed info that was stored
+        """
+        trimmed = trim_info(info)
+        video_id = trimmed['id']
+        if not video_id:
+            return trimmed
+
+        keys = list(keys)
+        try:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO videos (video_id, info, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (video_id, json.dumps(trimmed), now, now)
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO video_keys (key, video_id) VALUES (?, ?)",
+                    [(key, video_id) for key in keys]
+                )
+                # It extracted fine, so any remembered failure is stale
+                conn.executemany("DELETE FROM failures WHERE key = ?", [(key,) for key in keys])
+                # Eviction goes by access time, so write the buffered ones first
+                self._flush_pending(conn, force=True)
+                self._evict(conn)
+        except sqlite3.Error as e:
+            self.logger.error(f"Metadata cache store failed: {str(e)}")
+        return trimmed
+
+    def get_failure(self, key: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up a remembered extraction failure
+
+        Args:
+            key (str): Canonical key of the request URL or video id
+
+        Returns:
+            tuple: Error category and user-facing message, or None
+        """
+        try:
+            row = self._connect().execute(
+                "SELECT category, message FROM failures WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.logger.error(f"Negative cache lookup failed: {str(e)}")
+            return None
+        metrics.CACHE_REQUESTS.labels('negative', 'hit' if row else 'miss').inc()
+        return tuple(row) if row else None
+
+    def put_failure(self, keys: Iterable[str], category: str, message: str, ttl_seconds: float) -> None:
+        """
+        Remember that extracting a video failed
+
+        Args:
+            keys (iterable): Canonical keys the failure applies to
+            category (str): Error category, as from ``_classify_error``
+            message (str): User-facing message to answer with
+            ttl_seconds (float): How long to keep answering with it
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO failures (key, category, message, expires_at) VALUES (?, ?, ?, ?)",
+                    [(key, category, message, now + ttl_seconds) for key in keys]
+                )
+                conn.execute("DELETE FROM failures WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            self.logger.error(f"Negative cache store failed: {str(e)}")
+
+    def invalidate(self, key: str) -> int:
+        """
+        Forget everything cached for a key: a remembered failure and the
+        video's info under all of its keys
+
+        Args:
+            key (str): Canonical key of a URL or video id
+
+        Returns:
+            int: Number of entries removed
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                removed = conn.execute("DELETE FROM failures WHERE key = ?", (key,)).rowcount
+                row = conn.execute("SELECT video_id FROM video_keys WHERE key = ?", (key,)).fetchone()
+                if row:
+                    removed += conn.execute("DELETE FROM videos WHERE video_id = ?", (row[0],)).rowcount
+                    conn.execute("DELETE FROM video_keys WHERE video_id = ?", (row[0],))
+            return removed
+        except sqlite3.Error as e:
+            self.logger.error(f"Cache invalidation failed for {key}: {str(e)}")
+            return 0
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+
+        victims = [row[0] for row in conn.execute(
+            "SELECT video_id FROM videos ORDER BY accessed_at LIMIT ?", (excess,)
+        )]
+        conn.executemany("DELETE FROM videos WHERE video_id = ?", [(v,) for v in victims])
+        conn.executemany("DELETE FROM video_keys WHERE video_id = ?", [(v,) for v in victims])
+        self._bump(conn, 'evictions', len(victims))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get cache counters shared by all workers
+
+        Other workers' counts lag by up to ``FLUSH_INTERVAL`` seconds.
+
+        Returns:
+            dict: hits, misses, evictions, current entry count and
+            remembered failures
+        """
+        result = {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'failures': 0}
+        try:
+            conn = self._connect()
+            with conn:
+                self._flush_pending(conn, force=True)
+            result.update(dict(conn.execute("SELECT name, value FROM stats")))
+            result['entries'] = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            result['failures'] = conn.execute(
+                "SELECT COUNT(*) FROM failures WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.error(f"Error reading metadata cache stats: {str(e)}")
+        return result
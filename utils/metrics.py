@@ -0,0 +1,126 @@
+"""
+Prometheus metrics for the download pipeline
+
+gunicorn runs several worker processes, so metrics use prometheus_client's
+multiprocess mode: every process writes its samples to files in
+PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them at scrape time. The
+directory has to be known before prometheus_client is imported, which is
+why it is set up at the top of this module.
+"""
+
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'tiktok-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Stage latencies, in seconds
+URL_VALIDATION_SECONDS = Histogram(
+    'tiktok_url_validation_seconds', 'Time spent validating and canonicalizing URLs',
+    buckets=(1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3)
+)
+EXTRACT_INFO_SECONDS = Histogram(
+    'tiktok_extract_info_seconds', 'Time spent in yt-dlp extract_info',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+MEDIA_DOWNLOAD_SECONDS = Histogram(
+    'tiktok_media_download_seconds', 'Time spent fetching media from upstream',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+FILE_SERVE_SECONDS = Histogram(
+    'tiktok_file_serve_seconds', 'Time from opening a cached file to the end of its response',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+)
+
+BYTES_SERVED = Counter('tiktok_bytes_served_total', 'Media bytes sent to clients')
+CACHE_REQUESTS = Counter(
+    'tiktok_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result']
+)
+DOWNLOAD_ERRORS = Counter(
+    'tiktok_download_errors_total', 'Failed downloads by error category', ['category']
+)
+ADMISSION_REJECTIONS = Counter(
+    'tiktok_admission_rejections_total', 'Requests turned away with a 429, by reason', ['reason']
+)
+UPSTREAM_EVENTS = Counter(
+    'tiktok_upstream_events_total', 'Retries, hedges, timeouts and circuit breaker rejections of upstream calls',
+    ['event']
+)
+ENGINE_EVENTS = Counter(
+    'tiktok_engine_events_total', 'Extraction engine worker lifecycle events', ['event']
+)
+
+# Summed over live workers only, so a dead worker's gauge doesn't linger
+DOWNLOADS_IN_FLIGHT = Gauge(
+    'tiktok_downloads_in_flight', 'Upstream media downloads in progress', multiprocess_mode='livesum'
+)
+DOWNLOADS_QUEUED = Gauge(
+    'tiktok_downloads_queued', 'Download jobs waiting for a worker thread', multiprocess_mode='livesum'
+)
+# 1 while any live worker's circuit breaker is open
+CIRCUIT_OPEN = Gauge(
+    'tiktok_circuit_open', 'Whether the upstream circuit breaker is open', multiprocess_mode='livemax'
+)
+WORKERS_BUSY = Gauge(
+    'tiktok_workers_busy', 'gunicorn workers currently handling a request', multiprocess_mode='livesum'
+)
+
+
+class DiskUsageCollector:
+    """Reports cache directory usage at scrape time"""
+
+    def __init__(self, media_cache):
+        self.media_cache = media_cache
+
+    def collect(self):
+        stats = self.media_cache.stats()
+        usage = shutil.disk_usage(self.media_cache.directory)
+
+        cached = GaugeMetricFamily('tiktok_media_cache_bytes', 'Bytes held in the media cache')
+        cached.add_metric([], stats['bytes'])
+        yield cached
+
+        budget = GaugeMetricFamily('tiktok_media_cache_max_bytes', 'Media cache byte budget')
+        budget.add_metric([], stats['max_bytes'])
+        yield budget
+
+        entries = GaugeMetricFamily('tiktok_media_cache_entries', 'Files in the media cache')
+        entries.add_metric([], stats['entries'])
+        yield entries
+
+        free = GaugeMetricFamily('tiktok_cache_disk_free_bytes', 'Free space on the cache filesystem')
+        free.add_metric([], usage.free)
+        yield free
+
+
+def render(media_cache):
+    """
+    Aggregate every worker's samples into the Prometheus text format
+
+    Args:
+        media_cache (MediaCache): Cache whose disk usage is reported
+
+    Returns:
+        tuple: Response body and its content type
+    """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(DiskUsageCollector(media_cache))
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def reset_multiproc_dir():
+    """Clear samples left by a previous run; call in the master before fork"""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges; call from gunicorn's child_exit"""
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,340 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+from utils import metrics
+
+# Upstream errors worth another attempt: throttling, server errors and
+# network trouble. Anything else (private, removed, 404) will fail the
+# same way again.
+TRANSIENT_ERRORS = re.compile(
+    r'HTTP Error (?:429|5\d\d)|timed? ?out|Connection (?:reset|refused|aborted)|'
+    r'Remote end closed|IncompleteRead|Temporary failure',
+    re.IGNORECASE
+)
+
+
+class UpstreamError(Exception):
+    """Raised when the upstream is too slow or known to be failing"""
+
+
+class DeadlineExceeded(UpstreamError):
+    """Raised when a stage runs out of time, across all its attempts"""
+
+
+class CircuitOpen(UpstreamError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an upstream failure might succeed if tried again"""
+    if isinstance(error, (DeadlineExceeded, TimeoutError, ConnectionError)):
+        return True
+    return bool(TRANSIENT_ERRORS.search(str(error)))
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """
+    Delay before retry number ``attempt`` (0-based), with full jitter
+
+    A random delay up to the exponential bound keeps workers that failed
+    together from retrying together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Deadline:
+    """
+    Time budget for a stage that can only be stopped from the inside
+
+    A media download can't be interrupted by another thread, so it calls
+    ``check`` as bytes arrive and gives up once the budget is spent.
+    ``check`` takes yt-dlp progress dicts, so it also works as a progress
+    hook: yt-dlp aborts a download when a hook raises.
+    """
+
+    def __init__(self, seconds: float, stage: str = 'Download'):
+        self.seconds = seconds
+        self.stage = stage
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires - time.monotonic(), 0)
+
+    def check(self, progress: Optional[dict] = None) -> None:
+        """
+        Raises:
+            DeadlineExceeded: If the budget is spent
+        """
+        if time.monotonic() >= self.expires:
+            metrics.UPSTREAM_EVENTS.labels('timeout').inc()
+            raise DeadlineExceeded(f"{self.stage} did not finish within {self.seconds:g}s")
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the upstream is degraded
+
+    After ``failure_threshold`` consecutive transient failures the circuit
+    opens and calls are rejected for ``reset_timeout`` seconds. Then one
+    trial call is let through (half-open): success closes the circuit,
+    failure opens it again. Each worker process keeps its own breaker;
+    they all see the same upstream, so they trip at about the same time.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.logger = logging.getLogger(__name__)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        """
+        Ask to make a call
+
+        Raises:
+            CircuitOpen: If the circuit is open, or half-open with its
+                trial call already running
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_timeout and not self._trial_running:
+                self._state = self.HALF_OPEN
+                self._trial_running = True
+                return
+            retry_after = max(self.reset_timeout - waited, 1)
+        metrics.UPSTREAM_EVENTS.labels('rejected').inc()
+        raise CircuitOpen("Upstream circuit breaker is open", retry_after)
+
+    def record_success(self) -> None:
+        """Report a call that reached the upstream and got an answer"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                self.logger.info("Upstream recovered, closing circuit breaker")
+                metrics.CIRCUIT_OPEN.set(0)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Report a transient upstream failure"""
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.logger.warning(f"Opening circuit breaker after {self._failures} upstream failures")
+                    metrics.CIRCUIT_OPEN.set(1)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """
+        Get breaker state
+
+        Returns:
+            dict: State and consecutive failure count
+        """
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures}
+
+
+class LatencyTracker:
+    """Recent call latencies, for choosing when to hedge"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Latency at ``percent`` (0-100), or None until there are enough samples"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+class ResilientCaller:
+    """
+    Run upstream calls with a deadline, jittered retries, a circuit
+    breaker and optional hedging
+
+    Every attempt runs on a small thread pool so the caller can stop
+    waiting at the deadline even though yt-dlp itself can't be
+    interrupted. An abandoned attempt finishes in the background (bounded
+    by yt-dlp's socket timeout) and its result is handed to ``discard``.
+
+    With ``hedge_percentile`` set, an attempt still running after that
+    percentile of recent latencies gets a second, parallel attempt; the
+    first to succeed wins. This trims tail latency at the cost of a few
+    percent more upstream calls.
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, deadline: float = 30, retries: int = 2,
+                 base_delay: float = 0.5, max_delay: float = 4, hedge_percentile: Optional[float] = None,
+                 max_workers: int = 16):
+        self.logger = logging.getLogger(__name__)
+        self.breaker = breaker
+        self.deadline = deadline
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker()
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Threads don't survive fork; give each worker process its own pool
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upstream')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def call(self, fn: Callable[[], Any], discard: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        Call ``fn`` under this caller's policies
+
+        Args:
+            fn (callable): Upstream call; must be safe to run more than once
+                and concurrently with itself
+            discard (callable): Releases the result of an attempt that lost
+                a hedge or finished after the deadline
+
+        Returns:
+            The first successful result
+
+        Raises:
+            CircuitOpen: If the breaker is open
+            DeadlineExceeded: If no attempt succeeded in time
+            Exception: The last error, if it was not transient or retries ran out
+        """
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.retries + 1):
+            if self.breaker:
+                self.breaker.before_call()
+            try:
+                result = self._attempt(fn, deadline, discard)
+            except Exception as e:
+                if not is_transient(e):
+                    # The upstream answered; it just said no
+                    if self.breaker:
+                        self.breaker.record_success()
+                    raise
+                if self.breaker:
+                    self.breaker.record_failure()
+                delay = backoff(attempt, self.base_delay, self.max_delay)
+                if attempt == self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                metrics.UPSTREAM_EVENTS.labels('retry').inc()
+                self.logger.warning(f"Upstream call failed, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+            else:
+                if self.breaker:
+                    self.breaker.record_success()
+                return result
+
+    def _attempt(self, fn: Callable[[], Any], deadline: float, discard: Optional[Callable[[Any], None]]) -> Any:
+        def timed():
+            started = time.monotonic()
+            result = fn()
+            self.latency.observe(time.monotonic() - started)
+            return result
+
+        pool = self._pool()
+        pending = [pool.submit(timed)]
+        hedge_after = self.latency.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        started = time.monotonic()
+        error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._abandon(pending, discard)
+                metrics.UPSTREAM_EVENTS.labels('timeout').inc()
+                raise DeadlineExceeded(f"Upstream call did not finish within {self.deadline:g}s")
+
+            timeout = remaining
+            if hedge_after is not None:
+                timeout = min(timeout, max(started + hedge_after - time.monotonic(), 0))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if hedge_after is not None and time.monotonic() - started >= hedge_after:
+                    # Slow attempt: race a second one against it
+                    metrics.UPSTREAM_EVENTS.labels('hedge').inc()
+                    pending.append(pool.submit(timed))
+                    hedge_after = None
+                continue
+
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    self._abandon(pending, discard)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _abandon(self, futures: list, discard: Optional[Callable[[Any], None]]) -> None:
+        """Let attempts nobody waits for anymore finish and clean up after themselves"""
+        def release(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None and discard:
+                try:
+                    discard(future.result())
+                except Exception as e:
+                    self.logger.error(f"Failed to release abandoned upstream result: {str(e)}")
+
+        for future in futures:
+            future.cancel()
+            future.add_done_callback(release)
+
+    def stats(self) -> dict:
+        """
+        Get resilience settings and state for this worker
+
+        Returns:
+            dict: Breaker state, deadline, retries and hedge threshold
+        """
+        hedge_after = self.latency.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        return {
+            'circuit': self.breaker.stats() if self.breaker else None,
+            'deadline': self.deadline,
+            'retries': self.retries,
+            'hedge_after': round(hedge_after, 3) if hedge_after is not None else None,
+        }
@@ -0,0 +1,47 @@
+import hmac
+import time
+import base64
+import hashlib
+from typing import Optional, Tuple
+
+
+def _signature(secret: str, filename: str, expires: int) -> str:
+    digest = hmac.new(secret.encode(), f"{filename}:{expires}".encode(), hashlib.sha256).digest()
+    # 128 bits is plenty for a link that lives minutes
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b'=').decode()
+
+
+def sign(secret: str, filename: str, ttl_seconds: float, now: Optional[float] = None) -> Tuple[int, str]:
+    """
+    Sign a media file name for a short-lived download link
+
+    Args:
+        secret (str): Server secret (the Flask secret key)
+        filename (str): Media cache file name
+        ttl_seconds (float): How long the link stays valid
+
+    Returns:
+        tuple: Expiry as a unix timestamp and the signature
+    """
+    expires = int((now or time.time()) + ttl_seconds)
+    return expires, _signature(secret, filename, expires)
+
+
+def verify(secret: str, filename: str, expires: str, signature: str, now: Optional[float] = None) -> Optional[str]:
+    """
+    Check a signed download link
+
+    Args:
+        secret (str): Server secret the link was signed with
+        filename (str): Media cache file name from the URL
+        expires (str): ``expires`` query parameter
+        signature (str): ``sig`` query parameter
+
+    Returns:
+        str: None if the link is valid, otherwise ``'invalid'`` or ``'expired'``
+    """
+    if not expires.isdigit() or not hmac.compare_digest(_signature(secret, filename, int(expires)), signature):
+        return 'invalid'
+    if int(expires) < (now or time.time()):
+        return 'expired'
+    return None
@@ -0,0 +1,132 @@
+import os
+import re
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class SingleFlight:
+    """Coalesce concurrent work on the same key across threads and processes
+
+    Threads in one process queue up on an in-memory lock; gunicorn workers
+    queue up on an flock() held on a per-key file in ``lock_dir``. Whoever
+    gets the lock first does the work, everyone else re-checks for the
+    finished result once the lock is released.
+    """
+
+    def __init__(self, lock_dir: str):
+        self.logger = logging.getLogger(__name__)
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+
+        self._guard = threading.Lock()
+        self._locks: Dict[str, list] = {}  # key -> [threading.Lock, users]
+
+    def _lock_path(self, key: str) -> str:
+        safe_key = re.sub(r'[^\w.-]', '_', key)
+        return os.path.join(self.lock_dir, f"{safe_key}.lock")
+
+    @contextmanager
+    def lock(self, key: str, blocking: bool = True) -> Iterator[None]:
+        """
+        Hold the exclusive lock for a key
+
+        Args:
+            key (str): Coalescing key, e.g. the canonical video id
+            blocking (bool): Wait for the lock instead of failing
+
+        Raises:
+            BlockingIOError: If ``blocking`` is off and the lock is held
+        """
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            if not entry[0].acquire(blocking):
+                raise BlockingIOError(f"Lock is held: {key}")
+            try:
+                path = self._lock_path(key)
+                fd = self._lock_file(path, blocking)
+                try:
+                    yield
+                finally:
+                    # Remove the file while still holding it, so lock files
+                    # don't pile up; anyone queued on it retries on a new one
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+            finally:
+                entry[0].release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(key, None)
+
+    @staticmethod
+    def _lock_file(path: str, blocking: bool = True) -> int:
+        # Opening and locking isn't atomic: the holder may have unlinked the
+        # file in between, and a lock on an unlinked file excludes nobody
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def run(self, key: str,
+            check: Callable[[], Optional[Any]],
+            work: Callable[[], Any]) -> Any:
+        """
+        Run ``work`` once per key; concurrent callers share its result
+
+        Args:
+            key (str): Coalescing key
+            check (callable): Returns the finished result, or None if missing
+            work (callable): Produces the result; only called by the leader
+
+        Returns:
+            The result of ``check`` or ``work``
+        """
+        result = check()
+        if result is not None:
+            return result
+
+        with self.lock(key):
+            # Another caller may have finished while we were waiting
+            result = check()
+            if result is not None:
+                self.logger.info(f"Joined in-flight download for key: {key}")
+                return result
+            return work()
+
+    def is_held(self, key: str) -> bool:
+        """
+        Whether some thread or process is working on a key right now
+
+        flock() locks go away with their process, so a lock held by a
+        worker that was killed mid-download doesn't count.
+        """
+        try:
+            fd = os.open(self._lock_path(key), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
@@ -0,0 +1,135 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class LocalStorage:
+    """
+    Finished media kept in a directory, behind the node's media cache
+
+    The media cache is small and evicts; storage is where finished files
+    are kept for longer and looked up before going back upstream. Files
+    are fanned out into subdirectories by a hash of their name so no
+    directory grows huge. Retention is left to the operator (a cron job
+    or the filesystem's lifecycle rules).
+    """
+
+    backend = 'local'
+
+    def __init__(self, directory: str):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, filename: str) -> str:
+        """Where a file lives in storage"""
+        bucket = hashlib.sha1(filename.encode()).hexdigest()[:2]
+        return os.path.join(self.directory, bucket, filename)
+
+    def exists(self, filename: str) -> bool:
+        return os.path.exists(self.path(filename))
+
+    def get(self, filename: str, dest_path: str) -> bool:
+        """
+        Copy a stored file out
+
+        Args:
+            filename (str): Media file name
+            dest_path (str): Where to write it; the caller publishes it
+
+        Returns:
+            bool: False if storage doesn't have the file
+        """
+        try:
+            with open(self.path(filename), 'rb') as src, open(dest_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, file_path: str) -> None:
+        """
+        Store a finished file under its base name
+
+        A file that is already stored is left alone; names are per video
+        and tier, so the content is the same.
+
+        Args:
+            file_path (str): Finished file, e.g. in the media cache
+        """
+        target = self.path(os.path.basename(file_path))
+        if os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write-then-rename so a reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as dst, open(file_path, 'rb') as src:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+                self._sync(dst)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _sync(self, f) -> None:
+        pass
+
+    def remove(self, filename: str) -> bool:
+        try:
+            os.remove(self.path(filename))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self) -> Dict[str, str]:
+        return {'backend': self.backend, 'directory': self.directory}
+
+
+class SharedStorage(LocalStorage):
+    """
+    Storage on a filesystem every node mounts (NFS, EFS, ...)
+
+    Whichever node fetches a video from upstream first stores it here and
+    the others copy it from here instead of fetching it again. The data
+    is flushed before the rename, so another node that sees the name also
+    sees the bytes. In tests a local directory stands in for the mount.
+    """
+
+    backend = 'shared'
+
+    def _sync(self, f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+
+
+STORAGE_BACKENDS = {backend.backend: backend for backend in (LocalStorage, SharedStorage)}
+
+
+def open_storage(backend: Optional[str], directory: Optional[str]) -> Optional[LocalStorage]:
+    """
+    Storage backend from configuration
+
+    Args:
+        backend (str): ``local``, ``shared``, or empty/``none`` for none
+        directory (str): Storage directory (or mount point)
+
+    Returns:
+        LocalStorage: The backend, or None when storage is off
+
+    Raises:
+        ValueError: On an unknown backend or a missing directory
+    """
+    backend = (backend or 'none').strip().lower()
+    if backend == 'none':
+        return None
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown media storage backend: {backend}")
+    if not directory:
+        raise ValueError(f"Media storage backend {backend} needs a directory")
+    return STORAGE_BACKENDS[backend](directory)
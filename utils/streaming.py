@@ -0,0 +1,124 @@
+import os
+import time
+from typing import BinaryIO, Callable, Iterator, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+def tee_to_file(response: BinaryIO, partial_path: str, final_path: str,
+                chunk_size: int = CHUNK_SIZE, check: Optional[Callable[[], None]] = None) -> int:
+    """
+    Copy an upstream response into the cache while followers read along
+
+    Bytes are appended to ``partial_path`` and flushed chunk by chunk, and
+    the file is renamed to ``final_path`` once the response is exhausted.
+    On failure the partial file is removed so followers stop waiting.
+
+    Args:
+        response: Readable upstream response (anything with ``read(n)``)
+        partial_path (str): In-progress path followers can open
+        final_path (str): Path the finished file is published under
+        chunk_size (int): Read size per iteration
+        check (callable): Called before every read; whatever it raises
+            aborts the copy (e.g. ``Deadline.check``)
+
+    Returns:
+        int: Number of bytes written
+    """
+    written = 0
+    try:
+        # Never truncate a partial file a stale follower may still hold open
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        with open(partial_path, 'wb') as f:
+            while True:
+                if check is not None:
+                    check()
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                f.flush()
+                written += len(chunk)
+        os.replace(partial_path, final_path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def _open_first(partial_path: str, final_path: str, wait_timeout: float,
+                poll_interval: float) -> Optional[BinaryIO]:
+    # The writer may not have created the partial file yet
+    deadline = time.monotonic() + wait_timeout
+    while True:
+        for path in (partial_path, final_path):
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                continue
+        if time.monotonic() > deadline:
+            return None
+        time.sleep(poll_interval)
+
+
+def _is_published(final_path: str, inode: int) -> bool:
+    try:
+        return os.stat(final_path).st_ino == inode
+    except FileNotFoundError:
+        return False
+
+
+def follow_file(partial_path: str, final_path: str,
+                chunk_size: int = CHUNK_SIZE,
+                poll_interval: float = 0.05,
+                wait_timeout: float = 30.0,
+                stall_timeout: float = 60.0) -> Iterator[bytes]:
+    """
+    Yield a file's bytes while another process is still writing it
+
+    Reads whatever has been written so far, then keeps polling for more
+    until the writer publishes the file under ``final_path`` (detected by
+    inode, since the open handle survives the rename).
+
+    Args:
+        partial_path (str): In-progress path written by ``tee_to_file``
+        final_path (str): Path the finished file is published under
+        chunk_size (int): Maximum bytes per yielded chunk
+        poll_interval (float): Seconds to sleep when no new data is there
+        wait_timeout (float): Seconds to wait for the file to appear
+        stall_timeout (float): Seconds without progress before giving up
+
+    Yields:
+        bytes: File contents in order
+    """
+    f = _open_first(partial_path, final_path, wait_timeout, poll_interval)
+    if f is None:
+        raise TimeoutError(f"Download never started: {os.path.basename(final_path)}")
+
+    with f:
+        inode = os.fstat(f.fileno()).st_ino
+        last_progress = time.monotonic()
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                last_progress = time.monotonic()
+                yield chunk
+                continue
+
+            if _is_published(final_path, inode):
+                # Drain anything written between the last read and the rename
+                yield from iter(lambda: f.read(chunk_size), b'')
+                return
+
+            # The rename may have happened right after the check above
+            if not os.path.exists(partial_path) and not _is_published(final_path, inode):
+                raise IOError(f"Upstream download failed: {os.path.basename(final_path)}")
+
+            if time.monotonic() - last_progress > stall_timeout:
+                raise TimeoutError(f"Download stalled: {os.path.basename(final_path)}")
+
+            time.sleep(poll_interval)
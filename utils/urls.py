@@ -0,0 +1,63 @@
+import re
+from typing import NamedTuple, Optional
+
+# One pass over every URL shape we accept. The alternatives mirror the
+# patterns is_valid_tiktok_url used to try one by one, but named groups
+# keep what matched (video id or short-link token) instead of discarding it.
+_TIKTOK_URL = re.compile(r"""
+    ^https?://
+    (?:
+        (?:www\.)?tiktok\.com/@[\w.-]+/video/(?P<video_id>\d+)
+      | m\.tiktok\.com/v/(?P<mobile_id>\d+)
+      | (?P<short_host>vm|vt)\.tiktok\.com/(?P<short_token>[\w\-]+)
+      | (?:www\.)?tiktok\.com/t/(?P<t_token>[\w\-]+)
+      | (?:www\.)?tiktok\.com(?P<page>/[\w\-@./]+)
+    )
+""", re.VERBOSE)
+
+
+class CanonicalUrl(NamedTuple):
+    """Normalized form of a TikTok URL"""
+
+    kind: str  # 'video', 'short' or 'page'
+    key: str  # Cache key; identical for every spelling of the same target
+    video_id: Optional[str]  # Known without network access for 'video' URLs
+
+
+def video_key(video_id: str) -> str:
+    """Cache key for a resolved video id"""
+    return f"video:{video_id}"
+
+
+def canonicalize(url: str) -> Optional[CanonicalUrl]:
+    """
+    Normalize a TikTok URL without any network access
+
+    Query strings, fragments, ``www.`` and the ``@user`` segment don't
+    change the key, so share links with tracking parameters map to the same
+    cache entry as the plain URL.
+
+    Args:
+        url (str): URL as pasted by the user
+
+    Returns:
+        CanonicalUrl: Normalized key, or None if this is not a TikTok video URL
+    """
+    if not url or not isinstance(url, str):
+        return None
+
+    match = _TIKTOK_URL.match(url.strip())
+    if match is None:
+        return None
+
+    video_id = match.group('video_id') or match.group('mobile_id')
+    if video_id:
+        return CanonicalUrl('video', video_key(video_id), video_id)
+
+    if match.group('short_token'):
+        return CanonicalUrl('short', f"short:{match.group('short_host')}/{match.group('short_token')}", None)
+
+    if match.group('t_token'):
+        return CanonicalUrl('short', f"short:t/{match.group('t_token')}", None)
+
+    return CanonicalUrl('page', f"page:{match.group('page').rstrip('/')}", None)